@@ -0,0 +1,212 @@
+import json
+import os
+import numpy as np
+from ingesta import LectorIncremental, SENSORES
+
+# Niveles de agregación de más fino a más grueso, con la unidad de
+# datetime64 que define sus buckets (el bucket es un entero: horas, días o
+# meses desde 1970)
+NIVELES = {'horario': 'h', 'diario': 'D', 'mensual': 'M'}
+ESTADISTICAS = ('conteo', 'media', 'm2', 'minimo', 'maximo')
+
+
+def _reducir(claves, conteo, media, m2, minimo, maximo):
+    """
+    Combina las filas con la misma clave (claves ordenadas) en una sola,
+    sin bucles: conteos y sumas con reduceat y la dispersión con la
+    fórmula de combinación de varianzas, M2 = Σ M2_i + Σ n_i·(media_i - media)²
+    """
+    buckets, inicios = np.unique(claves, return_index=True)
+    presentes = conteo > 0
+    n = np.add.reduceat(conteo, inicios, axis=0)
+    suma = np.add.reduceat(np.where(presentes, conteo * media, 0.0), inicios, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media_total = suma / n
+    grupo = np.repeat(np.arange(len(buckets)), np.diff(np.append(inicios, len(claves))))
+    desvio = np.where(presentes, media - media_total[grupo], 0.0)
+    m2_total = np.add.reduceat(np.where(presentes, m2 + conteo * desvio ** 2, 0.0), inicios, axis=0)
+    minimo = np.minimum.reduceat(np.where(presentes, minimo, np.inf), inicios, axis=0)
+    maximo = np.maximum.reduceat(np.where(presentes, maximo, -np.inf), inicios, axis=0)
+    vacios = n == 0
+    minimo[vacios] = maximo[vacios] = np.nan
+    return buckets, {'conteo': n, 'media': media_total, 'm2': m2_total, 'minimo': minimo, 'maximo': maximo}
+
+
+def _claves(fechas, nivel):
+    return np.asarray(fechas).astype(f'datetime64[{NIVELES[nivel]}]').astype(np.int64)
+
+
+def _truncar(fecha, nivel):
+    """(clave del bucket que contiene fecha, True si fecha es el inicio del bucket)"""
+    fecha = np.datetime64(fecha, 'ns')
+    inicio = fecha.astype(f'datetime64[{NIVELES[nivel]}]')
+    return int(inicio.astype(np.int64)), inicio == fecha
+
+
+class Agregados:
+    """
+    Tablas materializadas por nivel (horario, diario, mensual): para cada
+    bucket y columna, conteo, media, M2 (para la desviación), mínimo y
+    máximo. actualizar() recalcula sólo los buckets que tocan los datos
+    nuevos; cada nivel se obtiene del anterior, no de los datos crudos.
+    """
+
+    def __init__(self, columnas=SENSORES):
+        self.columnas = list(columnas)
+        k = len(self.columnas)
+        self.buckets = {nivel: np.empty(0, dtype=np.int64) for nivel in NIVELES}
+        self.tablas = {nivel: {'conteo': np.empty((0, k), dtype=np.int64),
+                               **{e: np.empty((0, k)) for e in ESTADISTICAS[1:]}}
+                       for nivel in NIVELES}
+        self.lector = None
+
+    def _actualizar_nivel(self, nivel, claves, filas):
+        """Funde las filas (ya agregadas o crudas) en los buckets claves del nivel"""
+        buckets, tabla = self.buckets[nivel], self.tablas[nivel]
+        tocados = np.unique(claves)
+        previos = np.isin(buckets, tocados)
+        claves = np.concatenate([buckets[previos], claves])
+        filas = {e: np.concatenate([tabla[e][previos], filas[e]]) for e in ESTADISTICAS}
+        orden = np.argsort(claves, kind='stable')
+        nuevos, reducidas = _reducir(claves[orden], *(filas[e][orden] for e in ESTADISTICAS))
+
+        todos = np.union1d(buckets, nuevos)
+        posicion_previa, posicion_nueva = np.searchsorted(todos, buckets), np.searchsorted(todos, nuevos)
+        for e in ESTADISTICAS:
+            columna = np.empty((len(todos), len(self.columnas)), dtype=tabla[e].dtype)
+            columna[posicion_previa] = tabla[e]
+            columna[posicion_nueva] = reducidas[e]
+            tabla[e] = columna
+        self.buckets[nivel] = todos
+        return nuevos
+
+    def actualizar(self, fechas, valores):
+        """Agrega filas nuevas (fechas datetime64, valores n x columnas)"""
+        valores = np.asarray(valores, dtype=np.float64)
+        if len(valores) == 0:
+            return
+        presentes = ~np.isnan(valores)
+        crudas = {'conteo': presentes.astype(np.int64), 'media': valores, 'm2': np.zeros_like(valores),
+                  'minimo': valores, 'maximo': valores}
+        niveles = list(NIVELES)
+        tocados = self._actualizar_nivel(niveles[0], _claves(fechas, niveles[0]), crudas)
+        for fino, grueso in zip(niveles, niveles[1:]):
+            # Los buckets gruesos tocados se recalculan desde los finos que contienen
+            claves_gruesas = _claves(tocados.astype(f'datetime64[{NIVELES[fino]}]'), grueso)
+            limites = np.unique(claves_gruesas)
+            desde = np.searchsorted(self.buckets[fino], _claves_a_fino(limites, grueso, fino))
+            hasta = np.searchsorted(self.buckets[fino], _claves_a_fino(limites + 1, grueso, fino))
+            filas = np.concatenate([np.arange(i, j) for i, j in zip(desde, hasta)])
+            claves = _claves(self.buckets[fino][filas].astype(f'datetime64[{NIVELES[fino]}]'), grueso)
+            # Se reemplazan (no se combinan) los buckets gruesos tocados
+            self._descartar(grueso, limites)
+            tocados = self._actualizar_nivel(grueso, claves, {e: self.tablas[fino][e][filas] for e in ESTADISTICAS})
+
+    def _descartar(self, nivel, buckets):
+        conservar = ~np.isin(self.buckets[nivel], buckets)
+        self.buckets[nivel] = self.buckets[nivel][conservar]
+        for e in ESTADISTICAS:
+            self.tablas[nivel][e] = self.tablas[nivel][e][conservar]
+
+    def desviacion(self, nivel):
+        """Desviación estándar muestral de cada bucket (NaN con menos de dos valores)"""
+        tabla = self.tablas[nivel]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(np.where(tabla['conteo'] > 1, tabla['m2'] / (tabla['conteo'] - 1), np.nan))
+
+    def nivel_para(self, fecha_inicio=None, fecha_fin=None):
+        """
+        El nivel más grueso en el que fecha_inicio y fecha_fin caen en el
+        inicio de un bucket (p. ej. 2024-01-01 a 2024-12-01 es mensual,
+        2024-01-01 a 2024-12-31 es diario). Sin fechas, el más grueso.
+        """
+        for nivel in reversed(NIVELES):
+            if all(f is None or _truncar(f, nivel)[1] for f in (fecha_inicio, fecha_fin)):
+                return nivel
+        return next(iter(NIVELES))
+
+    def consultar(self, nivel, fecha_inicio=None, fecha_fin=None, columnas=None):
+        """
+        Buckets del nivel que empiezan entre fecha_inicio y fecha_fin
+        (inclusive). Retorna (inicios datetime64, {columna: {estadística: array}})
+        """
+        unidad = NIVELES[nivel]
+        buckets = self.buckets[nivel]
+        i, j = 0, len(buckets)
+        if fecha_inicio is not None:
+            clave, alineada = _truncar(fecha_inicio, nivel)
+            i = np.searchsorted(buckets, clave, side='left' if alineada else 'right')
+        if fecha_fin is not None:
+            j = np.searchsorted(buckets, _truncar(fecha_fin, nivel)[0], side='right')
+        desviacion = self.desviacion(nivel)[i:j]
+        resultado = {}
+        for columna in columnas or self.columnas:
+            c = self.columnas.index(columna)
+            tabla = self.tablas[nivel]
+            resultado[columna] = {'conteo': tabla['conteo'][i:j, c], 'media': tabla['media'][i:j, c],
+                                  'minimo': tabla['minimo'][i:j, c], 'maximo': tabla['maximo'][i:j, c],
+                                  'desviacion': desviacion[:, c]}
+        return buckets[i:j].astype(f'datetime64[{unidad}]'), resultado
+
+    def guardar(self, ruta):
+        """
+        Guarda todos los niveles en un .npz (conteos int32, estadísticas
+        float64) junto con el estado del lector, de forma atómica: tablas y
+        posición en el archivo nunca quedan desalineadas
+        """
+        arrays = {'columnas': np.array(self.columnas), 'lector': np.array(json.dumps(self.lector))}
+        for nivel in NIVELES:
+            arrays[f'{nivel}_buckets'] = self.buckets[nivel]
+            for e in ESTADISTICAS:
+                valores = self.tablas[nivel][e]
+                arrays[f'{nivel}_{e}'] = valores.astype(np.int32) if e == 'conteo' else valores
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        with open(ruta + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(ruta + '.tmp', ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        """Lee un .npz escrito por guardar (None si no existe o no se puede leer)"""
+        try:
+            with np.load(ruta) as datos:
+                agregados = cls(datos['columnas'].tolist())
+                agregados.lector = json.loads(str(datos['lector']))
+                for nivel in NIVELES:
+                    agregados.buckets[nivel] = datos[f'{nivel}_buckets']
+                    for e in ESTADISTICAS:
+                        valores = datos[f'{nivel}_{e}']
+                        agregados.tablas[nivel][e] = valores.astype(np.int64) if e == 'conteo' else valores
+            return agregados
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def _claves_a_fino(claves, grueso, fino):
+    """Clave del primer bucket fino de cada bucket grueso"""
+    return claves.astype(f'datetime64[{NIVELES[grueso]}]').astype(f'datetime64[{NIVELES[fino]}]').astype(np.int64)
+
+
+def actualizar_agregados(archivo='valpoall.txt', ruta='datos_procesados/agregados.npz', columnas=SENSORES):
+    """
+    Incorpora a los agregados guardados en ruta las líneas agregadas al
+    archivo desde la última ejecución. Retorna (Agregados, filas nuevas)
+    """
+    agregados = Agregados.cargar(ruta)
+    if agregados is not None and agregados.columnas != list(columnas):
+        agregados = None
+    lector = LectorIncremental(archivo, agregados.lector if agregados else None)
+    bloques = lector.bloques()
+    if agregados is None or lector.reiniciado:
+        agregados = Agregados(columnas)
+
+    filas_nuevas = 0
+    for bloque in bloques:
+        validas = ~bloque['fecha_invalida']
+        agregados.actualizar(bloque['fecha'][validas], np.column_stack([bloque[c][validas] for c in columnas]))
+        filas_nuevas += int(validas.sum())
+
+    if filas_nuevas or agregados.lector != lector.estado:
+        agregados.lector = lector.estado
+        agregados.guardar(ruta)
+    return agregados, filas_nuevas
@@ -1,63 +1,642 @@
-from flask import Flask, render_template, jsonify, request
-import pandas as pd
-import json
-from datetime import datetime, timedelta
+from flask import Flask, Response, g, render_template, jsonify, request
+import numpy as np
+from datetime import datetime
+import hashlib
 import os
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
 from config import GOOGLE_MAPS_API_KEY
+from cache_pronostico import CachePronostico, PronosticoArmonico, PronosticoCompartido, MAX_DIAS_RANGO
+from compartido import ArchivoCompartido, ruta_publicada
+from reduccion import reducir_serie
+from respuestas import codificar_serie, comprimir, FORMATOS, MIME_BINARIO, MIME_JSON
+from pleamares import IndiceEventos, eventos_a_dict, PLEAMAR, BAJAMAR
+from lotes import tramos, resumen_tramos, siguientes_eventos
+from estaciones import (archivo_estacion, directorio_resultados, listar_estaciones, validar_estacion,
+                        ESTACION_PREDETERMINADA)
+from instrumentacion import Histograma, formato_prometheus
+from agregados import Agregados, NIVELES
+from verificacion import Verificacion
 
 app = Flask(__name__)
 
-# Cargar datos de pronóstico
-def cargar_pronostico_marea():
+cache_pronostico = CachePronostico('resultados/pronostico_keller_futuro.csv')
+pronostico_armonico = PronosticoArmonico('resultados/constantes_armonicas.json')
+# Pronóstico y observaciones publicados en archivos mapeados en memoria: los
+# procesos del servidor comparten una sola copia (ver compartido.py)
+pronostico_compartido = PronosticoCompartido(ruta_publicada('pronostico'), pronostico_armonico)
+_observaciones_compartidas = {}
+ARCHIVO_OBSERVADO = 'valpoall.txt'
+MAX_RANGOS_LOTE = 1000
+# Puntos horarios que puede abarcar un lote entre todos sus rangos
+MAX_PUNTOS_LOTE = 250_000
+MAX_VENTANA_VERIFICACION = 366
+DIRECTORIO_PROCESADOS = 'datos_procesados'
+
+def _fecha(valor):
+    """Texto o datetime a datetime64[ns]; pandas se importa con la primera fecha que se interpreta"""
+    import pandas as pd
+    return pd.to_datetime(valor).to_datetime64()
+
+def _fecha_pedida(valor):
+    """Como _fecha, pero con ValueError('Fecha inválida') para texto que no es una fecha"""
+    try:
+        fecha = _fecha(valor)
+    except ValueError:
+        fecha = np.datetime64('NaT')
+    if np.isnat(fecha):
+        raise ValueError('Fecha inválida')
+    return fecha
+
+def _rango_pedido(fecha_inicio, fecha_fin):
+    """
+    (inicio, fin) como datetime64[ns]; ValueError si alguna fecha es
+    inválida o el rango supera MAX_DIAS_RANGO días
+    """
+    inicio, fin = _fecha_pedida(fecha_inicio), _fecha_pedida(fecha_fin)
+    if fin - inicio > np.timedelta64(MAX_DIAS_RANGO, 'D'):
+        raise ValueError(f'El rango no puede superar {MAX_DIAS_RANGO} días')
+    return inicio, fin
+
+# Cachés de cada estación, creadas la primera vez que se consulta
+_fuentes_estaciones = {}
+
+def fuentes_estacion(estacion=None):
+    """
+    (CachePronostico, PronosticoArmonico, PronosticoCompartido) de la
+    estación; sin estación, los de resultados/
+    """
+    if estacion is None:
+        return cache_pronostico, pronostico_armonico, pronostico_compartido
+    fuentes = _fuentes_estaciones.get(estacion)
+    if fuentes is None:
+        directorio = directorio_resultados(estacion)
+        armonico = PronosticoArmonico(os.path.join(directorio, 'constantes_armonicas.json'))
+        fuentes = _fuentes_estaciones.setdefault(estacion, (
+            CachePronostico(os.path.join(directorio, 'pronostico_keller_futuro.csv')),
+            armonico,
+            PronosticoCompartido(ruta_publicada('pronostico', estacion), armonico)))
+    return fuentes
+
+def _comprobar_estacion(estacion):
+    """Respuesta de error si el nombre no es válido o la estación no existe; si no, None"""
+    try:
+        validar_estacion(estacion)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if estacion not in listar_estaciones():
+        return jsonify({'error': f'Estación desconocida: {estacion}'}), 404
+    return None
+
+def _estacion_salidas(estacion):
+    """
+    Estación cuyas salidas se usan: la predeterminada, si el pipeline no
+    generó salidas propias para ella, usa las de resultados/ (None)
+    """
+    if estacion == ESTACION_PREDETERMINADA and not os.path.isdir(directorio_resultados(estacion)):
+        return None
+    return estacion
+
+def _estacion_pedida():
+    """Retorna (estacion, respuesta de error o None) según el parámetro estacion"""
+    estacion = request.args.get('estacion')
+    if estacion is None:
+        return None, None
+    error = _comprobar_estacion(estacion)
+    if error:
+        return None, error
+    return _estacion_salidas(estacion), None
+
+# Cargar datos de pronóstico: si existen constantes armónicas se usa su
+# publicación compartida (si está al día) o se evalúan a pedido; si no, se
+# usa el CSV (que sólo se relee si cambió en disco)
+def cargar_pronostico_marea(estacion=None):
+    csv, armonico, compartido = fuentes_estacion(estacion)
+    if os.path.exists(armonico.ruta):
+        return compartido if compartido.vigente() else armonico
     try:
-        df = pd.read_csv('resultados/pronostico_keller_futuro.csv')
-        df['fecha'] = pd.to_datetime(df['fecha'])
-        return df
+        csv.obtener()
+        return csv
     except Exception as e:
         print(f"Error al cargar datos: {str(e)}")
         return None
 
+def _error_pronostico(estacion=None):
+    """
+    Respuesta cuando cargar_pronostico_marea falla: 404 si la estación no
+    tiene salidas de pronóstico, 500 si existen pero no se pudieron leer
+    """
+    csv, armonico, _ = fuentes_estacion(estacion)
+    if not os.path.exists(armonico.ruta) and not os.path.exists(csv.ruta):
+        nombre = estacion or ESTACION_PREDETERMINADA
+        return jsonify({'error': f'No hay pronóstico para la estación {nombre}: ejecute el pipeline'}), 404
+    return jsonify({'error': 'No se pudieron cargar los datos'}), 500
+
+# Métricas de la API: latencia por ruta y respuestas por código
+_latencias = {}
+_respuestas = Counter()
+_lock_metricas = threading.Lock()
+
+@app.before_request
+def _iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def _registrar_latencia(respuesta):
+    inicio = g.pop('inicio_peticion', None)
+    if inicio is not None:
+        ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+        clave = (('metodo', request.method), ('ruta', ruta))
+        with _lock_metricas:
+            histograma = _latencias.setdefault(clave, Histograma())
+            _respuestas[clave + (('codigo', respuesta.status_code),)] += 1
+        histograma.observar(time.perf_counter() - inicio)
+    return respuesta
+
 @app.route('/')
 def index():
     return render_template('index.html', google_maps_api_key=GOOGLE_MAPS_API_KEY)
 
+def _serie_pronostico(fuente, fecha_inicio, fecha_fin):
+    if fecha_inicio is not None:
+        return fuente.rango(fecha_inicio, fecha_fin)
+    return fuente.obtener()
+
+@lru_cache(maxsize=256)
+def _serie_reducida(fuente, firma, fecha_inicio, fecha_fin, max_puntos, metodo):
+    """
+    Serie del rango reducida a max_puntos conservando pleamares y bajamares.
+    La firma del archivo forma parte de la clave: al cambiar el pronóstico
+    las entradas antiguas simplemente dejan de usarse.
+    """
+    fechas, valores = _serie_pronostico(fuente, fecha_inicio, fecha_fin)
+    return reducir_serie(fechas, valores, max_puntos, metodo)
+
+def _negociar_formato():
+    """formato=json|compacto|binario, o binario si el cliente pide octet-stream"""
+    formato = request.args.get('formato')
+    if formato is None:
+        preferido = request.accept_mimetypes.best_match([MIME_JSON, MIME_BINARIO])
+        formato = 'binario' if preferido == MIME_BINARIO else 'json'
+    return formato
+
+def _negociar_codificacion():
+    for codificacion in ('gzip', 'deflate'):
+        if codificacion in request.accept_encodings:
+            return codificacion
+    return None
+
+def _etag(firma, formato, codificacion, *extra):
+    """ETag fuerte: versión del archivo + consulta + representación"""
+    clave = repr((firma, request.path, sorted(request.args.items(multi=True)),
+                  formato, codificacion) + extra)
+    return hashlib.blake2b(clave.encode('utf-8'), digest_size=16).hexdigest()
+
+def _responder_serie(etag, obtener_serie, formato, codificacion, formato_fecha):
+    """
+    Responde 304 si el cliente ya tiene esta versión (sin calcular ni
+    serializar nada); si no, serializa, comprime y etiqueta la respuesta
+    """
+    if request.if_none_match.contains(etag):
+        respuesta = Response(status=304)
+    else:
+        fechas, valores = obtener_serie()
+        cuerpo, mimetype = codificar_serie(fechas, valores, formato, formato_fecha)
+        cuerpo, aplicada = comprimir(cuerpo, codificacion)
+        respuesta = Response(cuerpo, mimetype=mimetype)
+        if aplicada:
+            respuesta.headers['Content-Encoding'] = aplicada
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['Vary'] = 'Accept, Accept-Encoding'
+    return respuesta
+
 @app.route('/api/pronostico')
 def get_pronostico():
     fecha_inicio = request.args.get('fecha_inicio')
     fecha_fin = request.args.get('fecha_fin')
+    max_puntos = request.args.get('max_puntos') or request.args.get('resolucion')
+    metodo = request.args.get('metodo', 'minmax')
+    formato = _negociar_formato()
     
-    df = cargar_pronostico_marea()
-    if df is None:
-        return jsonify({'error': 'No se pudieron cargar los datos'}), 500
+    if max_puntos is not None:
+        try:
+            max_puntos = int(max_puntos)
+        except ValueError:
+            max_puntos = 0
+        if max_puntos < 3 or metodo not in ('minmax', 'lttb'):
+            return jsonify({'error': 'max_puntos debe ser un entero >= 3 y metodo minmax o lttb'}), 400
+    if formato not in FORMATOS:
+        return jsonify({'error': f'formato debe ser uno de {", ".join(FORMATOS)}'}), 400
+    estacion, error = _estacion_pedida()
+    if error:
+        return error
     
     if fecha_inicio and fecha_fin:
-        fecha_inicio = pd.to_datetime(fecha_inicio)
-        fecha_fin = pd.to_datetime(fecha_fin)
-        df = df[(df['fecha'] >= fecha_inicio) & (df['fecha'] <= fecha_fin)]
+        try:
+            fecha_inicio, fecha_fin = _rango_pedido(fecha_inicio, fecha_fin)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        fecha_inicio = fecha_fin = None
     
-    # Convertir a formato para el gráfico
-    datos = {
-        'fechas': df['fecha'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist(),
-        'valores': df['keller_pronostico'].tolist()
-    }
+    cache = cargar_pronostico_marea(estacion)
+    if cache is None:
+        return _error_pronostico(estacion)
+    
+    firma = cache.firma()
+    codificacion = _negociar_codificacion()
     
-    return jsonify(datos)
+    def obtener_serie():
+        if max_puntos is not None:
+            return _serie_reducida(cache, firma, fecha_inicio, fecha_fin, max_puntos, metodo)
+        return _serie_pronostico(cache, fecha_inicio, fecha_fin)
+    
+    # Convertir a formato para el gráfico
+    return _responder_serie(_etag(firma, formato, codificacion), obtener_serie,
+                            formato, codificacion, '%Y-%m-%d %H:%M:%S')
 
 @app.route('/api/pronostico/hoy')
 def get_pronostico_hoy():
-    df = cargar_pronostico_marea()
-    if df is None:
-        return jsonify({'error': 'No se pudieron cargar los datos'}), 500
+    formato = _negociar_formato()
+    if formato not in FORMATOS:
+        return jsonify({'error': f'formato debe ser uno de {", ".join(FORMATOS)}'}), 400
+    estacion, error = _estacion_pedida()
+    if error:
+        return error
+    
+    cache = cargar_pronostico_marea(estacion)
+    if cache is None:
+        return _error_pronostico(estacion)
     
     hoy = datetime.now().date()
-    df_hoy = df[df['fecha'].dt.date == hoy]
+    codificacion = _negociar_codificacion()
+    etag = _etag(cache.firma(), formato, codificacion, hoy.isoformat())
+    
+    return _responder_serie(etag, lambda: cache.dia(hoy), formato, codificacion, '%H:%M')
+
+@lru_cache(maxsize=16)
+def _indice_pronostico(fuente, firma):
+    """Índice de pleamares/bajamares del pronóstico, uno por versión"""
+    fechas, valores = fuente.obtener()
+    return IndiceEventos.desde_serie(fechas, valores)
+
+@lru_cache(maxsize=16)
+def _indice_observado(origen, firma):
+    """
+    Índice de pleamares/bajamares observadas por el sensor Keller. origen
+    es la publicación compartida de las observaciones o el archivo crudo.
+    """
+    from ingesta import cargar_columnas, valores_sensor
+    if isinstance(origen, ArchivoCompartido):
+        columnas, _ = origen.adjuntar()
+        fechas, keller = columnas['fecha'], valores_sensor(columnas, 'keller')
+    else:
+        columnas = cargar_columnas(origen, ['fecha', 'keller'])
+        fechas, keller = columnas['fecha'], columnas['keller']
+    # La serie observada tiene ruido: se suaviza y se ignoran oscilaciones < 10 cm
+    return IndiceEventos.desde_serie(fechas, keller, ventana=3, amplitud_minima=0.1)
+
+def _observaciones_publicadas(archivo, estacion=None):
+    """Publicación compartida de las observaciones si está al día con archivo, o None"""
+    compartido = _observaciones_compartidas.get(estacion)
+    if compartido is None:
+        compartido = _observaciones_compartidas.setdefault(
+            estacion, ArchivoCompartido(ruta_publicada('observaciones', estacion)))
+    return compartido if compartido.al_dia_con(archivo) else None
+
+@app.route('/api/pleamares')
+def get_pleamares():
+    serie = request.args.get('serie', 'pronostico')
+    tipo = request.args.get('tipo')
+    fecha_inicio = request.args.get('fecha_inicio')
+    fecha_fin = request.args.get('fecha_fin')
     
-    datos = {
-        'fechas': df_hoy['fecha'].dt.strftime('%H:%M').tolist(),
-        'valores': df_hoy['keller_pronostico'].tolist()
-    }
+    tipos = {'pleamar': PLEAMAR, 'bajamar': BAJAMAR, None: None}
+    if serie not in ('pronostico', 'observado') or tipo not in tipos:
+        return jsonify({'error': 'serie debe ser pronostico u observado y tipo pleamar o bajamar'}), 400
+    try:
+        n = int(request.args.get('n', 4))
+    except ValueError:
+        n = 0
+    if not 1 <= n <= 1000:
+        return jsonify({'error': 'n debe ser un entero entre 1 y 1000'}), 400
+    try:
+        if fecha_inicio and fecha_fin:
+            fecha_inicio, fecha_fin = _rango_pedido(fecha_inicio, fecha_fin)
+        else:
+            fecha_inicio = fecha_fin = None
+            desde = _fecha_pedida(request.args.get('desde') or datetime.now())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    estacion, error = _estacion_pedida()
+    if error:
+        return error
+    
+    try:
+        if serie == 'observado':
+            archivo = ARCHIVO_OBSERVADO if estacion is None else archivo_estacion(estacion)
+            publicadas = _observaciones_publicadas(archivo, estacion)
+            if publicadas is not None:
+                indice = _indice_observado(publicadas, publicadas.firma())
+            else:
+                st = os.stat(archivo)
+                indice = _indice_observado(archivo, (st.st_mtime_ns, st.st_size))
+        else:
+            fuente = cargar_pronostico_marea(estacion)
+            if fuente is None:
+                return _error_pronostico(estacion)
+            indice = _indice_pronostico(fuente, fuente.firma())
+    except Exception as e:
+        print(f"Error al construir el índice de pleamares: {str(e)}")
+        return jsonify({'error': 'No se pudieron cargar los datos'}), 500
+    
+    if fecha_inicio is not None:
+        if serie == 'pronostico' and isinstance(fuente, (PronosticoArmonico, PronosticoCompartido)) and not indice.cubre(fecha_inicio, fecha_fin):
+            # Fuera del horizonte indexado: se evalúa sólo el tramo pedido (más una hora a cada lado)
+            margen = np.timedelta64(1, 'h')
+            indice = IndiceEventos.desde_serie(*fuente.rango(fecha_inicio - margen, fecha_fin + margen))
+        eventos = indice.rango(fecha_inicio, fecha_fin, tipos[tipo])
+    else:
+        eventos = indice.siguientes(desde, n, tipos[tipo])
+    
+    return jsonify({'serie': serie, 'eventos': eventos_a_dict(*eventos)})
+
+@lru_cache(maxsize=16)
+def _agregados(ruta, firma):
+    """Agregados por hora/día/mes que mantiene la etapa de preprocesamiento, uno por versión"""
+    return Agregados.cargar(ruta)
+
+def _lista(valores):
+    """Array a lista JSON: los NaN (buckets sin datos) quedan como null"""
+    return [None if np.isnan(v) else round(float(v), 4) for v in valores]
+
+@app.route('/api/agregados')
+def get_agregados():
+    nivel = request.args.get('nivel')
+    sensores = request.args.get('sensores')
+    if nivel is not None and nivel not in NIVELES:
+        return jsonify({'error': f"nivel debe ser uno de: {', '.join(NIVELES)}"}), 400
+    try:
+        fecha_inicio, fecha_fin = (_fecha_pedida(request.args[f]) if request.args.get(f) else None
+                                   for f in ('fecha_inicio', 'fecha_fin'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if fecha_inicio is not None and fecha_fin is not None and fecha_fin < fecha_inicio:
+        return jsonify({'error': 'fecha_inicio debe ser anterior a fecha_fin'}), 400
+    estacion, error = _estacion_pedida()
+    if error:
+        return error
+    
+    ruta = os.path.join(DIRECTORIO_PROCESADOS, *([estacion] if estacion else []), 'agregados.npz')
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return jsonify({'error': 'No hay agregados: ejecute el preprocesamiento'}), 404
+    agregados = _agregados(ruta, (st.st_mtime_ns, st.st_size))
+    if agregados is None:
+        return jsonify({'error': 'No se pudieron cargar los datos'}), 500
+    sensores = sensores.split(',') if sensores else agregados.columnas
+    desconocidos = [s for s in sensores if s not in agregados.columnas]
+    if desconocidos:
+        return jsonify({'error': f"Sensores desconocidos: {', '.join(desconocidos)}"}), 400
+    
+    # Sin nivel explícito se usa el más grueso cuyos buckets calzan con el rango
+    automatico = nivel is None
+    nivel = nivel or agregados.nivel_para(fecha_inicio, fecha_fin)
+    # El nivel horario se limita a MAX_DIAS_RANGO días (un extremo abierto
+    # llega hasta el primer o último bucket): si el nivel se eligió solo, se
+    # pasa al diario; si se pidió, es un error
+    if nivel == 'horario' and len(agregados.buckets[nivel]):
+        horas = agregados.buckets[nivel]
+        inicio = fecha_inicio if fecha_inicio is not None else np.datetime64(int(horas[0]), 'h')
+        fin = fecha_fin if fecha_fin is not None else np.datetime64(int(horas[-1]), 'h')
+        if fin - inicio > np.timedelta64(MAX_DIAS_RANGO, 'D'):
+            if not automatico:
+                return jsonify({'error': f'El nivel horario no puede abarcar más de {MAX_DIAS_RANGO} días'}), 400
+            nivel = 'diario'
+    inicios, columnas = agregados.consultar(nivel, fecha_inicio, fecha_fin, sensores)
+    return jsonify({
+        'nivel': nivel,
+        'inicio': [str(i) for i in inicios],
+        'sensores': {sensor: {'conteo': estadisticas['conteo'].tolist(),
+                              **{e: _lista(v) for e, v in estadisticas.items() if e != 'conteo'}}
+                     for sensor, estadisticas in columnas.items()},
+    })
+
+@lru_cache(maxsize=16)
+def _verificacion(ruta, firma):
+    """Sumas de verificación que mantiene la etapa del pipeline, una por versión"""
+    return Verificacion.cargar(ruta)
+
+def _metricas_json(metricas):
+    """Métricas de Verificacion.metricas a listas JSON (conteos enteros, NaN como null)"""
+    return {nombre: {m: v.astype(int).tolist() if m == 'n' else _lista(v) for m, v in valores.items()}
+            for nombre, valores in metricas.items()}
+
+@app.route('/api/verificacion')
+def get_verificacion():
+    """
+    Error del pronóstico contra lo observado después de emitirlo: sesgo,
+    RMSE y MAE por sensor y errores de hora y altura de pleamares y
+    bajamares. Con ventana (días) retorna además la serie móvil por día.
+    """
+    try:
+        ventana = int(request.args['ventana']) if request.args.get('ventana') else None
+    except ValueError:
+        return jsonify({'error': 'ventana debe ser un número de días'}), 400
+    if ventana is not None and not 1 <= ventana <= MAX_VENTANA_VERIFICACION:
+        return jsonify({'error': f'ventana debe estar entre 1 y {MAX_VENTANA_VERIFICACION} días'}), 400
+    estacion, error = _estacion_pedida()
+    if error:
+        return error
+    
+    ruta = os.path.join(DIRECTORIO_PROCESADOS, *([estacion] if estacion else []), 'verificacion.npz')
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return jsonify({'error': 'No hay verificación: ejecute el pipeline'}), 404
+    verificacion = _verificacion(ruta, (st.st_mtime_ns, st.st_size))
+    if verificacion is None:
+        return jsonify({'error': 'No se pudieron cargar los datos'}), 500
+    
+    globales = {nombre: {m: l[0] for m, l in valores.items()}
+                for nombre, valores in _metricas_json(verificacion.metricas()).items()}
+    respuesta = {'dias': len(verificacion.dias), 'global': globales}
+    if ventana is not None:
+        respuesta['ventana'] = {'dias': ventana,
+                                'fecha': [str(d) for d in verificacion.dias.astype('datetime64[D]')],
+                                'metricas': _metricas_json(verificacion.metricas(ventana))}
+    return jsonify(respuesta)
+
+def _proximas_pleamares(fuente, inicios):
+    """
+    Primera pleamar en o después de cada inicio, desde el índice en caché.
+    Para los inicios fuera del índice se evalúan los dos días siguientes
+    (sólo con constantes armónicas; con el CSV quedan sin pleamar).
+    """
+    try:
+        indice = _indice_pronostico(fuente, fuente.firma())
+    except ValueError:
+        indice = IndiceEventos([], [], [])
+    pleamares = indice.tipos == PLEAMAR
+    tiempos, alturas, encontrados = siguientes_eventos(indice.tiempos[pleamares], indice.alturas[pleamares], inicios)
+    if isinstance(fuente, CachePronostico):
+        return tiempos, alturas
+    
+    fuera = ~encontrados
+    if indice.cobertura is not None:
+        fuera |= inicios < indice.cobertura[0]
+    margen = np.timedelta64(1, 'h')
+    for k in np.flatnonzero(fuera):
+        serie = fuente.rango(inicios[k] - margen, inicios[k] + np.timedelta64(2, 'D'))
+        t, h, _ = IndiceEventos.desde_serie(*serie).siguientes(inicios[k], 1, PLEAMAR)
+        tiempos[k], alturas[k] = (t[0], h[0]) if len(t) else (np.datetime64('NaT'), np.nan)
+    return tiempos, alturas
+
+def _lote_fuente(fuente, inicios, fines, puntos, resumen):
+    """
+    Resuelve todos los rangos de una fuente: los que caen dentro del índice
+    de tiempos en caché con dos searchsorted vectorizados y reduceat; los
+    que quedan fuera (pronóstico armónico) se evalúan uno a uno
+    """
+    try:
+        fechas, valores = fuente.obtener()
+    except ValueError:
+        # Constantes sin horizonte registrado: todo se evalúa a pedido
+        fechas, valores = np.array([], dtype='datetime64[ns]'), np.array([])
+    i, j = tramos(fechas, inicios, fines)
+    if isinstance(fuente, CachePronostico):
+        cubiertos = np.ones(len(inicios), dtype=bool)
+    else:
+        cubiertos = (len(fechas) > 0) & (inicios >= fechas[:1]) & (fines <= fechas[-1:])
+    series = [(fechas[a:b], valores[a:b]) if cubierto else fuente.rango(inicio, fin)
+              for a, b, cubierto, inicio, fin in zip(i, j, cubiertos, inicios, fines)]
+    
+    resultados = [{} for _ in series]
+    if puntos:
+        # Un solo strftime para las fechas de todos los rangos
+        todas = np.concatenate([f for f, _ in series]) if series else np.array([], dtype='datetime64[ns]')
+        import pandas as pd
+        textos = pd.DatetimeIndex(todas).strftime('%Y-%m-%d %H:%M:%S').tolist()
+        corte = 0
+        for resultado, (f, v) in zip(resultados, series):
+            resultado['fechas'] = textos[corte:corte + len(f)]
+            resultado['valores'] = np.asarray(v).tolist()
+            corte += len(f)
+    if resumen:
+        n, minimo, maximo = resumen_tramos(valores, i, j)
+        for k in np.flatnonzero(~cubiertos):
+            v = series[k][1]
+            n[k] = len(v)
+            _, minimo_k, maximo_k = resumen_tramos(v, np.array([0]), np.array([len(v)]))
+            minimo[k], maximo[k] = minimo_k[0], maximo_k[0]
+        tiempos, alturas = _proximas_pleamares(fuente, inicios)
+        hay = ~np.isnat(tiempos)
+        pleamares = iter(eventos_a_dict(tiempos[hay], alturas[hay], np.full(hay.sum(), PLEAMAR)))
+        for k, resultado in enumerate(resultados):
+            resultado['resumen'] = {
+                'n': int(n[k]),
+                'minimo': None if np.isnan(minimo[k]) else round(float(minimo[k]), 4),
+                'maximo': None if np.isnan(maximo[k]) else round(float(maximo[k]), 4),
+                'proxima_pleamar': None if np.isnat(tiempos[k]) else next(pleamares),
+            }
+    return resultados
+
+@app.route('/api/pronostico/lote', methods=['POST'])
+def post_pronostico_lote():
+    """
+    Pronóstico de muchos rangos en una consulta. Cuerpo JSON:
+    {"rangos": [{"inicio": ..., "fin": ..., "estacion": ...}, ...],
+     "puntos": true, "resumen": false}
+    Cada rango también puede ser una lista [inicio, fin] o [inicio, fin, estacion],
+    con las fechas como texto. Cada rango abarca a lo más MAX_DIAS_RANGO
+    días y el lote completo MAX_PUNTOS_LOTE puntos horarios.
+    Con resumen se agregan n, mínimo, máximo y la primera pleamar desde el
+    inicio; con puntos=false se omite la serie.
+    """
+    cuerpo = request.get_json(silent=True)
+    if not isinstance(cuerpo, dict) or not isinstance(cuerpo.get('rangos'), list):
+        return jsonify({'error': 'El cuerpo debe ser un objeto JSON con la lista "rangos"'}), 400
+    rangos = cuerpo['rangos']
+    if not 1 <= len(rangos) <= MAX_RANGOS_LOTE:
+        return jsonify({'error': f'Se aceptan entre 1 y {MAX_RANGOS_LOTE} rangos'}), 400
+    puntos, resumen = cuerpo.get('puntos', True), cuerpo.get('resumen', False)
+    if not isinstance(puntos, bool) or not isinstance(resumen, bool):
+        return jsonify({'error': 'puntos y resumen deben ser true o false'}), 400
+    try:
+        rangos = [(r['inicio'], r['fin'], r.get('estacion')) if isinstance(r, dict) else
+                  (r[0], r[1], r[2] if len(r) > 2 else None) for r in rangos]
+        if not all(isinstance(r[0], str) and isinstance(r[1], str) for r in rangos):
+            raise TypeError('Las fechas deben ser texto')
+        # Fecha a fecha, como en /api/pronostico: los rangos pueden mezclar formatos
+        inicios, fines = (np.array([_fecha(r[k]) for r in rangos], dtype='datetime64[ns]')
+                          for k in (0, 1))
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'Cada rango debe tener inicio y fin con fechas válidas'}), 400
+    if np.isnat(inicios).any() or np.isnat(fines).any() or (fines < inicios).any():
+        return jsonify({'error': 'Cada rango debe tener inicio y fin, con inicio <= fin'}), 400
+    if (fines - inicios > np.timedelta64(MAX_DIAS_RANGO, 'D')).any():
+        return jsonify({'error': f'Ningún rango puede superar {MAX_DIAS_RANGO} días'}), 400
+    if ((fines - inicios) // np.timedelta64(1, 'h') + 1).sum() > MAX_PUNTOS_LOTE:
+        return jsonify({'error': f'El lote no puede abarcar más de {MAX_PUNTOS_LOTE} puntos horarios'}), 400
+    estaciones = [r[2] for r in rangos]
+    for estacion in dict.fromkeys(estaciones):
+        error = estacion is not None and _comprobar_estacion(estacion)
+        if error:
+            return error
+    estaciones = [_estacion_salidas(e) for e in estaciones]
     
-    return jsonify(datos)
+    resultados = [None] * len(rangos)
+    for estacion in dict.fromkeys(estaciones):
+        filas = np.array([k for k, e in enumerate(estaciones) if e == estacion])
+        fuente = cargar_pronostico_marea(estacion)
+        if fuente is None:
+            return _error_pronostico(estacion)
+        lote = _lote_fuente(fuente, inicios[filas], fines[filas], puntos, resumen)
+        for k, resultado in zip(filas, lote):
+            inicio, fin, pedida = rangos[k]
+            resultados[k] = {'inicio': inicio, 'fin': fin, 'estacion': pedida, **resultado}
+    
+    return jsonify({'rangos': resultados})
+
+def _contadores_cache():
+    """Aciertos y fallos de cada caché, por estación cuando corresponde"""
+    aciertos, fallos = {}, {}
+    for nombre, funcion in (('serie_reducida', _serie_reducida), ('indice_pronostico', _indice_pronostico),
+                            ('indice_observado', _indice_observado), ('agregados', _agregados),
+                            ('verificacion', _verificacion)):
+        info = funcion.cache_info()
+        aciertos[(('cache', nombre),)] = info.hits
+        fallos[(('cache', nombre),)] = info.misses
+    fuentes = [('', fuentes_estacion())] + list(_fuentes_estaciones.items())
+    for estacion, (csv, armonico, compartido) in fuentes:
+        for nombre, cache in (('pronostico_csv', csv), ('dias_armonicos', armonico),
+                              ('pronostico_compartido', compartido)):
+            clave = (('cache', nombre), ('estacion', estacion))
+            aciertos[clave] = cache.aciertos
+            fallos[clave] = cache.fallos
+    return aciertos, fallos
+
+@app.route('/metrics')
+def get_metrics():
+    """Métricas en el formato de texto de Prometheus"""
+    aciertos, fallos = _contadores_cache()
+    with _lock_metricas:
+        latencias = dict(_latencias)
+        respuestas = dict(_respuestas)
+    texto = formato_prometheus(
+        {'api_latencia_segundos': latencias},
+        {'api_respuestas_total': respuestas,
+         'cache_aciertos_total': aciertos,
+         'cache_fallos_total': fallos})
+    return Response(texto, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/estaciones')
+def get_estaciones():
+    return jsonify({'estaciones': listar_estaciones()})
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,228 @@
+import json
+import os
+import numpy as np
+from ingesta import cargar_columnas
+from instrumentacion import etapa
+
+# Velocidades angulares (grados/hora), en orden de importancia típica
+VELOCIDADES = {
+    'M2': 28.9841042, 'S2': 30.0000000, 'K1': 15.0410686, 'O1': 13.9430356,
+    'N2': 28.4397295, 'P1': 14.9589314, 'K2': 30.0821373, 'Q1': 13.3986609,
+    'M4': 57.9682084, 'MS4': 58.9841042, 'MN4': 57.4238337, 'M6': 86.9523127,
+    '2N2': 27.8953548, 'MU2': 27.9682084, 'NU2': 28.5125831,
+    'Mf': 1.0980331, 'Mm': 0.5443747, 'Ssa': 0.0821373, 'Sa': 0.0410686,
+}
+
+# Constituyente cuyo factor nodal (f, u) se usa para cada uno: (base, potencia)
+NODAL = {
+    'M2': ('M2', 1), 'N2': ('M2', 1), '2N2': ('M2', 1), 'MU2': ('M2', 1), 'NU2': ('M2', 1),
+    'M4': ('M2', 2), 'MN4': ('M2', 2), 'MS4': ('M2', 1), 'M6': ('M2', 3),
+    'K1': ('K1', 1), 'O1': ('O1', 1), 'Q1': ('O1', 1), 'K2': ('K2', 1),
+    'Mf': ('Mf', 1), 'Mm': ('Mm', 1),
+}
+
+J2000 = np.datetime64('2000-01-01T12:00:00', 's')
+REFERENCIA = np.datetime64('2000-01-01T00:00:00', 's')
+SEGUNDOS_HORA = 3600.0
+
+
+def seleccionar_constituyentes(duracion_horas, criterio=1.0):
+    """
+    Criterio de Rayleigh: se descarta un constituyente si su frecuencia no
+    se separa lo suficiente (360/duración) de uno más importante ya elegido
+    """
+    minima = criterio * 360.0 / duracion_horas
+    elegidos = []
+    for nombre, velocidad in VELOCIDADES.items():
+        if velocidad < minima:
+            continue
+        if all(abs(velocidad - VELOCIDADES[e]) >= minima for e in elegidos):
+            elegidos.append(nombre)
+    return elegidos
+
+
+def _factores_nodales(horas):
+    """
+    Factores nodales f y correcciones de fase u (grados) por instante,
+    aproximaciones de Schureman en función del nodo lunar N
+    """
+    dias = (horas * SEGUNDOS_HORA + (REFERENCIA - J2000).astype(np.int64)) / 86400.0
+    N = np.radians(125.0445 - 0.05295377 * dias)
+    c1, c2, c3 = np.cos(N), np.cos(2 * N), np.cos(3 * N)
+    s1, s2, s3 = np.sin(N), np.sin(2 * N), np.sin(3 * N)
+    return {
+        'M2': (1.0004 - 0.0373 * c1 + 0.0002 * c2, -2.14 * s1),
+        'K1': (1.0060 + 0.1150 * c1 - 0.0088 * c2 + 0.0006 * c3, -8.86 * s1 + 0.68 * s2 - 0.07 * s3),
+        'O1': (1.0089 + 0.1871 * c1 - 0.0147 * c2 + 0.0014 * c3, 10.80 * s1 - 1.34 * s2 + 0.19 * s3),
+        'K2': (1.0241 + 0.2863 * c1 + 0.0083 * c2 - 0.0015 * c3, -17.74 * s1 + 0.68 * s2 - 0.04 * s3),
+        'Mf': (1.043 + 0.414 * c1, -23.7 * s1 + 2.7 * s2 - 0.4 * s3),
+        'Mm': (1.000 - 0.130 * c1, np.zeros_like(N)),
+    }
+
+
+def horas_desde_referencia(fechas):
+    return (np.asarray(fechas).astype('datetime64[s]') - REFERENCIA).astype(np.float64) / SEGUNDOS_HORA
+
+
+def matriz_diseño(horas, constituyentes):
+    """
+    Matriz (n x 1+2k): nivel medio y, por constituyente, f·cos(ωt+u) y
+    f·sin(ωt+u). Se arma completa con operaciones de arreglos.
+    """
+    horas = np.asarray(horas, dtype=np.float64)
+    velocidades = np.array([VELOCIDADES[c] for c in constituyentes])
+    fase = np.radians(np.outer(horas, velocidades))
+    f = np.ones_like(fase)
+    u = np.zeros_like(fase)
+
+    nodales = _factores_nodales(horas)
+    for j, nombre in enumerate(constituyentes):
+        if nombre in NODAL:
+            base, potencia = NODAL[nombre]
+            f_base, u_base = nodales[base]
+            f[:, j] = f_base ** potencia
+            u[:, j] = np.radians(u_base * potencia)
+
+    A = np.empty((len(horas), 1 + 2 * len(constituyentes)))
+    A[:, 0] = 1.0
+    A[:, 1::2] = f * np.cos(fase + u)
+    A[:, 2::2] = f * np.sin(fase + u)
+    return A
+
+
+def ajustar(fechas, series, constituyentes=None):
+    """
+    Ajusta constantes armónicas a varias series a la vez (matriz n x s,
+    una columna por sensor o estación, con NaN donde faltan datos).
+    Las ecuaciones normales de todas las series se arman y resuelven en
+    un solo lote. Retorna un dict con las constantes de cada columna.
+    """
+    horas = horas_desde_referencia(fechas)
+    Y = np.asarray(series, dtype=np.float64)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    if constituyentes is None:
+        constituyentes = seleccionar_constituyentes(horas.max() - horas.min())
+
+    A = matriz_diseño(horas, constituyentes)
+    M = (~np.isnan(Y)).astype(np.float64)
+    Y0 = np.where(M > 0, Y, 0.0)
+
+    # Ecuaciones normales por serie con su propia máscara de datos faltantes
+    G = np.einsum('ts,tp,tq->spq', M, A, A, optimize=True)
+    b = (A.T @ Y0).T
+    coeficientes = np.linalg.solve(G, b[..., None])[..., 0]
+
+    residuo = np.where(M > 0, Y - A @ coeficientes.T, np.nan)
+    return {
+        'constituyentes': list(constituyentes),
+        'coeficientes': coeficientes,
+        'rms_residuo': np.sqrt(np.nanmean(residuo ** 2, axis=0)),
+    }
+
+
+def predecir(constantes, fechas):
+    """Evalúa todas las series ajustadas en las fechas dadas (un producto matricial)"""
+    A = matriz_diseño(horas_desde_referencia(fechas), constantes['constituyentes'])
+    return A @ np.asarray(constantes['coeficientes']).T
+
+
+def amplitudes_fases(constantes):
+    """Amplitud y fase (grados, respecto de REFERENCIA) por constituyente y serie"""
+    c = np.asarray(constantes['coeficientes'])
+    a, b = c[:, 1::2], c[:, 2::2]
+    return np.hypot(a, b), np.degrees(np.arctan2(b, a)) % 360
+
+
+def guardar_constantes(constantes, nombres, ruta, horizonte=None):
+    """horizonte (inicio, fin) registra el tramo escrito en el CSV de pronóstico"""
+    amplitudes, fases = amplitudes_fases(constantes)
+    datos = {
+        'referencia': str(REFERENCIA),
+        'horizonte': None if horizonte is None else [str(np.datetime64(h, 's')) for h in horizonte],
+        'constituyentes': constantes['constituyentes'],
+        'series': {
+            nombre: {
+                'coeficientes': constantes['coeficientes'][i].tolist(),
+                'nivel_medio': float(constantes['coeficientes'][i][0]),
+                'amplitudes': amplitudes[i].tolist(),
+                'fases': fases[i].tolist(),
+                'rms_residuo': float(constantes['rms_residuo'][i]),
+            }
+            for i, nombre in enumerate(nombres)
+        },
+    }
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, indent=2)
+
+
+def cargar_constantes(ruta, nombres=None):
+    """Lee constantes guardadas; retorna (constantes, nombres de las series)"""
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    nombres = list(datos['series']) if nombres is None else list(nombres)
+    constantes = {
+        'constituyentes': datos['constituyentes'],
+        'coeficientes': np.array([datos['series'][n]['coeficientes'] for n in nombres]),
+        'rms_residuo': np.array([datos['series'][n]['rms_residuo'] for n in nombres]),
+        'horizonte': datos.get('horizonte'),
+    }
+    return constantes, nombres
+
+
+def main(archivo='valpoall.txt', sensores=('keller', 'vega'), dias_horizonte=365,
+         ruta_pronostico='resultados/pronostico_keller_futuro.csv',
+         ruta_constantes='resultados/constantes_armonicas.json', estacion=None):
+    """
+    Ajusta las constantes armónicas de los sensores de marea y escribe el
+    pronóstico horario desde el fin de las observaciones hasta
+    dias_horizonte días después. El horizonte depende sólo de los datos (no
+    de la fecha actual), así la etapa del pipeline que se salta por hash no
+    deja un pronóstico desactualizado; las fechas posteriores las evalúa la
+    API a partir de las constantes. Con estacion los datos se leen de los
+    fragmentos de esa estación en vez de archivo.
+    Retorna un string con los detalles del análisis
+    """
+    nombres_columnas = ['fecha', 'fecha_invalida'] + list(sensores)
+    with etapa('cargar_datos') as medicion:
+        if estacion is not None:
+            from estaciones import cargar_columnas_estacion
+            detalles = [f"Cargando {', '.join(sensores)} de la estación {estacion}..."]
+            columnas = cargar_columnas_estacion(estacion, nombres_columnas)
+        else:
+            detalles = [f"Cargando {', '.join(sensores)} de {archivo}..."]
+            columnas = cargar_columnas(archivo, nombres_columnas)
+        validas = ~np.asarray(columnas['fecha_invalida'])
+        fechas = np.asarray(columnas['fecha'])[validas]
+        series = np.column_stack([np.asarray(columnas[s])[validas] for s in sensores])
+        medicion.agregar_filas(len(fechas))
+
+    with etapa('ajuste', filas=len(fechas)):
+        constantes = ajustar(fechas, series)
+    detalles.append(f"Constituyentes ajustados: {', '.join(constantes['constituyentes'])}")
+    for sensor, rms in zip(sensores, constantes['rms_residuo']):
+        detalles.append(f"RMS del residuo {sensor}: {rms:.3f} m")
+
+    inicio = fechas.max().astype('datetime64[h]') + np.timedelta64(1, 'h')
+    fin = fechas.max().astype('datetime64[D]') + np.timedelta64(dias_horizonte, 'D')
+    fechas_futuras = np.arange(inicio, fin, np.timedelta64(1, 'h'))
+    with etapa('prediccion', filas=len(fechas_futuras)):
+        pronostico = predecir(constantes, fechas_futuras)
+
+    with etapa('escritura', filas=len(fechas_futuras)):
+        import pandas as pd
+        guardar_constantes(constantes, sensores, ruta_constantes, (fechas_futuras[0], fechas_futuras[-1]))
+        df = pd.DataFrame({'fecha': pd.DatetimeIndex(fechas_futuras).strftime('%Y-%m-%d %H:%M:%S')})
+        for i, sensor in enumerate(sensores):
+            df[f'{sensor}_pronostico'] = pronostico[:, i].round(4)
+        os.makedirs(os.path.dirname(ruta_pronostico) or '.', exist_ok=True)
+        df.to_csv(ruta_pronostico, index=False)
+    detalles.append(f"Pronóstico de {len(df)} horas guardado en {ruta_pronostico}")
+    detalles.append(f"Constantes armónicas guardadas en {ruta_constantes}")
+
+    return "\n".join(detalles)
+
+
+if __name__ == "__main__":
+    print(main())
@@ -0,0 +1,390 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+TAMAÑOS = [10_000, 100_000, 1_000_000]
+FILAS_POR_BLOQUE = 1_000_000
+# to_csv llama line_terminator al argumento antes de pandas 1.5 (requirements.txt
+# fija 1.3.3) y lineterminator desde entonces; pandas 2 eliminó el nombre antiguo
+_ARGUMENTO_TERMINADOR = ('lineterminator' if tuple(int(p) for p in pd.__version__.split('.')[:2]) >= (1, 5)
+                         else 'line_terminator')
+
+# Las fechas recorren 2000-2199 y luego se repiten (como varias series
+# concatenadas), para no salir del rango de datetime64[ns] con decenas de
+# millones de filas horarias
+INICIO = np.datetime64('2000-01-01T00')
+PERIODO_HORAS = int((np.datetime64('2200-01-01T00') - INICIO) // np.timedelta64(1, 'h'))
+
+# Componentes de marea (amplitud m, velocidad grados/hora, fase grados) parecidas a Valparaíso
+COMPONENTES = [(0.46, 28.9841042, 80.0), (0.15, 30.0, 100.0), (0.30, 15.0410686, 200.0), (0.20, 13.9430356, 170.0)]
+
+# Presupuesto de importación en segundos (nombre, módulo, presupuesto) del
+# servidor, del pipeline y del módulo que carga cada etapa en su proceso:
+# los contenedores y el cron arrancan un intérprete nuevo cada vez
+PRESUPUESTO_IMPORTACION = [
+    ('app', 'app', 0.35),
+    ('pipeline', 'ejecutar_analisis_completo', 0.30),
+    ('etapa sensores', 'rutina_sensores', 0.05),
+    ('etapa control_calidad', 'control_calidad', 0.25),
+    ('etapa preprocesamiento', 'agregados', 0.20),
+    ('etapa pronosticos', 'armonicos', 0.20),
+    ('etapa publicacion', 'compartido', 0.20),
+    ('etapa verificacion', 'verificacion', 0.20),
+]
+MAX_IMPORTACIONES_INFORME = 5
+
+# Texto de las columnas de fecha con ceros a la izquierda; el último valor es 'NAN'
+_DOS_DIGITOS = np.array([f'{i:02d}' for i in range(100)] + ['NAN'])
+_SIN_VALOR = len(_DOS_DIGITOS) - 1
+
+
+def _tramos(rng, n, cantidad, largo_medio):
+    """Máscara con `cantidad` tramos de largo geométrico (huecos de sensores o del registrador)"""
+    marcas = np.zeros(n + 1, dtype=np.int64)
+    inicios = rng.integers(0, n, cantidad)
+    fines = np.minimum(inicios + rng.geometric(1 / largo_medio, cantidad), n)
+    np.add.at(marcas, inicios, 1)
+    np.add.at(marcas, fines, -1)
+    return np.cumsum(marcas[:-1]) > 0
+
+
+def _bloque_sintetico(rng, horas, fraccion_huecos, fraccion_fechas_invalidas):
+    """DataFrame con el texto de un bloque de filas en el formato de valpoall.txt"""
+    n = len(horas)
+    fechas = INICIO + (horas % PERIODO_HORAS).astype('timedelta64[h]')
+
+    marea = 3.0 + sum(a * np.cos(np.radians(v * horas - f)) for a, v, f in COMPONENTES)
+    keller = marea + rng.normal(0, 0.02, n)
+    vega = marea + 1.87 + rng.normal(0, 0.03, n)
+    # Picos ocasionales para que haya valores extremos que detectar
+    picos = rng.random(n) < 0.001
+    vega[picos] += rng.normal(0, 1.5, picos.sum())
+
+    fase_diaria = 2 * np.pi * ((horas % 24) / 24 - 0.375)
+    fase_anual = 2 * np.pi * (horas % 8766) / 8766
+    temp_aire = 14 + 4 * np.sin(fase_diaria) + 3 * np.cos(fase_anual) + rng.normal(0, 0.5, n)
+    presion = 1014 + 4 * np.sin(2 * np.pi * horas / 120) + rng.normal(0, 0.3, n)
+    humedad = np.clip(80 - 15 * np.sin(fase_diaria) + rng.normal(0, 5, n), 20, 100)
+    temp_agua = 13 + 1.5 * np.cos(fase_anual) + rng.normal(0, 0.1, n)
+
+    sensores = {
+        'keller': keller.round(3), 'vega': vega.round(3), 'temp_aire': temp_aire.round(1),
+        'presion': presion.round(1), 'humedad': humedad.round(0), 'temp_agua': temp_agua.round(1),
+    }
+    for nombre in sensores:
+        faltan = _tramos(rng, n, max(1, int(n * fraccion_huecos / 24)), 24)
+        sensores[nombre][faltan] = np.nan
+
+    partes = [fechas.astype('datetime64[M]').astype(np.int64) % 12 + 1,
+              (fechas - fechas.astype('datetime64[M]')).astype('timedelta64[D]').astype(np.int64) + 1,
+              (fechas - fechas.astype('datetime64[D]')).astype(np.int64)]
+    # Fechas inválidas: mes 13, hora 24 o una columna de fecha 'NAN'
+    invalidas = np.flatnonzero(rng.random(n) < fraccion_fechas_invalidas)
+    tipo = rng.integers(0, 3, len(invalidas))
+    partes[0][invalidas[tipo == 0]] = 13
+    partes[2][invalidas[tipo == 1]] = 24
+    partes[1][invalidas[tipo == 2]] = _SIN_VALOR
+
+    df = pd.DataFrame({'año': fechas.astype('datetime64[Y]').astype(np.int64) + 1970})
+    for nombre, valores in zip(('mes', 'día', 'hora'), partes):
+        df[nombre] = _DOS_DIGITOS[valores]
+    for nombre, valores in sensores.items():
+        df[nombre] = pd.array(valores, dtype='Int64') if nombre == 'humedad' else valores
+    return df
+
+
+def generar_datos_sinteticos(ruta, filas, semilla=0, fraccion_huecos=0.02,
+                             fraccion_fechas_invalidas=0.0005, fraccion_sin_registro=0.01):
+    """
+    Escribe un archivo con el formato de valpoall.txt: marea horaria con
+    varias componentes y ruido, variables meteorológicas con ciclos diario y
+    anual, tramos sin dato por sensor ('NAN'), horas sin registro y algunas
+    fechas inválidas. Se genera por bloques para acotar la memoria.
+    """
+    rng = np.random.default_rng(semilla)
+    escritas = inicio = 0
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        while escritas < filas:
+            horas = np.arange(inicio, inicio + min(FILAS_POR_BLOQUE, 2 * (filas - escritas) + 100))
+            inicio = horas[-1] + 1
+            # Horas sin registro: se saltan tramos completos de la secuencia horaria
+            horas = horas[~_tramos(rng, len(horas), max(1, int(len(horas) * fraccion_sin_registro / 12)), 12)]
+            horas = horas[:filas - escritas]
+            df = _bloque_sintetico(rng, horas, fraccion_huecos, fraccion_fechas_invalidas)
+            df.to_csv(f, sep='\t', header=False, index=False, na_rep='NAN', **{_ARGUMENTO_TERMINADOR: '\r\n'})
+            escritas += len(df)
+    return escritas
+
+
+def medir(nombre, funcion, repeticiones=3, preparar=None):
+    """
+    Ejecuta funcion `repeticiones` veces y una vez más con tracemalloc para
+    la memoria pico (la traza hace más lento el código, por eso no se mide
+    el tiempo en esa pasada). preparar() se llama antes de cada ejecución.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+
+    if preparar:
+        preparar()
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    resultado = {
+        'caso': nombre,
+        'segundos': min(tiempos),
+        'primera': tiempos[0],
+        'media': float(np.mean(tiempos)),
+        'repeticiones': repeticiones,
+        'memoria_pico_mb': pico / 2**20,
+    }
+    print(f"  {nombre:<45} {resultado['segundos']:9.4f} s  {resultado['memoria_pico_mb']:9.1f} MB")
+    return resultado
+
+
+def _borrar(ruta):
+    if os.path.isdir(ruta):
+        shutil.rmtree(ruta)
+    elif os.path.exists(ruta):
+        os.remove(ruta)
+
+
+def medir_tamaño(filas, repeticiones=3, graficos=True):
+    """Genera un archivo de `filas` registros en un directorio temporal y mide cada caso"""
+    directorio = tempfile.mkdtemp(prefix='benchmark_')
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    try:
+        inicio = time.perf_counter()
+        generar_datos_sinteticos('valpoall.txt', filas)
+        print(f"\n{filas} filas ({os.path.getsize('valpoall.txt') / 2**20:.1f} MB, "
+              f"generadas en {time.perf_counter() - inicio:.1f} s)")
+        return _medir_casos(repeticiones, graficos)
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def _medir_casos(repeticiones, graficos):
+    # Los módulos usan rutas relativas: se importan y ejecutan en el directorio temporal
+    import control_calidad as cc
+    import armonicos
+    from ejecutar_analisis_completo import procesar_datos_para_pronosticos
+    from ingesta import ruta_cache
+
+    archivo = 'valpoall.txt'
+    casos = []
+    casos.append(medir('cargar_datos (sin caché)', lambda: cc.cargar_datos(archivo),
+                       repeticiones, preparar=lambda: _borrar(ruta_cache(archivo))))
+    casos.append(medir('cargar_datos', lambda: cc.cargar_datos(archivo), repeticiones))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = cc.cargar_datos(archivo)
+    resultado = cc.calcular_resultado_qc(df)
+    casos.append(medir('calcular_resultado_qc', lambda: cc.calcular_resultado_qc(df), repeticiones))
+    for funcion in (cc.analizar_datos_faltantes, cc.analizar_valores_extremos, cc.calcular_error_sensores):
+        casos.append(medir(funcion.__name__, lambda: funcion(df), repeticiones))
+    casos.append(medir('analizar_correlacion', lambda: cc.analizar_correlacion(df, graficar=False), repeticiones))
+    casos.append(medir('generar_graficos_control_sensores',
+                       lambda: cc.generar_graficos_control_sensores(df, graficar=False), repeticiones))
+
+    if graficos:
+        casos.append(medir('grafico Control_Calidad.png', lambda: cc.generar_graficos_control(df, resultado), repeticiones))
+        casos.append(medir('grafico Correlacion_Sensores.png',
+                           lambda: cc.analizar_correlacion(df, resultado), repeticiones))
+        casos.append(medir('grafico Graficos_Control_Sensores.png',
+                           lambda: cc.generar_graficos_control_sensores(df, resultado), repeticiones))
+        casos.append(medir('generar_graficos (paralelo)', lambda: cc.generar_graficos(df, resultado), repeticiones))
+
+    estado = 'datos_procesados/agregados.npz'
+    casos.append(medir('procesar_datos_para_pronosticos (completo)',
+                       lambda: procesar_datos_para_pronosticos(archivo, estado),
+                       repeticiones, preparar=lambda: _borrar(estado)))
+    casos.append(medir('procesar_datos_para_pronosticos (sin cambios)',
+                       lambda: procesar_datos_para_pronosticos(archivo, estado), repeticiones))
+    casos.append(medir('armonicos.main', lambda: armonicos.main(archivo), repeticiones))
+
+    from app import app
+    cliente = app.test_client()
+    for url in ('/api/pronostico', '/api/pronostico?max_puntos=1000', '/api/pronostico?formato=binario',
+                '/api/pronostico/hoy', '/api/pleamares', '/api/pleamares?serie=observado&desde=2000-01-01'):
+        def pedir(url=url):
+            respuesta = cliente.get(url)
+            if respuesta.status_code != 200:
+                raise RuntimeError(f"{url} respondió {respuesta.status_code}")
+        casos.append(medir(f'GET {url}', pedir, repeticiones))
+    return casos
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ejecutar(tamaños=TAMAÑOS, repeticiones=3, graficos=True, salida=None):
+    """Mide todos los casos para cada tamaño y guarda el resultado en JSON"""
+    commit = _commit()
+    salida = os.path.abspath(salida or os.path.join('reportes', f'benchmark_{commit or "sin_commit"}.json'))
+    # Sin el log del pipeline en la salida del benchmark
+    logging.disable(logging.CRITICAL)
+    resultados = []
+    for filas in tamaños:
+        for caso in medir_tamaño(filas, repeticiones, graficos):
+            resultados.append({'filas': filas, **caso})
+
+    reporte = {
+        'commit': commit,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'procesadores': os.cpu_count(),
+        'resultados': resultados,
+    }
+    os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {salida}")
+    return reporte
+
+
+def _leer_importtime(salida, modulo):
+    """
+    (segundos acumulados de modulo, {importación directa: segundos}) desde
+    la salida de -X importtime, donde cada módulo aparece después de los
+    que importa y la sangría indica la profundidad
+    """
+    directas = {}
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, nombre = linea[len('import time:'):].split('|')
+        profundidad = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        if profundidad == 1:
+            directas[nombre.strip()] = int(acumulado) / 1e6
+        elif profundidad == 0:
+            if nombre.strip() == modulo:
+                return int(acumulado) / 1e6, directas
+            directas = {}
+    raise RuntimeError(f"-X importtime no registró la importación de {modulo}")
+
+
+def medir_importacion(modulo, repeticiones=3):
+    """
+    Importa modulo en un intérprete nuevo con -X importtime. Retorna la
+    importación más rápida de las repeticiones (segundos acumulados y sus
+    importaciones directas más pesadas) y el arranque completo del proceso
+    """
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    mediciones = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        proceso = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+                                 capture_output=True, text=True, cwd=directorio)
+        arranque = time.perf_counter() - inicio
+        if proceso.returncode != 0:
+            raise RuntimeError(f"No se pudo importar {modulo}: {proceso.stderr.strip().splitlines()[-1]}")
+        mediciones.append(_leer_importtime(proceso.stderr, modulo) + (arranque,))
+
+    segundos, directas, _ = min(mediciones, key=lambda m: m[0])
+    pesadas = sorted(directas.items(), key=lambda d: d[1], reverse=True)[:MAX_IMPORTACIONES_INFORME]
+    return {
+        'segundos': segundos,
+        'arranque': min(m[2] for m in mediciones),
+        'importaciones': [{'modulo': nombre, 'segundos': t} for nombre, t in pesadas],
+    }
+
+
+def informe_importaciones(repeticiones=3, salida=None):
+    """
+    Mide la importación de app.py, del pipeline y de cada etapa contra
+    PRESUPUESTO_IMPORTACION y guarda el informe en JSON.
+    Retorna la cantidad de módulos que exceden su presupuesto.
+    """
+    commit = _commit()
+    salida = os.path.abspath(salida or os.path.join('reportes', f'importaciones_{commit or "sin_commit"}.json'))
+    resultados = []
+    for nombre, modulo, presupuesto in PRESUPUESTO_IMPORTACION:
+        medicion = medir_importacion(modulo, repeticiones)
+        excedido = medicion['segundos'] > presupuesto
+        resultados.append({'nombre': nombre, 'modulo': modulo, 'presupuesto': presupuesto,
+                           'excedido': excedido, **medicion})
+        pesadas = ', '.join(f"{i['modulo']} {i['segundos']:.3f}" for i in medicion['importaciones'])
+        print(f"  {nombre:<25} {medicion['segundos']:7.3f} s / {presupuesto:.2f} s "
+              f"(proceso {medicion['arranque']:.3f} s){'  EXCEDIDO' if excedido else ''}  [{pesadas}]")
+
+    os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump({'commit': commit, 'fecha': datetime.now().isoformat(timespec='seconds'),
+                   'python': sys.version.split()[0], 'resultados': resultados}, f, ensure_ascii=False, indent=2)
+    print(f"\nInforme de importaciones guardado en {salida}")
+    return sum(r['excedido'] for r in resultados)
+
+
+def comparar(ruta_base, ruta_actual, umbral=1.2):
+    """Imprime la razón de tiempos actual/base por caso y marca las regresiones"""
+    with open(ruta_base, encoding='utf-8') as f:
+        base = {(r['filas'], r['caso']): r for r in json.load(f)['resultados']}
+    with open(ruta_actual, encoding='utf-8') as f:
+        actual = json.load(f)['resultados']
+
+    regresiones = 0
+    for r in actual:
+        previo = base.get((r['filas'], r['caso']))
+        if previo is None:
+            continue
+        razon = r['segundos'] / previo['segundos'] if previo['segundos'] > 0 else float('inf')
+        marca = '  REGRESIÓN' if razon > umbral else ''
+        regresiones += razon > umbral
+        print(f"{r['filas']:>10} {r['caso']:<45} {previo['segundos']:9.4f} -> {r['segundos']:9.4f} s "
+              f"(x{razon:.2f}){marca}")
+    return regresiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark del control de calidad, pronósticos y API')
+    parser.add_argument('--tamaños', default=','.join(map(str, TAMAÑOS)),
+                        help='filas a generar, separadas por coma')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--sin-graficos', action='store_true', help='omite el renderizado de PNG')
+    parser.add_argument('--salida', help='archivo JSON de resultados')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'ACTUAL'),
+                        help='compara dos archivos de resultados en vez de medir')
+    parser.add_argument('--importaciones', action='store_true',
+                        help='mide el tiempo de importación contra el presupuesto en vez de medir los casos')
+    args = parser.parse_args()
+
+    if args.comparar:
+        sys.exit(1 if comparar(*args.comparar) else 0)
+    if args.importaciones:
+        sys.exit(1 if informe_importaciones(args.repeticiones, args.salida) else 0)
+    ejecutar([int(t) for t in args.tamaños.split(',')], args.repeticiones,
+             not args.sin_graficos, args.salida)
@@ -0,0 +1,225 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from compartido import ArchivoCompartido
+
+UN_DIA = np.timedelta64(1, 'D')
+UNA_HORA = np.timedelta64(1, 'h')
+# Rango máximo que se evalúa por consulta, y días por producto matricial:
+# la memoria de la evaluación queda acotada aunque el rango sea largo
+MAX_DIAS_RANGO = 3 * 366
+DIAS_POR_BLOQUE = 31
+
+
+class CachePronostico:
+    """
+    Mantiene en memoria el pronóstico de marea y lo recarga sólo cuando el
+    archivo cambia (mtime o tamaño). Las fechas se guardan como un índice
+    datetime64 ordenado para resolver rangos con búsqueda binaria.
+    """
+
+    def __init__(self, ruta, columna='keller_pronostico'):
+        self.ruta = ruta
+        self.columna = columna
+        # (firma, fechas, valores): se reemplaza de una vez para que los
+        # lectores concurrentes nunca vean un estado a medio actualizar
+        self._datos = (None, None, None)
+        self.aciertos = 0
+        self.fallos = 0
+
+    def firma(self):
+        """Identifica la versión del archivo por su mtime y tamaño"""
+        st = os.stat(self.ruta)
+        return (st.st_mtime_ns, st.st_size)
+
+    def obtener(self):
+        """Retorna (fechas, valores), recargando el CSV sólo si cambió"""
+        firma = self.firma()
+        if firma != self._datos[0]:
+            self._datos = (firma,) + self._cargar()
+            self.fallos += 1
+        else:
+            self.aciertos += 1
+        return self._datos[1], self._datos[2]
+
+    def _cargar(self):
+        import pandas as pd
+        df = pd.read_csv(self.ruta, usecols=['fecha', self.columna])
+        fechas = pd.to_datetime(df['fecha']).to_numpy(dtype='datetime64[ns]')
+        valores = df[self.columna].to_numpy(dtype=np.float64)
+
+        # El índice debe estar ordenado para usar searchsorted
+        if len(fechas) > 1 and (np.diff(fechas) < np.timedelta64(0)).any():
+            orden = np.argsort(fechas, kind='stable')
+            fechas, valores = fechas[orden], valores[orden]
+        return fechas, valores
+
+    def rango(self, fecha_inicio, fecha_fin):
+        """Retorna el tramo con fecha_inicio <= fecha <= fecha_fin"""
+        fechas, valores = self.obtener()
+        i = np.searchsorted(fechas, np.datetime64(fecha_inicio, 'ns'), side='left')
+        j = np.searchsorted(fechas, np.datetime64(fecha_fin, 'ns'), side='right')
+        return fechas[i:j], valores[i:j]
+
+    def dia(self, fecha):
+        """Retorna el tramo correspondiente al día calendario de fecha"""
+        fechas, valores = self.obtener()
+        inicio = np.datetime64(fecha, 'D')
+        i, j = np.searchsorted(fechas, np.array([inicio, inicio + UN_DIA], dtype='datetime64[ns]'))
+        return fechas[i:j], valores[i:j]
+
+
+class PronosticoArmonico:
+    """
+    Evalúa el pronóstico a pedido desde las constantes armónicas guardadas,
+    para cualquier rango de fechas. Cada día se calcula como un bloque
+    vectorizado y se guarda en un LRU acotado a max_dias bloques; al cambiar
+    el archivo de constantes los bloques anteriores dejan de usarse.
+    Ofrece la misma interfaz que CachePronostico.
+    """
+
+    def __init__(self, ruta, serie='keller', paso=UNA_HORA, max_dias=400):
+        self.ruta = ruta
+        self.serie = serie
+        self.paso = paso
+        self.max_dias = max_dias
+        self._constantes = (None, None)
+        self._bloques = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def firma(self):
+        """Identifica la versión de las constantes por su mtime y tamaño"""
+        st = os.stat(self.ruta)
+        return ('armonico', st.st_mtime_ns, st.st_size)
+
+    def _obtener_constantes(self):
+        firma = self.firma()
+        if firma != self._constantes[0]:
+            from armonicos import cargar_constantes
+            constantes, _ = cargar_constantes(self.ruta, [self.serie])
+            self._constantes = (firma, constantes)
+        return self._constantes
+
+    def _evaluar(self, constantes, dias):
+        """Evalúa varios días en un solo producto matricial; retorna un bloque por día"""
+        from armonicos import predecir
+        por_dia = int(UN_DIA // self.paso)
+        fechas = (dias.astype('datetime64[ns]')[:, None] +
+                  np.arange(por_dia) * self.paso.astype('timedelta64[ns]')).ravel()
+        valores = predecir(constantes, fechas)[:, 0].round(4)
+        return [(fechas[k:k + por_dia], valores[k:k + por_dia])
+                for k in range(0, len(fechas), por_dia)]
+
+    def _dias(self, dias):
+        """Bloques de los días pedidos, calculando juntos los que no están en caché"""
+        firma, constantes = self._obtener_constantes()
+        bloques = {}
+        with self._lock:
+            for dia in dias:
+                bloque = self._bloques.get((firma, dia))
+                if bloque is not None:
+                    self._bloques.move_to_end((firma, dia))
+                    bloques[dia] = bloque
+            self.aciertos += len(bloques)
+            self.fallos += len(dias) - len(bloques)
+
+        faltantes = np.array([d for d in dias if d not in bloques], dtype='datetime64[D]')
+        if len(faltantes):
+            nuevos = {}
+            for k in range(0, len(faltantes), DIAS_POR_BLOQUE):
+                tramo = faltantes[k:k + DIAS_POR_BLOQUE]
+                nuevos.update(zip(tramo.tolist(), self._evaluar(constantes, tramo)))
+            bloques.update(nuevos)
+            # Rangos más largos que el LRU se sirven sin desplazar los días populares
+            if len(nuevos) <= self.max_dias:
+                with self._lock:
+                    for dia, bloque in nuevos.items():
+                        self._bloques[(firma, dia)] = bloque
+                    while len(self._bloques) > self.max_dias:
+                        self._bloques.popitem(last=False)
+        return [bloques[d] for d in dias]
+
+    def rango(self, fecha_inicio, fecha_fin):
+        """Retorna el tramo con fecha_inicio <= fecha <= fecha_fin"""
+        inicio = np.datetime64(fecha_inicio, 'ns')
+        fin = np.datetime64(fecha_fin, 'ns')
+        if fin < inicio:
+            return np.array([], dtype='datetime64[ns]'), np.array([], dtype=np.float64)
+        dias = np.arange(inicio.astype('datetime64[D]'), fin.astype('datetime64[D]') + UN_DIA, UN_DIA)
+        bloques = self._dias(dias.tolist())
+        fechas = np.concatenate([b[0] for b in bloques])
+        valores = np.concatenate([b[1] for b in bloques])
+        i = np.searchsorted(fechas, inicio, side='left')
+        j = np.searchsorted(fechas, fin, side='right')
+        return fechas[i:j], valores[i:j]
+
+    def dia(self, fecha):
+        """Retorna el tramo correspondiente al día calendario de fecha"""
+        return self._dias([np.datetime64(fecha, 'D').item()])[0]
+
+    def obtener(self):
+        """Retorna (fechas, valores) del horizonte con que se generó el CSV de pronóstico"""
+        _, constantes = self._obtener_constantes()
+        if not constantes.get('horizonte'):
+            raise ValueError(f"{self.ruta} no registra el horizonte del pronóstico")
+        return self.rango(*constantes['horizonte'])
+
+
+class PronosticoCompartido:
+    """
+    Pronóstico publicado en un archivo mapeado en memoria (ver
+    compartido.publicar_pronostico): todos los procesos del servidor leen
+    las mismas páginas sin copiarlas. Los tramos fuera del horizonte
+    publicado se piden a respaldo (el PronosticoArmonico de las mismas
+    constantes). Ofrece la misma interfaz que CachePronostico.
+    """
+
+    def __init__(self, ruta, respaldo):
+        self.ruta = ruta
+        self.respaldo = respaldo
+        self.archivo = ArchivoCompartido(ruta)
+
+    @property
+    def aciertos(self):
+        return self.archivo.aciertos
+
+    @property
+    def fallos(self):
+        return self.archivo.fallos
+
+    def vigente(self):
+        """True si existe una publicación generada desde las constantes actuales"""
+        return self.archivo.al_dia_con(self.respaldo.ruta)
+
+    def firma(self):
+        return self.archivo.firma()
+
+    def obtener(self):
+        arrays, _ = self.archivo.adjuntar()
+        return arrays['fecha'], arrays['valor']
+
+    def _cubre(self, fechas, inicio, fin):
+        return len(fechas) > 0 and fechas[0] <= inicio and fin <= fechas[-1]
+
+    def rango(self, fecha_inicio, fecha_fin):
+        """Retorna el tramo con fecha_inicio <= fecha <= fecha_fin"""
+        fechas, valores = self.obtener()
+        inicio = np.datetime64(fecha_inicio, 'ns')
+        fin = np.datetime64(fecha_fin, 'ns')
+        if not self._cubre(fechas, inicio, fin):
+            return self.respaldo.rango(inicio, fin)
+        i = np.searchsorted(fechas, inicio, side='left')
+        j = np.searchsorted(fechas, fin, side='right')
+        return fechas[i:j], valores[i:j]
+
+    def dia(self, fecha):
+        """Retorna el tramo correspondiente al día calendario de fecha"""
+        fechas, valores = self.obtener()
+        inicio = np.datetime64(fecha, 'D').astype('datetime64[ns]')
+        if not self._cubre(fechas, inicio, inicio + UN_DIA - self.respaldo.paso):
+            return self.respaldo.dia(fecha)
+        i, j = np.searchsorted(fechas, np.array([inicio, inicio + UN_DIA], dtype='datetime64[ns]'))
+        return fechas[i:j], valores[i:j]
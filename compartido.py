@@ -0,0 +1,171 @@
+import contextlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import numpy as np
+from ingesta import cargar_columnas, compactar, hash_archivo, PREFIJO_TEMPORAL, SENSORES
+from control_movil import detectar
+from estaciones import archivo_estacion, cargar_columnas_estacion
+
+# Formato del archivo: MAGICO, largo de la cabecera (uint64 little-endian),
+# cabecera JSON con dtype, forma y posición de cada array, y los datos de
+# cada array alineados a ALINEACION bytes
+MAGICO = b'VALPOMM1'
+ALINEACION = 64
+DIRECTORIO_COMPARTIDO = 'datos_compartidos'
+
+# Bits de 'banderas' en las observaciones publicadas: bit i = pico en
+# SENSORES[i]; luego deriva Keller - Vega por EWMA y por CUSUM
+BIT_DERIVA_EWMA = 1 << 6
+BIT_DERIVA_CUSUM = 1 << 7
+
+
+def _alinear(posicion):
+    return -(-posicion // ALINEACION) * ALINEACION
+
+
+def publicar(ruta, arrays, meta=None):
+    """
+    Escribe los arrays en un solo archivo listo para mapear en memoria y lo
+    reemplaza de forma atómica: los procesos que tengan mapeada la versión
+    anterior la siguen leyendo hasta que se vuelvan a adjuntar. Cada
+    escritor usa su propio temporal, así dos procesos que publican a la vez
+    nunca mezclan sus bytes.
+    """
+    arrays = {nombre: np.ascontiguousarray(valores) for nombre, valores in arrays.items()}
+    descripcion, posicion = {}, 0
+    for nombre, valores in arrays.items():
+        descripcion[nombre] = {'dtype': valores.dtype.str, 'forma': list(valores.shape), 'posicion': posicion}
+        posicion = _alinear(posicion + valores.nbytes)
+    cabecera = json.dumps({'meta': meta or {}, 'arrays': descripcion}).encode('utf-8')
+    inicio_datos = _alinear(len(MAGICO) + 8 + len(cabecera))
+
+    directorio = os.path.dirname(ruta) or '.'
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=PREFIJO_TEMPORAL)
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(MAGICO + struct.pack('<Q', len(cabecera)) + cabecera)
+            for nombre, valores in arrays.items():
+                f.seek(inicio_datos + descripcion[nombre]['posicion'])
+                f.write(valores.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temporal)
+        raise
+
+
+class ArchivoCompartido:
+    """
+    Vista de sólo lectura de un archivo escrito por publicar. Los arrays
+    apuntan directamente al mapeo: todos los procesos que lo adjuntan
+    comparten las mismas páginas del caché del sistema operativo en lugar
+    de tener cada uno su copia. Se vuelve a mapear sólo si el archivo cambió.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        # (firma, arrays, meta): se reemplaza de una vez, como en CachePronostico
+        self._datos = (None, None, None)
+        self._lock = threading.Lock()
+        self._vigencia = (None, False)
+        self.aciertos = 0
+        self.fallos = 0
+
+    def firma(self):
+        st = os.stat(self.ruta)
+        return ('compartido', st.st_mtime_ns, st.st_size)
+
+    def adjuntar(self):
+        """Retorna (arrays, meta) de la versión vigente del archivo"""
+        firma = self.firma()
+        if firma == self._datos[0]:
+            self.aciertos += 1
+            return self._datos[1], self._datos[2]
+        with self._lock:
+            if firma != self._datos[0]:
+                self._datos = (firma,) + self._mapear()
+                self.fallos += 1
+        return self._datos[1], self._datos[2]
+
+    def al_dia_con(self, origen):
+        """
+        True si la versión publicada se generó desde el contenido actual de
+        origen (hash guardado en meta['hash_origen']). El hash sólo se
+        recalcula cuando cambia la publicación o el mtime/tamaño de origen.
+        """
+        try:
+            _, meta = self.adjuntar()
+            st = os.stat(origen)
+        except (OSError, ValueError):
+            return False
+        clave = (self._datos[0], origen, st.st_mtime_ns, st.st_size)
+        if self._vigencia[0] != clave:
+            self._vigencia = (clave, meta.get('hash_origen') == hash_archivo(origen))
+        return self._vigencia[1]
+
+    def _mapear(self):
+        with open(self.ruta, 'rb') as f:
+            # El mapeo sigue válido después de cerrar el archivo
+            mapeo = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapeo[:len(MAGICO)] != MAGICO:
+            raise ValueError(f"{self.ruta} no es un archivo publicado")
+        largo, = struct.unpack_from('<Q', mapeo, len(MAGICO))
+        cabecera = json.loads(mapeo[len(MAGICO) + 8:len(MAGICO) + 8 + largo].decode('utf-8'))
+        inicio_datos = _alinear(len(MAGICO) + 8 + largo)
+        arrays = {}
+        for nombre, d in cabecera['arrays'].items():
+            dtype = np.dtype(d['dtype'])
+            cantidad = int(np.prod(d['forma']))
+            arrays[nombre] = np.frombuffer(mapeo, dtype=dtype, count=cantidad,
+                                           offset=inicio_datos + d['posicion']).reshape(d['forma'])
+        return arrays, cabecera['meta']
+
+
+def ruta_publicada(nombre, estacion=None):
+    """datos_compartidos/[<estacion>/]<nombre>.bin"""
+    return os.path.join(DIRECTORIO_COMPARTIDO, *([estacion] if estacion else []), nombre + '.bin')
+
+
+def publicar_observaciones(archivo='valpoall.txt', estacion=None):
+    """
+    Publica las observaciones de archivo (o de la estación, si se indica)
+    con el esquema compacto (ver ingesta.compactar) y las banderas del
+    control móvil de picos y deriva
+    """
+    if estacion is None:
+        columnas = cargar_columnas(archivo)
+    else:
+        archivo = archivo_estacion(estacion)
+        columnas = cargar_columnas_estacion(estacion)
+
+    resultado = detectar(np.column_stack([columnas[s] for s in SENSORES]))
+    banderas = (resultado['pico'].astype(np.uint8) << np.arange(len(SENSORES), dtype=np.uint8)).sum(
+        axis=1, dtype=np.uint8)
+    banderas[resultado['deriva_ewma']] |= BIT_DERIVA_EWMA
+    banderas[resultado['deriva_cusum']] |= BIT_DERIVA_CUSUM
+
+    ruta = ruta_publicada('observaciones', estacion)
+    publicar(ruta, compactar(columnas, banderas), {'hash_origen': hash_archivo(archivo)})
+    return ruta
+
+
+def publicar_pronostico(ruta_constantes='resultados/constantes_armonicas.json', estacion=None):
+    """
+    Publica el pronóstico del horizonte registrado en las constantes
+    armónicas. El hash de las constantes queda en los metadatos para
+    reconocer una publicación desactualizada (ver al_dia_con).
+    """
+    # Import local: cache_pronostico importa este módulo
+    from cache_pronostico import PronosticoArmonico
+    fuente = PronosticoArmonico(ruta_constantes)
+    fechas, valores = fuente.obtener()
+    ruta = ruta_publicada('pronostico', estacion)
+    publicar(ruta, {'fecha': fechas, 'valor': valores}, {'hash_origen': hash_archivo(ruta_constantes)})
+    return ruta
@@ -1,72 +1,150 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import pandas as pd
-from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
-from scipy import stats
+from ingesta import cargar_valpoall, LectorIncremental, cargar_estado, guardar_estado, SENSORES
+from estaciones import archivo_estacion, cargar_estacion, directorio_resultados, validar_estacion
+from estadisticas import AcumuladorSensor, AcumuladorPar, kernel_qc
+import graficos_calidad
+from instrumentacion import etapa
+from control_movil import ControlMovil, detectar
 
-def cargar_datos(archivo):
-    """Carga los datos del archivo y los convierte a DataFrame"""
+def cargar_datos(archivo, estacion=None):
+    """Carga los datos del archivo (o de los fragmentos de la estación) y los convierte a DataFrame"""
     try:
-        data = np.loadtxt(archivo)
-        df = pd.DataFrame({
-            'año': data[:, 0].astype(int),
-            'mes': data[:, 1].astype(int),
-            'día': data[:, 2].astype(int),
-            'hora': data[:, 3].astype(int),
-            'keller': data[:, 4],
-            'vega': data[:, 5],
-            'temp_aire': data[:, 6],
-            'presion': data[:, 7],
-            'humedad': data[:, 8],
-            'temp_agua': data[:, 9]
-        })
+        if estacion is not None:
+            df, fechas_invalidas = cargar_estacion(estacion)
+        else:
+            df, fechas_invalidas = cargar_valpoall(archivo)
         
-        # Crear fechas manualmente
-        fechas = []
-        for _, row in df.iterrows():
-            try:
-                fecha = datetime(
-                    year=int(row['año']),
-                    month=int(row['mes']),
-                    day=int(row['día']),
-                    hour=int(row['hora'])
-                )
-                fechas.append(fecha)
-            except ValueError as e:
-                print(f"Error en fecha: {row['año']}-{row['mes']}-{row['día']} {row['hora']}:00")
-                fechas.append(pd.NaT)
-        
-        df['fecha'] = fechas
+        # Las fechas inválidas quedan como NaT; se informa un único resumen
+        n_invalidas = int(fechas_invalidas.sum())
+        if n_invalidas > 0:
+            print(f"Fechas inválidas: {n_invalidas} registros (filas {np.flatnonzero(fechas_invalidas)[:5].tolist()}...)")
         return df
     except Exception as e:
         print(f"Error al cargar el archivo: {e}")
         return None
 
-def analizar_datos_faltantes(df):
+def calcular_resultado_qc(df):
+    """Ejecuta el kernel de control de calidad sobre la matriz de sensores"""
+    return kernel_qc(df[SENSORES].to_numpy(dtype=np.float64))
+
+def resultado_desde_acumuladores(acumuladores, df=None, filas=None):
+    """
+    Arma un resultado con la misma forma que kernel_qc a partir de los
+    acumuladores incrementales; sólo la máscara de extremos usa los datos.
+    Sin df se indica el total de filas y 'extremos' queda en None.
+    """
+    limites = np.array([acumuladores[s].limites_iqr() for s in SENSORES])
+    par, dif = acumuladores['keller_vega'], acumuladores['diferencia']
+    desviacion_x, desviacion_y = par.desviaciones()
+    if df is not None:
+        X = df[SENSORES].to_numpy(dtype=np.float64)
+        filas, faltantes = len(X), np.isnan(X).sum(axis=0)
+        extremos = (X < limites[:, 0]) | (X > limites[:, 1])
+    else:
+        faltantes, extremos = np.array([filas - acumuladores[s].n for s in SENSORES]), None
+    return {
+        'n': filas,
+        'faltantes': faltantes,
+        'media': np.array([acumuladores[s].media for s in SENSORES]),
+        'desviacion': np.array([acumuladores[s].desviacion for s in SENSORES]),
+        'limite_inferior': limites[:, 0],
+        'limite_superior': limites[:, 1],
+        'extremos': extremos,
+        'regresion': {
+            'n': par.n, 'r': par.correlacion, 'pendiente': par.pendiente,
+            'intercepto': par.intercepto, 'error_estandar': par.error_estandar,
+            'media_x': par.media_x, 'media_y': par.media_y,
+            'desviacion_x': desviacion_x, 'desviacion_y': desviacion_y,
+        },
+        'diferencia': {
+            'n': dif.n, 'media': dif.media, 'desviacion': dif.desviacion,
+            'minimo': dif.minimo, 'maximo': dif.maximo, 'rmse': dif.rms,
+        },
+    }
+
+def analizar_datos_faltantes(df, resultado=None):
     """Analiza y reporta datos faltantes"""
-    faltantes = df.isnull().sum()
-    porcentaje_faltantes = (faltantes / len(df)) * 100
+    if resultado is None:
+        resultado = calcular_resultado_qc(df)
+    faltantes = dict(zip(SENSORES, resultado['faltantes']))
+    faltantes['fecha'] = int(df['fecha'].isna().sum())
     
     print("\n=== ANÁLISIS DE DATOS FALTANTES ===")
     for col in df.columns:
-        if faltantes[col] > 0:
-            print(f"{col}: {faltantes[col]} datos faltantes ({porcentaje_faltantes[col]:.2f}%)")
+        if faltantes.get(col, 0) > 0:
+            print(f"{col}: {faltantes[col]} datos faltantes ({faltantes[col] / len(df) * 100:.2f}%)")
 
-def analizar_valores_extremos(df):
+def crear_acumuladores():
+    """Un acumulador por sensor, otro para la diferencia y otro para el par Keller-Vega"""
+    acumuladores = {sensor: AcumuladorSensor() for sensor in SENSORES + ['diferencia']}
+    acumuladores['keller_vega'] = AcumuladorPar()
+    return acumuladores
+
+def actualizar_acumuladores(acumuladores, bloque):
+    """Incorpora un bloque de datos (dict o DataFrame con las columnas de sensores)"""
+    for sensor in SENSORES:
+        acumuladores[sensor].actualizar_lote(bloque[sensor])
+    acumuladores['diferencia'].actualizar_lote(np.asarray(bloque['keller']) - np.asarray(bloque['vega']))
+    acumuladores['keller_vega'].actualizar_lote(bloque['keller'], bloque['vega'])
+
+def calcular_acumuladores(df):
+    """Construye los acumuladores a partir de un DataFrame completo"""
+    acumuladores = crear_acumuladores()
+    actualizar_acumuladores(acumuladores, df)
+    return acumuladores
+
+def _serializar_acumuladores(acumuladores):
+    return {nombre: acumulador.a_dict() for nombre, acumulador in acumuladores.items()}
+
+def _deserializar_acumuladores(datos):
+    acumuladores = {nombre: AcumuladorSensor.desde_dict(datos[nombre])
+                    for nombre in SENSORES + ['diferencia']}
+    acumuladores['keller_vega'] = AcumuladorPar.desde_dict(datos['keller_vega'])
+    return acumuladores
+
+def actualizar_estadisticas_incrementales(archivo='valpoall.txt',
+                                          ruta_estado='datos_procesados/estadisticas_incrementales.json'):
+    """
+    Actualiza los acumuladores de estadísticas leyendo sólo las líneas
+    agregadas al archivo desde la última ejecución
+    Retorna (acumuladores, filas totales, filas nuevas)
+    """
+    estado = cargar_estado(ruta_estado) or {}
+    lector = LectorIncremental(archivo, estado.get('lector'))
+    bloques = lector.bloques()
+    
+    if 'acumuladores' in estado and not lector.reiniciado:
+        acumuladores = _deserializar_acumuladores(estado['acumuladores'])
+        filas = estado.get('filas', 0)
+    else:
+        acumuladores = crear_acumuladores()
+        filas = 0
+    
+    filas_nuevas = 0
+    for bloque in bloques:
+        filas_nuevas += len(bloque['keller'])
+        actualizar_acumuladores(acumuladores, bloque)
+    filas += filas_nuevas
+    
+    guardar_estado(ruta_estado, {'lector': lector.estado, 'filas': filas,
+                                 'acumuladores': _serializar_acumuladores(acumuladores)})
+    print(f"Estadísticas actualizadas con {filas_nuevas} registros nuevos")
+    return acumuladores, filas, filas_nuevas
+
+def analizar_valores_extremos(df, resultado=None):
     """Analiza valores extremos usando el método IQR"""
     print("\n=== ANÁLISIS DE VALORES EXTREMOS ===")
     
-    sensores = ['keller', 'vega', 'temp_aire', 'presion', 'humedad', 'temp_agua']
-    for sensor in sensores:
-        Q1 = df[sensor].quantile(0.25)
-        Q3 = df[sensor].quantile(0.75)
-        IQR = Q3 - Q1
-        
-        limite_inferior = Q1 - 1.5 * IQR
-        limite_superior = Q3 + 1.5 * IQR
-        
-        valores_extremos = df[(df[sensor] < limite_inferior) | (df[sensor] > limite_superior)][sensor]
+    if resultado is None:
+        resultado = calcular_resultado_qc(df)
+    
+    for i, sensor in enumerate(SENSORES):
+        limite_inferior = resultado['limite_inferior'][i]
+        limite_superior = resultado['limite_superior'][i]
+        valores_extremos = df[sensor][resultado['extremos'][:, i]]
         
         print(f"\n{sensor.upper()}:")
         print(f"Rango normal: [{limite_inferior:.2f}, {limite_superior:.2f}]")
@@ -75,212 +153,246 @@ def analizar_valores_extremos(df):
             print("Primeros 5 valores extremos:")
             print(valores_extremos.head())
 
-def calcular_error_sensores(df):
+def actualizar_control_movil(archivo='valpoall.txt',
+                             ruta_estado='datos_procesados/control_movil.json'):
+    """
+    Continúa el control móvil (picos y deriva) con las líneas agregadas al
+    archivo desde la última ejecución. Retorna las banderas de las filas
+    nuevas ya definitivas (ver ControlMovil.actualizar)
+    """
+    estado = cargar_estado(ruta_estado) or {}
+    lector = LectorIncremental(archivo, estado.get('lector'))
+    bloques = lector.bloques()
+    control = ControlMovil(None if lector.reiniciado else estado.get('control'))
+    
+    partes = [control.actualizar(np.column_stack([bloque[s] for s in SENSORES]))
+              for bloque in bloques]
+    
+    guardar_estado(ruta_estado, {'lector': lector.estado, 'control': control.estado})
+    if not partes:
+        return control.actualizar(np.empty((0, len(SENSORES))))
+    banderas = {k: np.concatenate([p[k] for p in partes]) for k in partes[0] if k not in ('desde', 'hasta')}
+    banderas['desde'], banderas['hasta'] = partes[0]['desde'], partes[-1]['hasta']
+    return banderas
+
+def analizar_picos_y_deriva(df, banderas=None):
+    """
+    Picos por sensor (mediana y MAD móviles) y deriva Keller - Vega (EWMA
+    y CUSUM). banderas permite informar un resultado ya calculado, p. ej.
+    el de actualizar_control_movil; si no, se calcula sobre df completo.
+    Sin df la deriva se ubica por número de fila en vez de fecha.
+    """
+    print("\n=== PICOS Y DERIVA (VENTANAS MÓVILES) ===")
+    
+    if banderas is None:
+        banderas = detectar(df[SENSORES].to_numpy())
+    
+    print(f"Filas evaluadas: {banderas['hasta'] - banderas['desde']}")
+    for i, sensor in enumerate(SENSORES):
+        print(f"{sensor}: {int(banderas['pico'][:, i].sum())} picos")
+    for nombre in ('deriva_ewma', 'deriva_cusum'):
+        marcadas = np.flatnonzero(banderas[nombre])
+        print(f"Deriva Keller - Vega ({nombre.split('_')[1].upper()}): {len(marcadas)} registros", end='')
+        if len(marcadas) and df is not None:
+            print(f", desde {df['fecha'].iloc[banderas['desde'] + marcadas[0]]}")
+        else:
+            print(f", desde la fila {banderas['desde'] + marcadas[0]}" if len(marcadas) else '')
+    return banderas
+
+def calcular_error_sensores(df, resultado=None):
     """Calcula el error entre los sensores de marea"""
     print("\n=== ANÁLISIS DE ERROR ENTRE SENSORES DE MAREA ===")
     
-    # Calcular diferencia entre sensores
-    df['diferencia'] = df['keller'] - df['vega']
+    if resultado is None:
+        resultado = calcular_resultado_qc(df)
+    diferencia = resultado['diferencia']
     
     # Estadísticas de la diferencia
     print("\nEstadísticas de la diferencia Keller - Vega:")
-    print(f"Media: {df['diferencia'].mean():.3f} m")
-    print(f"Desviación estándar: {df['diferencia'].std():.3f} m")
-    print(f"Máximo: {df['diferencia'].max():.3f} m")
-    print(f"Mínimo: {df['diferencia'].min():.3f} m")
+    print(f"Media: {diferencia['media']:.3f} m")
+    print(f"Desviación estándar: {diferencia['desviacion']:.3f} m")
+    print(f"Máximo: {diferencia['maximo']:.3f} m")
+    print(f"Mínimo: {diferencia['minimo']:.3f} m")
     
     # Calcular RMSE
-    rmse = np.sqrt(np.mean(df['diferencia']**2))
-    print(f"RMSE: {rmse:.3f} m")
+    print(f"RMSE: {diferencia['rmse']:.3f} m")
 
-def analizar_correlacion(df):
+def analizar_correlacion(df, resultado=None, graficar=True):
     """Analiza la correlación entre los sensores Vega y Keller"""
     print("\n=== ANÁLISIS DE CORRELACIÓN ENTRE SENSORES ===")
     
-    # Eliminar filas donde falten datos en cualquiera de los sensores
-    df_clean = df.dropna(subset=['keller', 'vega'])
+    if resultado is None:
+        resultado = calcular_resultado_qc(df)
+    regresion = resultado['regresion']
     
-    # Calcular correlación
-    corr = df_clean['keller'].corr(df_clean['vega'])
+    corr = regresion['r']
     r_squared = corr ** 2
     
-    # Realizar regresión lineal
-    slope, intercept, r_value, p_value, std_err = stats.linregress(df_clean['keller'], df_clean['vega'])
-    
     print(f"\nCoeficiente de correlación (r): {corr:.4f}")
     print(f"Coeficiente de determinación (R²): {r_squared:.4f}")
-    print(f"Pendiente de la regresión: {slope:.4f}")
-    print(f"Intercepto: {intercept:.4f}")
-    print(f"Error estándar: {std_err:.4f}")
+    print(f"Pendiente de la regresión: {regresion['pendiente']:.4f}")
+    print(f"Intercepto: {regresion['intercepto']:.4f}")
+    print(f"Error estándar: {regresion['error_estandar']:.4f}")
     
     # Crear gráfico de correlación
-    plt.figure(figsize=(10, 8))
-    plt.scatter(df_clean['keller'], df_clean['vega'], alpha=0.5)
-    
-    # Añadir línea de regresión
-    x = np.array([df_clean['keller'].min(), df_clean['keller'].max()])
-    y = slope * x + intercept
-    plt.plot(x, y, 'r', label=f'y = {slope:.4f}x + {intercept:.4f}')
-    
-    plt.xlabel('Sensor Keller (m)')
-    plt.ylabel('Sensor Vega (m)')
-    plt.title('Correlación entre Sensores Keller y Vega')
-    plt.grid(True)
-    plt.legend()
-    
-    # Añadir texto con estadísticas
-    plt.text(0.05, 0.95, f'R² = {r_squared:.4f}\nr = {corr:.4f}', 
-             transform=plt.gca().transAxes, 
-             bbox=dict(facecolor='white', alpha=0.8))
-    
-    plt.savefig('Correlacion_Sensores.png')
-    plt.close()
+    if graficar:
+        _generar(df, resultado, 'Correlacion_Sensores.png')
+
+def _generar(df, resultado, nombre, max_puntos=graficos_calidad.MAX_PUNTOS):
+    """Renderiza en este proceso sólo el gráfico indicado"""
+    graficos = graficos_calidad.preparar_graficos(df, resultado, max_puntos=max_puntos, solo={nombre})
+    graficos_calidad.renderizar(graficos, paralelo=False)
 
-def generar_graficos_control(df):
+def generar_graficos_control(df, resultado=None, max_puntos=graficos_calidad.MAX_PUNTOS):
     """Genera gráficos de control de calidad"""
-    # Crear figura con subplots
-    fig, axes = plt.subplots(3, 2, figsize=(15, 12))
-    fig.suptitle('Control de Calidad de Datos', fontsize=16)
-    
-    # Gráfico de diferencias entre sensores
-    axes[0,0].plot(df['fecha'], df['diferencia'])
-    axes[0,0].set_title('Diferencia Keller - Vega')
-    axes[0,0].set_ylabel('Diferencia (m)')
-    axes[0,0].grid(True)
-    
-    # Histograma de diferencias
-    axes[0,1].hist(df['diferencia'], bins=50)
-    axes[0,1].set_title('Distribución de Diferencias')
-    axes[0,1].set_xlabel('Diferencia (m)')
-    axes[0,1].grid(True)
-    
-    # Boxplot de sensores
-    axes[1,0].boxplot([df['keller'], df['vega']], labels=['Keller', 'Vega'])
-    axes[1,0].set_title('Boxplot Sensores de Marea')
-    axes[1,0].set_ylabel('Altura (m)')
-    axes[1,0].grid(True)
-    
-    # Gráfico de dispersión
-    axes[1,1].scatter(df['keller'], df['vega'], alpha=0.5)
-    axes[1,1].set_title('Keller vs Vega')
-    axes[1,1].set_xlabel('Keller (m)')
-    axes[1,1].set_ylabel('Vega (m)')
-    axes[1,1].grid(True)
-    
-    # Gráfico de temperatura
-    axes[2,0].plot(df['fecha'], df['temp_aire'], label='Aire')
-    axes[2,0].plot(df['fecha'], df['temp_agua'], label='Agua')
-    axes[2,0].set_title('Temperaturas')
-    axes[2,0].set_ylabel('Temperatura (°C)')
-    axes[2,0].legend()
-    axes[2,0].grid(True)
-    
-    # Gráfico de presión y humedad
-    ax2 = axes[2,1].twinx()
-    axes[2,1].plot(df['fecha'], df['presion'], 'b-', label='Presión')
-    ax2.plot(df['fecha'], df['humedad'], 'r-', label='Humedad')
-    axes[2,1].set_title('Presión y Humedad')
-    axes[2,1].set_ylabel('Presión (mbar)')
-    ax2.set_ylabel('Humedad (%)')
-    axes[2,1].legend(loc='upper left')
-    ax2.legend(loc='upper right')
-    axes[2,1].grid(True)
-    
-    plt.tight_layout()
-    plt.savefig('Control_Calidad.png')
-    plt.close()
+    if resultado is None:
+        resultado = calcular_resultado_qc(df)
+    _generar(df, resultado, 'Control_Calidad.png', max_puntos)
 
-def generar_graficos_control_sensores(df):
+def generar_graficos_control_sensores(df, resultado=None, graficar=True):
     """Genera gráficos de control para los sensores Vega y Keller"""
     print("\n=== GENERANDO GRÁFICOS DE CONTROL ===")
     
-    # Eliminar filas donde falten datos en cualquiera de los sensores
-    df_clean = df.dropna(subset=['keller', 'vega'])
-    
-    # Configurar subplots
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 10))
-    fig.suptitle('Gráficos de Control de Sensores', fontsize=16)
-    
-    # Calcular límites de control para Keller
-    keller_mean = df_clean['keller'].mean()
-    keller_std = df_clean['keller'].std()
-    keller_ucl = keller_mean + 3 * keller_std
-    keller_lcl = keller_mean - 3 * keller_std
-    
-    # Gráfico de control para Keller
-    ax1.plot(df_clean['fecha'], df_clean['keller'], 'b-', label='Mediciones', alpha=0.6)
-    ax1.axhline(y=keller_mean, color='g', linestyle='-', label='Media')
-    ax1.axhline(y=keller_ucl, color='r', linestyle='--', label='UCL/LCL (±3σ)')
-    ax1.axhline(y=keller_lcl, color='r', linestyle='--')
-    ax1.set_title('Gráfico de Control - Sensor Keller')
-    ax1.set_ylabel('Altura (m)')
-    ax1.grid(True)
-    ax1.legend()
-    
-    # Calcular límites de control para Vega
-    vega_mean = df_clean['vega'].mean()
-    vega_std = df_clean['vega'].std()
-    vega_ucl = vega_mean + 3 * vega_std
-    vega_lcl = vega_mean - 3 * vega_std
-    
-    # Gráfico de control para Vega
-    ax2.plot(df_clean['fecha'], df_clean['vega'], 'b-', label='Mediciones', alpha=0.6)
-    ax2.axhline(y=vega_mean, color='g', linestyle='-', label='Media')
-    ax2.axhline(y=vega_ucl, color='r', linestyle='--', label='UCL/LCL (±3σ)')
-    ax2.axhline(y=vega_lcl, color='r', linestyle='--')
-    ax2.set_title('Gráfico de Control - Sensor Vega')
-    ax2.set_ylabel('Altura (m)')
-    ax2.set_xlabel('Fecha')
-    ax2.grid(True)
-    ax2.legend()
-    
-    plt.tight_layout()
-    plt.savefig('Graficos_Control_Sensores.png')
-    plt.close()
+    # Medias y desviaciones sobre las filas pareadas
+    if resultado is None:
+        resultado = calcular_resultado_qc(df)
+    regresion = resultado['regresion']
+    
+    if graficar:
+        _generar(df, resultado, 'Graficos_Control_Sensores.png')
     
     # Imprimir estadísticas de control
-    print("\nEstadísticas de Control - Sensor Keller:")
-    print(f"Media: {keller_mean:.3f} m")
-    print(f"Desviación estándar: {keller_std:.3f} m")
-    print(f"Límite superior de control (UCL): {keller_ucl:.3f} m")
-    print(f"Límite inferior de control (LCL): {keller_lcl:.3f} m")
-    
-    print("\nEstadísticas de Control - Sensor Vega:")
-    print(f"Media: {vega_mean:.3f} m")
-    print(f"Desviación estándar: {vega_std:.3f} m")
-    print(f"Límite superior de control (UCL): {vega_ucl:.3f} m")
-    print(f"Límite inferior de control (LCL): {vega_lcl:.3f} m")
+    for nombre, sufijo in (('Keller', 'x'), ('Vega', 'y')):
+        media, std = regresion[f'media_{sufijo}'], regresion[f'desviacion_{sufijo}']
+        print(f"\nEstadísticas de Control - Sensor {nombre}:")
+        print(f"Media: {media:.3f} m")
+        print(f"Desviación estándar: {std:.3f} m")
+        print(f"Límite superior de control (UCL): {media + 3 * std:.3f} m")
+        print(f"Límite inferior de control (LCL): {media - 3 * std:.3f} m")
 
-def main():
+def generar_graficos(df, resultado, paralelo=True, max_puntos=graficos_calidad.MAX_PUNTOS, directorio='.'):
     """
-    Función principal que ejecuta el control de calidad
+    Genera los tres PNG de control de calidad. Los datos se reducen a su
+    envolvente visual y cada figura se renderiza en su propio proceso.
+    """
+    graficos = graficos_calidad.preparar_graficos(df, resultado, directorio, max_puntos=max_puntos)
+    return graficos_calidad.renderizar(graficos, paralelo=paralelo)
+
+def analizar_incremental(archivo='valpoall.txt',
+                         ruta_estado='datos_procesados/estadisticas_incrementales.json'):
+    """
+    Control de calidad sólo con las líneas agregadas desde la última
+    ejecución: actualiza los acumuladores y el control móvil guardados
+    junto a ruta_estado e informa desde ellos, sin leer el historial.
+    Los PNG dependen de toda la serie y se generan en el modo completo.
+    Retorna un string con los detalles del análisis
+    """
+    with etapa('metricas_qc') as medicion:
+        acumuladores, filas, filas_nuevas = actualizar_estadisticas_incrementales(archivo, ruta_estado)
+        medicion.agregar_filas(filas_nuevas)
+        resultado = resultado_desde_acumuladores(acumuladores, filas=filas)
+    
+    with etapa('control_movil', filas=filas_nuevas):
+        banderas = actualizar_control_movil(
+            archivo, os.path.join(os.path.dirname(ruta_estado), 'control_movil.json'))
+    
+    with etapa('reportes'):
+        print("\n=== ANÁLISIS DE DATOS FALTANTES ===")
+        for sensor, faltantes in zip(SENSORES, resultado['faltantes']):
+            if faltantes > 0:
+                print(f"{sensor}: {faltantes} datos faltantes ({faltantes / max(filas, 1) * 100:.2f}%)")
+        print("\n=== RANGOS NORMALES (IQR) ===")
+        for i, sensor in enumerate(SENSORES):
+            print(f"{sensor.upper()}: [{resultado['limite_inferior'][i]:.2f}, {resultado['limite_superior'][i]:.2f}]")
+        analizar_picos_y_deriva(None, banderas)
+        calcular_error_sensores(None, resultado)
+        analizar_correlacion(None, resultado, graficar=False)
+        generar_graficos_control_sensores(None, resultado, graficar=False)
+    
+    return "\n".join([
+        f"Control de calidad incremental de {archivo}",
+        f"Registros nuevos: {filas_nuevas} (total {filas})",
+        f"Estado guardado en {ruta_estado}",
+    ])
+
+def analizar(archivo='valpoall.txt', directorio='.', incremental=False, estacion=None,
+             ruta_estado='datos_procesados/estadisticas_incrementales.json', paralelo=True):
+    """
+    Ejecuta el control de calidad de un archivo (o de una estación del
+    almacén por estaciones) y escribe los PNG en directorio. Con
+    incremental sólo se procesan las líneas nuevas (ver analizar_incremental)
     Retorna un string con los detalles del análisis
     """
+    if incremental:
+        return analizar_incremental(archivo, ruta_estado)
     detalles = []
     
-    print("Cargando datos de valpoall.txt...")
-    detalles.append("Cargando datos de valpoall.txt...")
+    print(f"Cargando datos de {archivo}...")
+    detalles.append(f"Cargando datos de {archivo}...")
     
     # Cargar datos
-    df = cargar_datos('valpoall.txt')
+    with etapa('cargar_datos') as medicion:
+        df = cargar_datos(archivo, estacion)
+        medicion.agregar_filas(len(df))
+    
+    # Calcular todas las métricas en una pasada
+    with etapa('metricas_qc', filas=len(df)):
+        resultado = calcular_resultado_qc(df)
+    
+    with etapa('control_movil', filas=len(df)):
+        banderas = detectar(df[SENSORES].to_numpy())
     
     # Realizar análisis
-    analizar_datos_faltantes(df)
-    analizar_valores_extremos(df)
-    calcular_error_sensores(df)
-    analizar_correlacion(df)
+    with etapa('reportes', filas=len(df)):
+        analizar_datos_faltantes(df, resultado)
+        analizar_valores_extremos(df, resultado)
+        analizar_picos_y_deriva(df, banderas)
+        calcular_error_sensores(df, resultado)
+        analizar_correlacion(df, resultado, graficar=False)
+        generar_graficos_control_sensores(df, resultado, graficar=False)
     
     # Generar gráficos
     print("\nGenerando gráficos de control de calidad...")
-    generar_graficos_control(df)
-    generar_graficos_control_sensores(df)
+    os.makedirs(directorio, exist_ok=True)
+    with etapa('graficos', filas=len(df)):
+        rutas = generar_graficos(df, resultado, paralelo=paralelo, directorio=directorio)
     
     detalles.append("\nAnálisis completado. Se han generado los siguientes archivos:")
-    detalles.append("- Control_Calidad.png")
-    detalles.append("- Correlacion_Sensores.png")
-    detalles.append("- Graficos_Control_Sensores.png")
+    detalles.extend(f"- {os.path.relpath(ruta)}" for ruta in sorted(rutas))
     
     return "\n".join(detalles)
 
+def analizar_estacion(estacion, incremental=False, paralelo=False):
+    """Control de calidad de una estación; los PNG quedan en resultados/<estacion>/"""
+    return analizar(archivo_estacion(estacion), directorio_resultados(estacion), incremental,
+                    estacion=estacion, paralelo=paralelo,
+                    ruta_estado=os.path.join('datos_procesados', estacion, 'estadisticas_incrementales.json'))
+
+def main(incremental=False, estaciones=None, max_procesos=None):
+    """
+    Función principal que ejecuta el control de calidad
+    Con incremental=True las estadísticas se actualizan sólo con las
+    líneas nuevas del archivo (ver actualizar_estadisticas_incrementales)
+    Sin estaciones se analiza valpoall.txt y los PNG quedan en el directorio
+    actual; con una lista de estaciones cada una se analiza en su propio
+    proceso y escribe en resultados/<estacion>/
+    Retorna un string con los detalles del análisis
+    """
+    if estaciones is None:
+        return analizar(incremental=incremental)
+    
+    estaciones = [validar_estacion(e) for e in estaciones]
+    detalles = []
+    with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+        futuros = {e: pool.submit(analizar_estacion, e, incremental) for e in estaciones}
+        for estacion, futuro in futuros.items():
+            try:
+                detalles.append(f"=== {estacion} ===\n{futuro.result()}")
+            except Exception as e:
+                detalles.append(f"=== {estacion} ===\nError: {str(e)}")
+    return "\n\n".join(detalles)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # python control_calidad.py [--incremental] [estacion ...]
+    argumentos = [a for a in sys.argv[1:] if a != '--incremental']
+    main(incremental='--incremental' in sys.argv[1:], estaciones=argumentos or None)
@@ -0,0 +1,163 @@
+import numpy as np
+
+# Factor que lleva la MAD a desviación estándar para ruido normal
+FACTOR_MAD = 1.4826
+
+# Resolución de cada sensor de SENSORES: la escala de ruido nunca se toma
+# menor que esto (un sensor saturado, p. ej. humedad en 100, tiene MAD 0)
+ESCALA_MINIMA = np.array([0.005, 0.005, 0.1, 0.1, 1.0, 0.05])
+
+PARAMETROS = {
+    'ventana': 169,            # muestras hacia atrás (una semana horaria)
+    'umbral_pico': 6.0,        # residuos a más de umbral_pico MAD de su mediana son picos
+    'lambda_ewma': 0.05,
+    'limite_ewma': 3.0,        # en desviaciones estándar de la EWMA
+    'k_cusum': 1.0,            # holgura, en desviaciones estándar de la diferencia
+    'h_cusum': 20.0,           # umbral de alarma del CUSUM
+}
+
+
+def _mediana_movil(X, ventana):
+    """Mediana móvil hacia atrás por columna (lista ordenada en C, O(n log ventana)); ignora NaN"""
+    import pandas as pd
+    return pd.DataFrame(X).rolling(ventana, min_periods=1).median().to_numpy()
+
+
+def _residuo_local(Z):
+    """
+    Desvío de cada muestra respecto del promedio de sus vecinas: la
+    tendencia lineal de la marea se cancela y un pico aislado resalta
+    """
+    residuo = np.full(Z.shape, np.nan)
+    residuo[1:-1] = Z[1:-1] - 0.5 * (Z[:-2] + Z[2:])
+    return residuo
+
+
+def _ewma(x, lam, inicial=None):
+    """EWMA z_t = lam·x_t + (1 - lam)·z_{t-1}; los NaN mantienen el valor anterior"""
+    import pandas as pd
+    if inicial is not None:
+        x = np.concatenate([[inicial], x])
+    z = pd.Series(x).ewm(alpha=lam, adjust=False, ignore_na=True).mean().to_numpy()
+    return z if inicial is None else z[1:]
+
+
+def _cusum(incrementos, inicial=0.0):
+    """
+    S_t = max(0, S_{t-1} + x_t) sin bucle: con C la suma acumulada de los
+    incrementos, S_t = C_t - min(-S_0, min_{j<=t} C_j)
+    """
+    C = np.cumsum(incrementos)
+    return C - np.minimum(np.minimum.accumulate(C), -inicial)
+
+
+class ControlMovil:
+    """
+    Detección de picos y deriva con ventanas móviles sobre todos los
+    sensores a la vez:
+    - picos: desvío de cada muestra respecto de sus vecinas, comparado con
+      la mediana y la MAD móviles de ese desvío en la ventana anterior
+      (a diferencia de un rango global, no marca pleamares ni bajamares)
+    - deriva: EWMA y CUSUM de dos lados sobre la diferencia entre los
+      sensores i_x e i_y, estandarizada con una referencia robusta
+      (mediana y MAD de las primeras `ventana` diferencias válidas, antes
+      de las cuales no se evalúa deriva)
+    actualizar() procesa datos nuevos continuando el estado anterior: una
+    cola con el contexto de la ventana, la EWMA y los CUSUM. La última
+    fila espera a su vecina siguiente, salvo con final=True. El estado es
+    un dict serializable en JSON.
+    """
+
+    def __init__(self, estado=None, i_x=0, i_y=1, escala_minima=None, **parametros):
+        self.parametros = {**PARAMETROS, **parametros}
+        self.i_x, self.i_y = i_x, i_y
+        self.escala_minima = escala_minima
+        if estado and estado.get('parametros') == self.parametros:
+            self.estado = dict(estado)
+        else:
+            self.estado = {'parametros': self.parametros, 'cola': None, 'emitidas_en_cola': 0,
+                           'filas': 0, 'muestras_referencia': [], 'referencia': None,
+                           'ewma': None, 'cusum': [0.0, 0.0]}
+
+    def actualizar(self, X, final=False):
+        """
+        Procesa las filas nuevas X (n x k). Retorna un dict con las filas
+        [desde, hasta) ya definitivas: máscaras 'pico' (por sensor),
+        'deriva_ewma' y 'deriva_cusum', y los valores que las originan.
+        """
+        p = self.parametros
+        X = np.asarray(X, dtype=np.float64)
+        cola = self.estado['cola']
+        Z = X if cola is None else np.vstack([np.asarray(cola, dtype=np.float64).reshape(-1, X.shape[1]), X])
+        inicio = self.estado['emitidas_en_cola']
+        fin = max(inicio, len(Z) - (0 if final else 1))
+        minima = self.escala_minima
+        if minima is None:
+            minima = ESCALA_MINIMA if Z.shape[1] == len(ESCALA_MINIMA) else np.zeros(Z.shape[1])
+
+        # Picos: mediana y MAD móviles del residuo local
+        residuo = _residuo_local(Z)
+        desvio = residuo - _mediana_movil(residuo, p['ventana'])
+        escala = np.maximum(FACTOR_MAD * _mediana_movil(np.abs(desvio), p['ventana']), minima)
+        desvio, escala = desvio[inicio:fin], escala[inicio:fin]
+        with np.errstate(invalid='ignore'):
+            pico = np.abs(desvio) > p['umbral_pico'] * escala
+
+        # Deriva entre sensores: EWMA y CUSUM de la diferencia estandarizada
+        diferencia = Z[inicio:fin, self.i_x] - Z[inicio:fin, self.i_y]
+        evaluar = 0
+        if self.estado['referencia'] is None:
+            validas = np.flatnonzero(~np.isnan(diferencia))
+            faltan = p['ventana'] - len(self.estado['muestras_referencia'])
+            self.estado['muestras_referencia'] += diferencia[validas[:faltan]].tolist()
+            if len(validas) >= faltan:
+                muestras = np.array(self.estado['muestras_referencia'])
+                mediana = np.median(muestras)
+                mad = FACTOR_MAD * np.median(np.abs(muestras - mediana))
+                self.estado['referencia'] = [float(mediana), float(max(mad, minima[self.i_x]))]
+                self.estado['muestras_referencia'] = []
+                evaluar = validas[faltan - 1] + 1 if faltan > 0 else 0
+            else:
+                evaluar = len(diferencia)
+        ewma = np.full(len(diferencia), np.nan)
+        cusum_pos, cusum_neg = np.zeros(len(diferencia)), np.zeros(len(diferencia))
+        if self.estado['referencia'] is not None and evaluar < len(diferencia):
+            media, desviacion = self.estado['referencia']
+            u = (diferencia - media) / desviacion
+            u[:evaluar] = np.nan
+            ewma = _ewma(u, p['lambda_ewma'], self.estado['ewma'])
+            validos = ~np.isnan(u)
+            cusum_pos = _cusum(np.where(validos, u - p['k_cusum'], 0.0), self.estado['cusum'][0])
+            cusum_neg = _cusum(np.where(validos, -u - p['k_cusum'], 0.0), self.estado['cusum'][1])
+            if not np.isnan(ewma[-1]):
+                self.estado['ewma'] = float(ewma[-1])
+            self.estado['cusum'] = [float(cusum_pos[-1]), float(cusum_neg[-1])]
+        limite = p['limite_ewma'] * np.sqrt(p['lambda_ewma'] / (2 - p['lambda_ewma']))
+        with np.errstate(invalid='ignore'):
+            deriva_ewma = np.abs(ewma) > limite
+
+        # Se guarda el contexto que necesitan las ventanas de las próximas filas
+        contexto = 2 * p['ventana'] + 2
+        corte = max(0, fin - contexto)
+        desde = self.estado['filas']
+        self.estado.update(cola=Z[corte:].tolist(), emitidas_en_cola=fin - corte,
+                           filas=desde + fin - inicio)
+
+        return {
+            'desde': desde,
+            'hasta': desde + fin - inicio,
+            'residuo': desvio,
+            'escala': escala,
+            'pico': pico,
+            'diferencia': diferencia,
+            'ewma': ewma,
+            'deriva_ewma': deriva_ewma,
+            'cusum_pos': cusum_pos,
+            'cusum_neg': cusum_neg,
+            'deriva_cusum': (cusum_pos > p['h_cusum']) | (cusum_neg > p['h_cusum']),
+        }
+
+
+def detectar(X, **parametros):
+    """Ejecuta el control móvil sobre una matriz completa (n x k) de una vez"""
+    return ControlMovil(**parametros).actualizar(X, final=True)
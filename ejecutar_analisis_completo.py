@@ -1,142 +1,265 @@
 import os
 import shutil
+import sys
 import logging
 import time
 from datetime import datetime
-import pandas as pd
-import numpy as np
-
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('analisis_completo.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from functools import partial
+from ingesta import SENSORES
+from agregados import actualizar_agregados
+from compartido import ruta_publicada
+from planificador import Etapa, ejecutar_etapas, ERROR
+from instrumentacion import etapa, guardar_reporte
+from estaciones import archivo_estacion, directorio_resultados, fragmentos_estacion, validar_estacion
+
+def configurar_logging():
+    """Log a analisis_completo.log y a la consola; al importar el módulo no se abre ningún archivo"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('analisis_completo.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
 
-def procesar_datos_para_pronosticos():
-    """Procesa los datos para el análisis de pronósticos"""
+def procesar_datos_para_pronosticos(archivo='valpoall.txt',
+                                    ruta_agregados='datos_procesados/agregados.npz',
+                                    ruta_salida='datos_procesados/datos_procesados.csv'):
+    """
+    Procesa los datos para el análisis de pronósticos. Los promedios
+    diarios salen de los agregados por hora/día/mes (ver agregados.py),
+    que sólo leen las líneas agregadas al archivo desde la ejecución
+    anterior; el CSV se reescribe sólo si hubo registros nuevos.
+    """
+    import pandas as pd
     try:
-        # Cargar datos originales
-        df = pd.read_csv('valpoall.txt', sep='\s+', header=None, 
-                        names=['año', 'mes', 'día', 'hora', 'keller', 'vega', 
-                              'temp_aire', 'presion', 'humedad', 'temp_agua'])
-        
-        # Convertir columnas a tipos numéricos
-        columnas_numericas = ['keller', 'vega', 'temp_aire', 'presion', 'humedad', 'temp_agua']
-        for col in columnas_numericas:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Crear columna de fecha
-        df['fecha'] = pd.to_datetime({
-            'year': df['año'],
-            'month': df['mes'],
-            'day': df['día'],
-            'hour': df['hora']
-        })
+        with etapa('actualizar_agregados') as medicion:
+            agregados, registros_nuevos = actualizar_agregados(archivo, ruta_agregados, SENSORES)
+            medicion.agregar_filas(registros_nuevos)
         
-        # Calcular promedios diarios
-        df_diario = df.groupby(df['fecha'].dt.date)[columnas_numericas].mean().reset_index()
+        if registros_nuevos or not os.path.exists(ruta_salida):
+            dias, columnas = agregados.consultar('diario')
+            df_diario = pd.DataFrame({col: columnas[col]['media'] for col in SENSORES})
+            df_diario.insert(0, 'fecha', dias.astype(str))
+            
+            # Guardar datos procesados
+            with etapa('escritura', filas=len(df_diario)):
+                os.makedirs(os.path.dirname(ruta_salida) or '.', exist_ok=True)
+                df_diario.to_csv(ruta_salida + '.tmp', index=False)
+                os.replace(ruta_salida + '.tmp', ruta_salida)
         
-        # Guardar datos procesados
-        os.makedirs('datos_procesados', exist_ok=True)
-        df_diario.to_csv('datos_procesados/datos_procesados.csv', index=False)
-        
-        logging.info(f"Datos procesados guardados en datos_procesados/datos_procesados.csv")
-        logging.info(f"Registros procesados: {len(df_diario)}")
+        logging.info(f"Datos procesados guardados en {ruta_salida}")
+        logging.info(f"Registros nuevos: {registros_nuevos}")
+        logging.info(f"Días procesados: {len(agregados.buckets['diario'])}")
         
         return True
     except Exception as e:
         logging.error(f"Error al procesar datos: {str(e)}")
         return False
 
-def generar_reporte_individual(nombre_rutina, estado, detalles=""):
+def generar_reporte_individual(nombre_rutina, estado, detalles="", tiempo=None):
     """Genera un reporte individual para cada rutina"""
-    reporte_path = f'reportes/reporte_{nombre_rutina}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
+    # Las etapas por estación se llaman etapa:estacion; ':' no es válido en nombres de archivo en Windows
+    reporte_path = f'reportes/reporte_{nombre_rutina.replace(":", "_")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
     os.makedirs('reportes', exist_ok=True)
     
     with open(reporte_path, 'w', encoding='utf-8') as f:
         f.write(f"=== REPORTE DE {nombre_rutina.upper()} ===\n")
         f.write(f"Fecha y hora: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"Estado: {estado}\n")
+        if tiempo is not None:
+            f.write(f"Tiempo de ejecución: {tiempo:.2f} segundos\n")
         f.write(f"Detalles:\n{detalles}\n")
     
     return reporte_path
 
-def ejecutar_analisis_completo():
+# Etapas del pipeline (funciones de nivel de módulo para ejecutarse en otro proceso).
+# Sin estación trabajan sobre valpoall.txt con las rutas de siempre.
+def etapa_sensores():
+    import rutina_sensores
+    return rutina_sensores.main()
+
+def etapa_fragmentos(estacion):
+    fragmentos = fragmentos_estacion(estacion)
+    return f"Fragmentos de {estacion}: {', '.join(fragmentos)}"
+
+def etapa_control_calidad(estacion=None, incremental=False):
+    import control_calidad
+    if estacion is None:
+        return control_calidad.main(incremental=incremental)
+    return control_calidad.analizar_estacion(estacion, incremental)
+
+def _ruta_procesados(estacion):
+    if estacion is None:
+        return 'datos_procesados'
+    return os.path.join('datos_procesados', estacion)
+
+def etapa_preprocesamiento(estacion=None):
+    directorio = _ruta_procesados(estacion)
+    ruta_salida = os.path.join(directorio, 'datos_procesados.csv')
+    archivo = 'valpoall.txt' if estacion is None else archivo_estacion(estacion)
+    if not procesar_datos_para_pronosticos(archivo, os.path.join(directorio, 'agregados.npz'), ruta_salida):
+        raise Exception("Error al procesar datos para pronósticos")
+    return f"Datos procesados guardados en {ruta_salida}"
+
+def etapa_pronosticos(estacion=None):
+    import armonicos
+    if estacion is None:
+        return armonicos.main()
+    directorio = directorio_resultados(estacion)
+    return armonicos.main(estacion=estacion,
+                          ruta_pronostico=os.path.join(directorio, 'pronostico_keller_futuro.csv'),
+                          ruta_constantes=os.path.join(directorio, 'constantes_armonicas.json'))
+
+def etapa_publicacion(estacion=None):
+    import compartido
+    if estacion is None:
+        ruta_constantes = 'resultados/constantes_armonicas.json'
+    else:
+        ruta_constantes = os.path.join(directorio_resultados(estacion), 'constantes_armonicas.json')
+    rutas = [compartido.publicar_observaciones(estacion=estacion),
+             compartido.publicar_pronostico(ruta_constantes, estacion)]
+    return f"Datos publicados para el servidor: {', '.join(rutas)}"
+
+def etapa_verificacion(estacion=None):
+    import verificacion
+    archivo = 'valpoall.txt' if estacion is None else archivo_estacion(estacion)
+    directorio = 'resultados' if estacion is None else directorio_resultados(estacion)
+    ruta = os.path.join(_ruta_procesados(estacion), 'verificacion.npz')
+    _, nuevas = verificacion.actualizar_verificacion(
+        archivo, os.path.join(directorio, 'constantes_armonicas.json'),
+        os.path.join(directorio, 'pronostico_keller_futuro.csv'), ruta)
+    return f"Verificación del pronóstico con {nuevas} observaciones nuevas en {ruta}"
+
+def _salidas_control_calidad(directorio, procesados, incremental):
+    """PNG del modo completo, o los estados que mantiene el modo incremental"""
+    if incremental:
+        return [os.path.join(procesados, nombre) for nombre in
+                ('estadisticas_incrementales.json', 'control_movil.json')]
+    return [os.path.join(directorio, nombre) for nombre in
+            ('Control_Calidad.png', 'Correlacion_Sensores.png', 'Graficos_Control_Sensores.png')]
+
+def definir_etapas_estacion(estacion, incremental=False):
+    """
+    Etapas de una estación: los fragmentos por año se construyen primero
+    (una sola vez aunque varias etapas los lean) y las salidas quedan en
+    resultados/<estacion>/
+    """
+    archivo = archivo_estacion(estacion)
+    directorio = directorio_resultados(estacion)
+    return [
+        Etapa(f'fragmentos:{estacion}', partial(etapa_fragmentos, estacion),
+              entradas=[archivo]),
+        Etapa(f'control_calidad:{estacion}', partial(etapa_control_calidad, estacion, incremental),
+              entradas=[archivo], depende_de=[f'fragmentos:{estacion}'],
+              salidas=_salidas_control_calidad(directorio, _ruta_procesados(estacion), incremental)),
+        Etapa(f'preprocesamiento:{estacion}', partial(etapa_preprocesamiento, estacion),
+              entradas=[archivo],
+              salidas=[os.path.join(_ruta_procesados(estacion), nombre)
+                       for nombre in ('datos_procesados.csv', 'agregados.npz')]),
+        Etapa(f'pronosticos:{estacion}', partial(etapa_pronosticos, estacion),
+              entradas=[archivo], depende_de=[f'fragmentos:{estacion}'],
+              salidas=[os.path.join(directorio, 'pronostico_keller_futuro.csv'),
+                       os.path.join(directorio, 'constantes_armonicas.json')]),
+        Etapa(f'publicacion:{estacion}', partial(etapa_publicacion, estacion),
+              entradas=[archivo, os.path.join(directorio, 'constantes_armonicas.json')],
+              depende_de=[f'pronosticos:{estacion}'],
+              salidas=[ruta_publicada('observaciones', estacion), ruta_publicada('pronostico', estacion)]),
+        Etapa(f'verificacion:{estacion}', partial(etapa_verificacion, estacion),
+              entradas=[archivo, os.path.join(directorio, 'constantes_armonicas.json')],
+              depende_de=[f'pronosticos:{estacion}'],
+              salidas=[os.path.join(_ruta_procesados(estacion), 'verificacion.npz')]),
+    ]
+
+def definir_etapas(estaciones=None, incremental=False):
+    """
+    Grafo de etapas: control de calidad, preprocesamiento y pronósticos son
+    independientes; la publicación para el servidor y la verificación
+    del pronóstico esperan a los pronósticos. Con una lista de estaciones
+    se agregan las etapas de cada una, que el planificador reparte entre
+    los procesos. Con incremental el control de calidad sólo procesa las
+    líneas nuevas y no regenera los PNG.
+    """
+    if estaciones is not None:
+        etapas = []
+        for estacion in estaciones:
+            etapas.extend(definir_etapas_estacion(validar_estacion(estacion), incremental))
+        return etapas
+    return [
+        Etapa('sensores', etapa_sensores,
+              entradas=['valpoall.txt']),
+        Etapa('control_calidad', partial(etapa_control_calidad, incremental=incremental),
+              entradas=['valpoall.txt'],
+              salidas=_salidas_control_calidad('.', _ruta_procesados(None), incremental)),
+        Etapa('preprocesamiento', etapa_preprocesamiento,
+              entradas=['valpoall.txt'],
+              salidas=['datos_procesados/datos_procesados.csv', 'datos_procesados/agregados.npz']),
+        Etapa('pronosticos', etapa_pronosticos,
+              entradas=['valpoall.txt'],
+              salidas=['resultados/pronostico_keller_futuro.csv', 'resultados/constantes_armonicas.json']),
+        Etapa('publicacion', etapa_publicacion,
+              entradas=['valpoall.txt', 'resultados/constantes_armonicas.json'],
+              depende_de=['pronosticos'],
+              salidas=[ruta_publicada('observaciones'), ruta_publicada('pronostico')]),
+        Etapa('verificacion', etapa_verificacion,
+              entradas=['valpoall.txt', 'resultados/constantes_armonicas.json'],
+              depende_de=['pronosticos'],
+              salidas=['datos_procesados/verificacion.npz']),
+    ]
+
+def etapas_fallidas(etapas, resultados):
+    """
+    Etapas con error o a las que les falta alguna de sus salidas declaradas
+    Retorna {nombre: motivo}
+    """
+    fallidas = {}
+    for e in etapas:
+        resultado = resultados.get(e.nombre)
+        if resultado is None or resultado['estado'] == ERROR:
+            fallidas[e.nombre] = resultado['detalles'] if resultado else "No se ejecutó"
+            continue
+        faltantes = [s for s in e.salidas if not os.path.exists(s)]
+        if faltantes:
+            fallidas[e.nombre] = f"Faltan salidas: {', '.join(faltantes)}"
+    return fallidas
+
+def ejecutar_analisis_completo(forzar=False, estaciones=None, perfilar=False, incremental=False):
+    """
+    Ejecuta todas las etapas y deja en reportes/ un reporte de texto por
+    etapa, el resumen final y un reporte JSON de la ejecución con las
+    mediciones (tiempo de pared y CPU, RSS pico, filas) de cada etapa y
+    subetapa. Con perfilar cada etapa deja su perfil de cProfile en
+    reportes/perfiles/. Con incremental el control de calidad sólo procesa
+    las líneas nuevas (ver definir_etapas). Retorna True si todas las
+    etapas terminaron bien.
+    """
+    configurar_logging()
     # Crear directorios necesarios
     for dir_name in ['resultados', 'reportes', 'database', 'datos_procesados']:
         os.makedirs(dir_name, exist_ok=True)
     
     start_time = time.time()
-    logging.info(f"Iniciando ejecución completa: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    inicio = datetime.now()
+    logging.info(f"Iniciando ejecución completa: {inicio.strftime('%Y-%m-%d %H:%M:%S')}")
     logging.info("=" * 50)
     
-    # 1. Análisis básico de sensores
-    logging.info("INICIANDO ANÁLISIS BÁSICO DE SENSORES")
-    logging.info("=" * 50)
-    try:
-        import rutina_sensores
-        detalles_sensores = rutina_sensores.main()
-        reporte_sensores = generar_reporte_individual(
-            "sensores",
-            "EXITOSO",
-            detalles_sensores
-        )
-        logging.info(f"[OK] Análisis básico de sensores completado exitosamente. Reporte generado: {reporte_sensores}")
-    except Exception as e:
-        error_msg = f"Error en análisis básico: {str(e)}"
-        generar_reporte_individual("sensores", "ERROR", error_msg)
-        logging.error(f"[ERROR] {error_msg}")
+    if not os.path.exists('valpoall.txt') and os.path.exists('datos/valpoall.txt'):
+        shutil.copy2('datos/valpoall.txt', 'valpoall.txt')
     
-    # 2. Control de calidad
-    logging.info("=" * 50)
-    logging.info("INICIANDO CONTROL DE CALIDAD")
-    logging.info("=" * 50)
-    try:
-        if not os.path.exists('valpoall.txt'):
-            if os.path.exists('datos/valpoall.txt'):
-                shutil.copy2('datos/valpoall.txt', 'valpoall.txt')
-            else:
-                raise FileNotFoundError("Archivo valpoall.txt no encontrado")
-        
-        import control_calidad
-        detalles_calidad = control_calidad.main()
-        reporte_calidad = generar_reporte_individual(
-            "control_calidad",
-            "EXITOSO",
-            detalles_calidad
-        )
-        logging.info(f"[OK] Control de calidad completado exitosamente. Reporte generado: {reporte_calidad}")
-    except Exception as e:
-        error_msg = f"Error en control_calidad: {str(e)}"
-        generar_reporte_individual("control_calidad", "ERROR", error_msg)
-        logging.error(f"[ERROR] {error_msg}")
+    def al_terminar(nombre, resultado):
+        reporte = generar_reporte_individual(nombre, resultado['estado'],
+                                             resultado['detalles'], resultado['tiempo'])
+        if resultado['estado'] == ERROR:
+            logging.error(f"[ERROR] {nombre}: {resultado['detalles']}")
+        else:
+            logging.info(f"[OK] {nombre} ({resultado['estado']}, {resultado['tiempo']:.2f} s). Reporte generado: {reporte}")
     
-    # 3. Análisis de pronósticos
-    logging.info("=" * 50)
-    logging.info("INICIANDO ANÁLISIS DE PRONÓSTICOS")
-    logging.info("=" * 50)
-    try:
-        # Procesar datos para pronósticos
-        logging.info("Procesando datos para pronósticos...")
-        if not procesar_datos_para_pronosticos():
-            raise Exception("Error al procesar datos para pronósticos")
-        
-        import scripts.pronostico_sensores as pronostico
-        detalles_pronostico = pronostico.main()
-        reporte_pronostico = generar_reporte_individual(
-            "pronosticos",
-            "EXITOSO",
-            detalles_pronostico
-        )
-        logging.info(f"[OK] Análisis de pronósticos completado exitosamente. Reporte generado: {reporte_pronostico}")
-    except Exception as e:
-        error_msg = f"Error en el análisis de pronósticos: {str(e)}"
-        generar_reporte_individual("pronosticos", "ERROR", error_msg)
-        logging.error(f"[ERROR] {error_msg}")
+    # Las etapas independientes corren en paralelo y se omiten si nada cambió
+    etapas = definir_etapas(estaciones, incremental)
+    perfiles = os.path.join('reportes', 'perfiles', inicio.strftime('%Y%m%d_%H%M%S')) if perfilar else None
+    resultados = ejecutar_etapas(etapas, forzar=forzar, al_terminar=al_terminar, directorio_perfiles=perfiles)
+    fallidas = etapas_fallidas(etapas, resultados)
     
     # Resumen final
     end_time = time.time()
@@ -144,53 +267,57 @@ def ejecutar_analisis_completo():
     logging.info("RESUMEN DE EJECUCIÓN")
     logging.info("=" * 50)
     logging.info(f"Tiempo total de ejecución: {end_time - start_time:.2f} segundos")
-    
-    # Verificar resultados
-    rutina_ok = any([
-        os.path.exists('resultados/graficos_sensores.png'),
-        os.path.exists('resultados/todos_sensores_combinado.png'),
-        os.path.exists('resultados/matriz_correlacion.png')
-    ])
-    
-    control_ok = any([
-        os.path.exists('resultados/Control_Calidad.png'),
-        os.path.exists('resultados/control_calidad.png'),
-        os.path.exists('resultados/correlacion_sensores.png'),
-        os.path.exists('resultados/control_sensor_keller.png'),
-        os.path.exists('resultados/control_sensor_vega.png')
-    ])
-    
-    pronostico_ok = any([
-        os.path.exists('resultados/pronostico_keller.png'),
-        os.path.exists('resultados/pronostico_vega.png'),
-        os.path.exists('resultados/pronostico_presion.png'),
-        os.path.exists('resultados/pronostico_temp_aire.png'),
-        os.path.exists('resultados/pronostico_temp_agua.png'),
-        os.path.exists('resultados/pronostico_humedad.png')
-    ])
+    for nombre, resultado in resultados.items():
+        metricas = resultado['metricas']
+        if metricas:
+            logging.info(f"{nombre}: {resultado['estado']} ({metricas['pared']:.2f} s, "
+                         f"CPU {metricas['cpu']:.2f} s, RSS pico {metricas['rss_pico_mb'] or 0:.0f} MB)")
+        else:
+            logging.info(f"{nombre}: {resultado['estado']}")
     
     # Generar reporte final
+    estado_etapas = "\n".join(
+        f"- {e.nombre}: {'ERROR (' + fallidas[e.nombre] + ')' if e.nombre in fallidas else 'OK'}"
+        for e in etapas)
     resumen_final = f"""
 Estado de las rutinas:
-- rutina_sensores: {'OK' if rutina_ok else 'ERROR'}
-- control_calidad: {'OK' if control_ok else 'ERROR'}
-- pronosticos: {'OK' if pronostico_ok else 'ERROR'}
+{estado_etapas}
 
 Tiempo total de ejecución: {end_time - start_time:.2f} segundos
 """
     
     reporte_final = generar_reporte_individual(
         "resumen_final",
-        "COMPLETADO" if all([rutina_ok, control_ok, pronostico_ok]) else "CON ERRORES",
+        "CON ERRORES" if fallidas else "COMPLETADO",
         resumen_final
     )
     
+    ruta_json = f'reportes/ejecucion_{inicio.strftime("%Y%m%d_%H%M%S")}.json'
+    guardar_reporte(ruta_json, {
+        'inicio': inicio.isoformat(timespec='seconds'),
+        'tiempo_total': end_time - start_time,
+        'estaciones': estaciones,
+        'forzar': forzar,
+        'exito': not fallidas,
+        'etapas': {
+            nombre: {'estado': r['estado'], 'tiempo': r['tiempo'], 'ok': nombre not in fallidas,
+                     'error': fallidas.get(nombre), 'metricas': r['metricas']}
+            for nombre, r in resultados.items()
+        },
+    })
+    
     logging.info(f"Reporte final generado: {reporte_final}")
+    logging.info(f"Reporte de la ejecución (JSON): {ruta_json}")
     
-    if not all([rutina_ok, control_ok, pronostico_ok]):
+    if fallidas:
         logging.error("\n[ERROR] Algunos análisis fallaron")
     else:
         logging.info("\n[OK] Todos los análisis se completaron exitosamente")
+    return not fallidas
 
 if __name__ == "__main__":
-    ejecutar_analisis_completo() 
\ No newline at end of file
+    # python ejecutar_analisis_completo.py [--perfilar] [--incremental] [estacion ...]
+    opciones = {'--perfilar', '--incremental'}
+    argumentos = [a for a in sys.argv[1:] if a not in opciones]
+    ejecutar_analisis_completo(estaciones=argumentos or None, perfilar='--perfilar' in sys.argv[1:],
+                               incremental='--incremental' in sys.argv[1:])
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import re
+import numpy as np
+from ingesta import (cargar_valpoall, hash_archivo, cache_vigente, leer_manifiesto, escribir_manifiesto,
+                     directorio_temporal, publicar_directorio, limpiar_versiones,
+                     COLUMNAS_CACHE, INTENTOS_CACHE, VERSION_CACHE)
+
+# Estructura: estaciones/<estacion>/<estacion>.txt es el archivo crudo (mismo
+# formato que valpoall.txt) y estaciones/<estacion>/<año>-<hash>/ guarda un
+# .npy por columna con los registros de ese año; el manifiesto indica el
+# directorio vigente de cada año. Las filas sin fecha válida van al
+# fragmento SIN_FECHA. La estación predeterminada usa valpoall.txt.
+DIRECTORIO_ESTACIONES = 'estaciones'
+DIRECTORIO_RESULTADOS = 'resultados'
+ESTACION_PREDETERMINADA = 'valparaiso'
+ARCHIVO_PREDETERMINADO = 'valpoall.txt'
+SIN_FECHA = 'sin_fecha'
+
+_NOMBRE_VALIDO = re.compile(r'^[a-z0-9][a-z0-9_\-]*$')
+
+
+def validar_estacion(estacion):
+    """Los nombres de estación se usan como directorios: sólo [a-z0-9_-]"""
+    if not isinstance(estacion, str) or not _NOMBRE_VALIDO.match(estacion):
+        raise ValueError(f"Nombre de estación inválido: {estacion!r}")
+    return estacion
+
+
+def directorio_estacion(estacion):
+    return os.path.join(DIRECTORIO_ESTACIONES, validar_estacion(estacion))
+
+
+def directorio_resultados(estacion):
+    """Directorio de salidas (PNG, pronóstico, constantes) de la estación"""
+    return os.path.join(DIRECTORIO_RESULTADOS, validar_estacion(estacion))
+
+
+def archivo_estacion(estacion):
+    """Archivo crudo de la estación"""
+    archivo = os.path.join(directorio_estacion(estacion), estacion + '.txt')
+    if estacion == ESTACION_PREDETERMINADA and not os.path.exists(archivo):
+        return ARCHIVO_PREDETERMINADO
+    return archivo
+
+
+def listar_estaciones():
+    """Estaciones con archivo crudo disponible, en orden alfabético"""
+    estaciones = set()
+    if os.path.exists(ARCHIVO_PREDETERMINADO):
+        estaciones.add(ESTACION_PREDETERMINADA)
+    if os.path.isdir(DIRECTORIO_ESTACIONES):
+        for nombre in os.listdir(DIRECTORIO_ESTACIONES):
+            if _NOMBRE_VALIDO.match(nombre) and os.path.exists(archivo_estacion(nombre)):
+                estaciones.add(nombre)
+    return sorted(estaciones)
+
+
+def _hash_fragmento(columnas):
+    h = hashlib.blake2b(digest_size=16)
+    for col in COLUMNAS_CACHE:
+        h.update(np.ascontiguousarray(columnas[col]).tobytes())
+    return h.hexdigest()
+
+
+def construir_fragmentos(estacion):
+    """
+    Divide el archivo crudo de la estación en un fragmento por año.
+    Sólo se reescriben los años cuyo contenido cambió (normalmente el año
+    en curso, cuando se agregan registros). Retorna los años reescritos.
+    """
+    archivo = archivo_estacion(estacion)
+    directorio = directorio_estacion(estacion)
+    os.makedirs(directorio, exist_ok=True)
+
+    st = os.stat(archivo)
+    df, invalidas = cargar_valpoall(archivo, usar_cache=False)
+    df['fecha_invalida'] = invalidas
+    años = np.where(invalidas, -1, df['fecha'].to_numpy().astype('datetime64[Y]').astype(np.int64) + 1970)
+
+    fragmentos = {}
+    reescritos = []
+    for año in np.unique(años):
+        nombre = SIN_FECHA if año < 0 else str(año)
+        filas = años == año
+        columnas = {col: df[col].to_numpy()[filas] for col in COLUMNAS_CACHE}
+        firma = _hash_fragmento(columnas)
+        fragmentos[nombre] = {'filas': int(filas.sum()), 'hash': firma, 'directorio': f'{nombre}-{firma}'}
+        ruta = os.path.join(directorio, fragmentos[nombre]['directorio'])
+        if os.path.isdir(ruta):
+            continue
+        # Se escribe en un directorio temporal propio y se publica de una vez
+        temporal = directorio_temporal(directorio)
+        for col, valores in columnas.items():
+            np.save(os.path.join(temporal, col + '.npy'), valores)
+        publicar_directorio(temporal, ruta)
+        reescritos.append(nombre)
+
+    escribir_manifiesto(directorio, {
+        'version': VERSION_CACHE,
+        'origen': os.path.basename(archivo),
+        'tamaño': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'hash': hash_archivo(archivo),
+        'filas': len(df),
+        'fragmentos': fragmentos,
+    })
+    limpiar_versiones(directorio, {f['directorio'] for f in fragmentos.values()})
+    return reescritos
+
+
+def _leer_fragmentos(directorio):
+    manifiesto = leer_manifiesto(directorio)
+    return (manifiesto or {}).get('fragmentos', {})
+
+
+def fragmentos_estacion(estacion, años=None):
+    """
+    Nombres de los fragmentos vigentes (reconstruyéndolos si el archivo
+    crudo cambió), filtrados a los años pedidos si se indican
+    """
+    directorio = directorio_estacion(estacion)
+    if not cache_vigente(archivo_estacion(estacion), directorio):
+        construir_fragmentos(estacion)
+    nombres = sorted(_leer_fragmentos(directorio), key=lambda n: (n == SIN_FECHA, n))
+    if años is not None:
+        pedidos = {str(año) for año in años}
+        nombres = [n for n in nombres if n in pedidos]
+    return nombres
+
+
+def cargar_columnas_estacion(estacion, columnas=None, años=None):
+    """
+    Retorna un dict columna -> array con los fragmentos pedidos en orden
+    cronológico. Con un solo fragmento los arrays quedan mapeados en
+    memoria; con varios se concatenan.
+    """
+    directorio = directorio_estacion(estacion)
+    columnas = COLUMNAS_CACHE if columnas is None else columnas
+    for intento in range(INTENTOS_CACHE):
+        nombres = fragmentos_estacion(estacion, años)
+        try:
+            rutas = [os.path.join(directorio, _leer_fragmentos(directorio)[n]['directorio']) for n in nombres]
+            partes = {col: [np.load(os.path.join(ruta, col + '.npy'), mmap_mode='r') for ruta in rutas]
+                      for col in columnas}
+            break
+        except (FileNotFoundError, KeyError):
+            # Otro proceso publicó fragmentos nuevos y borró éstos antes de abrirlos
+            if intento == INTENTOS_CACHE - 1:
+                raise
+    return {col: arrays[0] if len(arrays) == 1 else np.concatenate(arrays) if arrays else np.array([])
+            for col, arrays in partes.items()}
+
+
+def cargar_estacion(estacion, años=None):
+    """Equivalente a cargar_valpoall para una estación: retorna (df, fechas_invalidas)"""
+    import pandas as pd
+    columnas = cargar_columnas_estacion(estacion, años=años)
+    invalidas = np.array(columnas.pop('fecha_invalida'), dtype=bool)
+    df = pd.DataFrame({col: np.array(valores) for col, valores in columnas.items()})
+    return df, invalidas
@@ -0,0 +1,402 @@
+import numpy as np
+
+
+class BocetoCuantiles:
+    """
+    Resumen compacto y combinable de una distribución para estimar
+    cuantiles en una sola pasada (variante simple de t-digest). Los
+    valores entran a un buffer y cada cierto tamaño se comprimen en
+    centroides (media, peso), más finos en las colas que en el centro.
+    Los valores repetidos se agrupan sin pérdida, por lo que sensores con
+    resolución fija (p. ej. 0.1 °C) conservan cuantiles exactos mientras
+    haya menos valores distintos que la compresión.
+    """
+
+    def __init__(self, compresion=1000, tamaño_buffer=4000):
+        self.compresion = compresion
+        self.tamaño_buffer = tamaño_buffer
+        self.medias = np.empty(0)
+        self.pesos = np.empty(0)
+        # True si todos los valores del centroide son iguales a su media
+        self.exactos = np.empty(0, dtype=bool)
+        self._buffer = []
+        self._en_buffer = 0
+
+    @property
+    def total(self):
+        return float(self.pesos.sum()) + self._en_buffer
+
+    def agregar(self, x):
+        self._buffer.append(np.array([x], dtype=np.float64))
+        self._en_buffer += 1
+        if self._en_buffer >= self.tamaño_buffer:
+            self.comprimir()
+
+    def agregar_lote(self, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        self._buffer.append(valores)
+        self._en_buffer += len(valores)
+        if self._en_buffer >= self.tamaño_buffer:
+            self.comprimir()
+
+    def comprimir(self, otro=None):
+        """Funde buffer, centroides propios y (opcional) los de otro boceto"""
+        partes = [(self.medias, self.pesos, self.exactos)]
+        partes += [(b, np.ones(len(b)), np.ones(len(b), dtype=bool)) for b in self._buffer]
+        if otro is not None:
+            partes.append((otro.medias, otro.pesos, otro.exactos))
+        m, p, e = (np.concatenate(x) for x in zip(*partes))
+        self._buffer, self._en_buffer = [], 0
+        if len(m) == 0:
+            return
+
+        # Valores idénticos se agrupan sin pérdida (resultado ya ordenado)
+        m, grupo = np.unique(m, return_inverse=True)
+        p, e = np.bincount(grupo, weights=p), np.bincount(grupo, weights=~e) == 0
+
+        if len(m) > self.compresion:
+            acumulado = np.cumsum(p)
+            q = (acumulado - p / 2) / acumulado[-1]
+            # Función de escala k1 de t-digest: buckets angostos en las colas
+            k = np.floor(self.compresion / (2 * np.pi) * np.arcsin(2 * q - 1)).astype(np.int64)
+            grupo = np.r_[0, np.cumsum(np.diff(k) != 0)]
+            tamaño = np.bincount(grupo)
+            e = (np.bincount(grupo, weights=~e) == 0) & (tamaño == 1)
+            m = np.bincount(grupo, weights=m * p)
+            p = np.bincount(grupo, weights=p)
+            m /= p
+        self.medias, self.pesos, self.exactos = m, p, e
+
+    def combinar(self, otro):
+        """Incorpora otro boceto (de otro bloque o proceso)"""
+        otro.comprimir()
+        self.comprimir(otro)
+
+    def cuantil(self, q, minimo=None, maximo=None):
+        """
+        Estima el cuantil q con interpolación lineal entre rangos, igual
+        que pandas. Un centroide exacto ocupa todo su tramo de rangos; uno
+        aproximado se ubica en su rango medio.
+        """
+        self.comprimir()
+        if len(self.medias) == 0:
+            return np.nan
+        fin = np.cumsum(self.pesos) - 1
+        inicio = fin - self.pesos + 1
+        centro = (inicio + fin) / 2
+        xs = np.column_stack([np.where(self.exactos, inicio, centro),
+                              np.where(self.exactos, fin, centro)]).ravel()
+        ys = np.repeat(self.medias, 2)
+        if minimo is not None:
+            xs, ys = np.r_[0.0, xs], np.r_[minimo, ys]
+        if maximo is not None:
+            xs, ys = np.r_[xs, fin[-1]], np.r_[ys, maximo]
+        return float(np.interp(q * fin[-1], xs, ys))
+
+    def a_dict(self):
+        self.comprimir()
+        return {'compresion': self.compresion, 'medias': self.medias.tolist(),
+                'pesos': self.pesos.tolist(), 'exactos': self.exactos.tolist()}
+
+    @classmethod
+    def desde_dict(cls, datos):
+        boceto = cls(compresion=datos['compresion'])
+        boceto.medias = np.array(datos['medias'], dtype=np.float64)
+        boceto.pesos = np.array(datos['pesos'], dtype=np.float64)
+        boceto.exactos = np.array(datos['exactos'], dtype=bool)
+        return boceto
+
+
+class AcumuladorSensor:
+    """
+    Estadísticas de un sensor en una sola pasada: conteo, media y varianza
+    (Welford), mínimo, máximo y boceto de cuantiles. Se actualiza en O(1)
+    por valor y se puede combinar con acumuladores de otros bloques.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = np.inf
+        self.maximo = -np.inf
+        self.boceto = BocetoCuantiles()
+
+    def actualizar(self, x):
+        if np.isnan(x):
+            return
+        self.n += 1
+        delta = x - self.media
+        self.media += delta / self.n
+        self.m2 += delta * (x - self.media)
+        self.minimo = min(self.minimo, x)
+        self.maximo = max(self.maximo, x)
+        self.boceto.agregar(x)
+
+    def actualizar_lote(self, valores):
+        """Agrega un bloque de valores (los NaN se ignoran)"""
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return
+        media = valores.mean()
+        self._combinar_momentos(len(valores), media, float(((valores - media) ** 2).sum()))
+        self.minimo = min(self.minimo, float(valores.min()))
+        self.maximo = max(self.maximo, float(valores.max()))
+        self.boceto.agregar_lote(valores)
+
+    def _combinar_momentos(self, n, media, m2):
+        # Fórmula de Chan et al. para combinar medias y varianzas parciales
+        total = self.n + n
+        delta = media - self.media
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.media += delta * n / total
+        self.n = total
+
+    def combinar(self, otro):
+        if otro.n == 0:
+            return
+        self._combinar_momentos(otro.n, otro.media, otro.m2)
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        self.boceto.combinar(otro.boceto)
+
+    @property
+    def varianza(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def desviacion(self):
+        return float(np.sqrt(self.varianza))
+
+    @property
+    def rms(self):
+        """Raíz del valor cuadrático medio"""
+        return float(np.sqrt(self.media ** 2 + self.m2 / self.n)) if self.n else np.nan
+
+    def cuantil(self, q):
+        return self.boceto.cuantil(q, self.minimo, self.maximo)
+
+    def limites_iqr(self, factor=1.5):
+        """Límites [Q1 - factor*IQR, Q3 + factor*IQR]"""
+        q1, q3 = self.cuantil(0.25), self.cuantil(0.75)
+        iqr = q3 - q1
+        return q1 - factor * iqr, q3 + factor * iqr
+
+    def limites_control(self, sigmas=3):
+        """Límites de control media ± sigmas·σ"""
+        return self.media - sigmas * self.desviacion, self.media + sigmas * self.desviacion
+
+    def a_dict(self):
+        return {'n': self.n, 'media': self.media, 'm2': self.m2,
+                'minimo': self.minimo if self.n else None,
+                'maximo': self.maximo if self.n else None,
+                'boceto': self.boceto.a_dict()}
+
+    @classmethod
+    def desde_dict(cls, datos):
+        acumulador = cls()
+        acumulador.n = datos['n']
+        acumulador.media = datos['media']
+        acumulador.m2 = datos['m2']
+        if datos['n']:
+            acumulador.minimo = datos['minimo']
+            acumulador.maximo = datos['maximo']
+        acumulador.boceto = BocetoCuantiles.desde_dict(datos['boceto'])
+        return acumulador
+
+
+class AcumuladorPar:
+    """
+    Covarianza en una sola pasada entre dos sensores (sólo filas donde
+    ambos tienen dato), con la regresión lineal y correlación derivadas
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.media_x = 0.0
+        self.media_y = 0.0
+        self.m2_x = 0.0
+        self.m2_y = 0.0
+        self.c = 0.0
+
+    def actualizar(self, x, y):
+        if np.isnan(x) or np.isnan(y):
+            return
+        self.n += 1
+        dx = x - self.media_x
+        self.media_x += dx / self.n
+        dy = y - self.media_y
+        self.media_y += dy / self.n
+        self.m2_x += dx * (x - self.media_x)
+        self.m2_y += dy * (y - self.media_y)
+        self.c += dx * (y - self.media_y)
+
+    def actualizar_lote(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        validos = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[validos], y[validos]
+        if len(x) == 0:
+            return
+        otro = AcumuladorPar()
+        otro.n = len(x)
+        otro.media_x, otro.media_y = x.mean(), y.mean()
+        dx, dy = x - otro.media_x, y - otro.media_y
+        otro.m2_x, otro.m2_y, otro.c = float(dx @ dx), float(dy @ dy), float(dx @ dy)
+        self.combinar(otro)
+
+    def combinar(self, otro):
+        if otro.n == 0:
+            return
+        total = self.n + otro.n
+        dx = otro.media_x - self.media_x
+        dy = otro.media_y - self.media_y
+        factor = self.n * otro.n / total
+        self.m2_x += otro.m2_x + dx * dx * factor
+        self.m2_y += otro.m2_y + dy * dy * factor
+        self.c += otro.c + dx * dy * factor
+        self.media_x += dx * otro.n / total
+        self.media_y += dy * otro.n / total
+        self.n = total
+
+    @property
+    def covarianza(self):
+        return self.c / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def correlacion(self):
+        return self.c / np.sqrt(self.m2_x * self.m2_y)
+
+    @property
+    def pendiente(self):
+        return self.c / self.m2_x
+
+    @property
+    def intercepto(self):
+        return self.media_y - self.pendiente * self.media_x
+
+    @property
+    def error_estandar(self):
+        """Error estándar de la pendiente (igual que scipy.stats.linregress)"""
+        r = self.correlacion
+        return float(np.sqrt((1 - r ** 2) * self.m2_y / self.m2_x / (self.n - 2)))
+
+    def desviaciones(self):
+        """Desviaciones estándar de x e y sobre las filas pareadas"""
+        return np.sqrt(self.m2_x / (self.n - 1)), np.sqrt(self.m2_y / (self.n - 1))
+
+    def a_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def desde_dict(cls, datos):
+        acumulador = cls()
+        acumulador.__dict__.update(datos)
+        return acumulador
+
+
+def _cuantiles_nan(ordenado, validos, qs):
+    """
+    Cuantiles por columna de una matriz ya ordenada en el eje de filas
+    (los NaN quedan al final), con interpolación lineal como pandas
+    """
+    salida = []
+    for q in qs:
+        h = (validos - 1).clip(min=0) * q
+        bajo = np.floor(h).astype(np.int64)
+        alto = np.minimum(bajo + 1, (validos - 1).clip(min=0))
+        v_bajo = np.take_along_axis(ordenado, bajo[..., None, :], axis=-2)[..., 0, :]
+        v_alto = np.take_along_axis(ordenado, alto[..., None, :], axis=-2)[..., 0, :]
+        valor = v_bajo + (h - bajo) * (v_alto - v_bajo)
+        salida.append(np.where(validos > 0, valor, np.nan))
+    return salida
+
+
+def kernel_qc(matriz, i_x=0, i_y=1, factor_iqr=1.5):
+    """
+    Calcula en una pasada vectorizada todas las métricas de control de
+    calidad para una matriz (n x k) de sensores, o (estaciones x n x k)
+    para varias estaciones apiladas. Los NaN se tratan como faltantes.
+    i_x, i_y son las columnas del par Keller/Vega para la regresión.
+    Retorna un dict de arrays con la forma (..., k) o (..., k, k).
+    """
+    X = np.asarray(matriz, dtype=np.float64)
+    presentes = ~np.isnan(X)
+    validos = presentes.sum(axis=-2)
+
+    # Cuartiles, límites IQR y máscara de extremos para todos los sensores
+    q1, q3 = _cuantiles_nan(np.sort(X, axis=-2), validos, (0.25, 0.75))
+    iqr = q3 - q1
+    limite_inferior = q1 - factor_iqr * iqr
+    limite_superior = q3 + factor_iqr * iqr
+    extremos = (X < limite_inferior[..., None, :]) | (X > limite_superior[..., None, :])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Se centra cada columna para estabilidad numérica de los productos
+        media = np.where(presentes, X, 0).sum(axis=-2) / validos
+        Z = np.where(presentes, X - media[..., None, :], 0.0)
+        M = presentes.astype(np.float64)
+        Mt, Zt = np.swapaxes(M, -1, -2), np.swapaxes(Z, -1, -2)
+
+        # Sumas sobre filas donde ambos sensores de cada par tienen dato
+        n_par = Mt @ M
+        suma = Zt @ M                 # suma[i, j] = Σ z_i sobre filas con j
+        suma2 = np.swapaxes(Z * Z, -1, -2) @ M
+        cruzado = Zt @ Z
+        sxy = cruzado - suma * np.swapaxes(suma, -1, -2) / n_par
+        sxx = suma2 - suma ** 2 / n_par
+        syy = np.swapaxes(sxx, -1, -2)
+        covarianza = sxy / (n_par - 1)
+        correlacion = sxy / np.sqrt(sxx * syy)
+
+        diag = np.arange(X.shape[-1])
+        desviacion = np.sqrt(sxx[..., diag, diag] / (validos - 1))
+
+        # Regresión y del par (x = Keller, y = Vega) sobre filas pareadas
+        n = n_par[..., i_x, i_y]
+        r = correlacion[..., i_x, i_y]
+        pendiente = sxy[..., i_x, i_y] / sxx[..., i_x, i_y]
+        media_x = media[..., i_x] + suma[..., i_x, i_y] / n
+        media_y = media[..., i_y] + suma[..., i_y, i_x] / n
+        intercepto = media_y - pendiente * media_x
+        error_estandar = np.sqrt((1 - r ** 2) * syy[..., i_x, i_y] / sxx[..., i_x, i_y] / (n - 2))
+
+        # Diferencia entre sensores del par
+        diferencia = X[..., i_x] - X[..., i_y]
+        par_presente = ~np.isnan(diferencia)
+        dif_media = np.nanmean(diferencia, axis=-1)
+        dif = {
+            'n': par_presente.sum(axis=-1),
+            'media': dif_media,
+            'desviacion': np.nanstd(diferencia, axis=-1, ddof=1),
+            'minimo': np.nanmin(diferencia, axis=-1),
+            'maximo': np.nanmax(diferencia, axis=-1),
+            'rmse': np.sqrt(np.nanmean(diferencia ** 2, axis=-1)),
+        }
+
+    return {
+        'n': X.shape[-2],
+        'faltantes': X.shape[-2] - validos,
+        'media': media,
+        'desviacion': desviacion,
+        'q1': q1,
+        'q3': q3,
+        'limite_inferior': limite_inferior,
+        'limite_superior': limite_superior,
+        'extremos': extremos,
+        'covarianza': covarianza,
+        'correlacion': correlacion,
+        'regresion': {
+            'n': n,
+            'r': r,
+            'pendiente': pendiente,
+            'intercepto': intercepto,
+            'error_estandar': error_estandar,
+            'media_x': media_x,
+            'media_y': media_y,
+            'desviacion_x': np.sqrt(sxx[..., i_x, i_y] / (n - 1)),
+            'desviacion_y': np.sqrt(syy[..., i_x, i_y] / (n - 1)),
+        },
+        'diferencia': dif,
+    }
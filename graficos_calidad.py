@@ -0,0 +1,230 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from reduccion import reducir_serie
+
+# Ancho típico de un panel en píxeles: más puntos no se distinguen en el PNG
+MAX_PUNTOS = 2000
+BINS_DENSIDAD = 120
+
+
+def _pyplot():
+    # Backend sin pantalla: los gráficos también se generan en procesos hijos
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _serie(fechas, valores, max_puntos):
+    return reducir_serie(np.asarray(fechas), np.asarray(valores, dtype=np.float64), max_puntos)
+
+
+def _estadisticas_boxplot(valores, etiqueta):
+    """
+    Estadísticas que usa Axes.bxp, calculadas sin enviar los datos crudos;
+    None si el sensor no tiene valores
+    """
+    valores = valores[~np.isnan(valores)]
+    if valores.size == 0:
+        return None
+    q1, mediana, q3 = np.percentile(valores, [25, 50, 75])
+    iqr = q3 - q1
+    dentro = valores[(valores >= q1 - 1.5 * iqr) & (valores <= q3 + 1.5 * iqr)]
+    return {
+        'label': etiqueta, 'med': mediana, 'q1': q1, 'q3': q3,
+        'whislo': dentro.min(), 'whishi': dentro.max(),
+        'fliers': valores[(valores < q1 - 1.5 * iqr) | (valores > q3 + 1.5 * iqr)],
+    }
+
+
+def _densidad(x, y, bins=BINS_DENSIDAD):
+    validos = ~(np.isnan(x) | np.isnan(y))
+    conteos, bordes_x, bordes_y = np.histogram2d(x[validos], y[validos], bins=bins)
+    return {'conteos': conteos, 'bordes_x': bordes_x, 'bordes_y': bordes_y}
+
+
+def _dibujar_densidad(fig, ax, densidad):
+    conteos = np.ma.masked_equal(densidad['conteos'].T, 0)
+    malla = ax.pcolormesh(densidad['bordes_x'], densidad['bordes_y'], conteos, cmap='viridis')
+    fig.colorbar(malla, ax=ax, label='Registros')
+
+
+def preparar_graficos(df, resultado, directorio='.', max_puntos=MAX_PUNTOS, solo=None):
+    """
+    Reduce los datos de cada gráfico a lo que se puede ver: envolvente
+    min/max de las series, histogramas y densidad 2-D en vez de nubes de
+    puntos. Retorna una lista de (función, datos) lista para renderizar.
+    max_puntos=None desactiva la reducción de series; solo limita la
+    preparación a los nombres de archivo indicados.
+    """
+    fechas = df['fecha'].to_numpy()
+    keller = df['keller'].to_numpy(dtype=np.float64)
+    vega = df['vega'].to_numpy(dtype=np.float64)
+    pareados = ~(np.isnan(keller) | np.isnan(vega))
+    regresion = resultado['regresion']
+    incluir = lambda nombre: solo is None or nombre in solo
+    graficos = []
+
+    densidad = None
+    if incluir('Control_Calidad.png') or incluir('Correlacion_Sensores.png'):
+        densidad = _densidad(keller, vega)
+
+    if incluir('Control_Calidad.png'):
+        diferencia = keller - vega
+        graficos.append((graficar_control_calidad, {
+            'ruta': os.path.join(directorio, 'Control_Calidad.png'),
+            'diferencia': _serie(fechas, diferencia, max_puntos),
+            'histograma': np.histogram(diferencia[~np.isnan(diferencia)], bins=50),
+            'boxplot': [_estadisticas_boxplot(keller, 'Keller'), _estadisticas_boxplot(vega, 'Vega')],
+            'densidad': densidad,
+            'temp_aire': _serie(fechas, df['temp_aire'], max_puntos),
+            'temp_agua': _serie(fechas, df['temp_agua'], max_puntos),
+            'presion': _serie(fechas, df['presion'], max_puntos),
+            'humedad': _serie(fechas, df['humedad'], max_puntos),
+        }))
+
+    if incluir('Graficos_Control_Sensores.png'):
+        graficos.append((graficar_control_sensores, {
+            'ruta': os.path.join(directorio, 'Graficos_Control_Sensores.png'),
+            'keller': _serie(fechas[pareados], keller[pareados], max_puntos),
+            'vega': _serie(fechas[pareados], vega[pareados], max_puntos),
+            'keller_media': regresion['media_x'],
+            'keller_std': regresion['desviacion_x'],
+            'vega_media': regresion['media_y'],
+            'vega_std': regresion['desviacion_y'],
+        }))
+
+    if incluir('Correlacion_Sensores.png'):
+        graficos.append((graficar_correlacion, {
+            'ruta': os.path.join(directorio, 'Correlacion_Sensores.png'),
+            'densidad': densidad,
+            'rango_x': (keller[pareados].min(), keller[pareados].max()) if pareados.any() else None,
+            'pendiente': regresion['pendiente'],
+            'intercepto': regresion['intercepto'],
+            'r': regresion['r'],
+        }))
+
+    return graficos
+
+
+def graficar_control_calidad(datos):
+    """Genera la figura de control de calidad de datos (6 paneles)"""
+    plt = _pyplot()
+    fig, axes = plt.subplots(3, 2, figsize=(15, 12))
+    fig.suptitle('Control de Calidad de Datos', fontsize=16)
+
+    # Gráfico de diferencias entre sensores
+    axes[0,0].plot(*datos['diferencia'])
+    axes[0,0].set_title('Diferencia Keller - Vega')
+    axes[0,0].set_ylabel('Diferencia (m)')
+    axes[0,0].grid(True)
+
+    # Histograma de diferencias
+    conteos, bordes = datos['histograma']
+    axes[0,1].hist(bordes[:-1], bordes, weights=conteos)
+    axes[0,1].set_title('Distribución de Diferencias')
+    axes[0,1].set_xlabel('Diferencia (m)')
+    axes[0,1].grid(True)
+
+    # Boxplot de sensores: los sensores sin valores quedan sin caja
+    cajas = [caja for caja in datos['boxplot'] if caja is not None]
+    if cajas:
+        axes[1,0].bxp(cajas)
+    else:
+        axes[1,0].text(0.5, 0.5, 'Sin datos', ha='center', va='center', transform=axes[1,0].transAxes)
+    axes[1,0].set_title('Boxplot Sensores de Marea')
+    axes[1,0].set_ylabel('Altura (m)')
+    axes[1,0].grid(True)
+
+    # Densidad Keller vs Vega (reemplaza el gráfico de dispersión)
+    _dibujar_densidad(fig, axes[1,1], datos['densidad'])
+    axes[1,1].set_title('Keller vs Vega')
+    axes[1,1].set_xlabel('Keller (m)')
+    axes[1,1].set_ylabel('Vega (m)')
+    axes[1,1].grid(True)
+
+    # Gráfico de temperatura
+    axes[2,0].plot(*datos['temp_aire'], label='Aire')
+    axes[2,0].plot(*datos['temp_agua'], label='Agua')
+    axes[2,0].set_title('Temperaturas')
+    axes[2,0].set_ylabel('Temperatura (°C)')
+    axes[2,0].legend()
+    axes[2,0].grid(True)
+
+    # Gráfico de presión y humedad
+    ax2 = axes[2,1].twinx()
+    axes[2,1].plot(*datos['presion'], 'b-', label='Presión')
+    ax2.plot(*datos['humedad'], 'r-', label='Humedad')
+    axes[2,1].set_title('Presión y Humedad')
+    axes[2,1].set_ylabel('Presión (mbar)')
+    ax2.set_ylabel('Humedad (%)')
+    axes[2,1].legend(loc='upper left')
+    ax2.legend(loc='upper right')
+    axes[2,1].grid(True)
+
+    plt.tight_layout()
+    plt.savefig(datos['ruta'])
+    plt.close(fig)
+    return datos['ruta']
+
+
+def graficar_control_sensores(datos):
+    """Genera los gráficos de control ±3σ de Keller y Vega"""
+    plt = _pyplot()
+    fig, ejes = plt.subplots(2, 1, figsize=(15, 10))
+    fig.suptitle('Gráficos de Control de Sensores', fontsize=16)
+
+    for ax, sensor, nombre in zip(ejes, ('keller', 'vega'), ('Keller', 'Vega')):
+        media, std = datos[f'{sensor}_media'], datos[f'{sensor}_std']
+        ax.plot(*datos[sensor], 'b-', label='Mediciones', alpha=0.6)
+        ax.axhline(y=media, color='g', linestyle='-', label='Media')
+        ax.axhline(y=media + 3 * std, color='r', linestyle='--', label='UCL/LCL (±3σ)')
+        ax.axhline(y=media - 3 * std, color='r', linestyle='--')
+        ax.set_title(f'Gráfico de Control - Sensor {nombre}')
+        ax.set_ylabel('Altura (m)')
+        ax.grid(True)
+        ax.legend()
+    ejes[1].set_xlabel('Fecha')
+
+    plt.tight_layout()
+    plt.savefig(datos['ruta'])
+    plt.close(fig)
+    return datos['ruta']
+
+
+def graficar_correlacion(datos):
+    """Genera el gráfico de densidad Keller vs Vega con la recta de regresión"""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(10, 8))
+    _dibujar_densidad(fig, ax, datos['densidad'])
+
+    # Añadir línea de regresión (no hay sin filas pareadas)
+    pendiente, intercepto, r = datos['pendiente'], datos['intercepto'], datos['r']
+    if datos['rango_x'] is not None:
+        x = np.array(datos['rango_x'])
+        ax.plot(x, pendiente * x + intercepto, 'r', label=f'y = {pendiente:.4f}x + {intercepto:.4f}')
+
+    ax.set_xlabel('Sensor Keller (m)')
+    ax.set_ylabel('Sensor Vega (m)')
+    ax.set_title('Correlación entre Sensores Keller y Vega')
+    ax.grid(True)
+    ax.legend()
+
+    # Añadir texto con estadísticas
+    ax.text(0.05, 0.95, f'R² = {r ** 2:.4f}\nr = {r:.4f}',
+            transform=ax.transAxes,
+            bbox=dict(facecolor='white', alpha=0.8))
+
+    plt.savefig(datos['ruta'])
+    plt.close(fig)
+    return datos['ruta']
+
+
+def renderizar(graficos, paralelo=True, max_procesos=None):
+    """Renderiza los PNG, cada uno en un proceso distinto si paralelo=True"""
+    if not paralelo:
+        return [funcion(datos) for funcion, datos in graficos]
+    with ProcessPoolExecutor(max_workers=max_procesos or len(graficos)) as pool:
+        futuros = [pool.submit(funcion, datos) for funcion, datos in graficos]
+        return [futuro.result() for futuro in futuros]
@@ -0,0 +1,359 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Formato de valpoall.txt: año mes día hora keller vega temp_aire presion humedad temp_agua
+COLUMNAS_FECHA = ['año', 'mes', 'día', 'hora']
+SENSORES = ['keller', 'vega', 'temp_aire', 'presion', 'humedad', 'temp_agua']
+COLUMNAS = COLUMNAS_FECHA + SENSORES
+
+# El registrador escribe 'NAN' cuando un sensor no reporta
+VALORES_FALTANTES = ['NAN']
+
+UNA_HORA = np.timedelta64(1, 'h')
+
+# Caché columnar: un .npy por columna más un manifiesto con la firma del origen.
+# Los .npy de cada versión van en un subdirectorio propio que se escribe
+# aparte y se publica de una vez; el manifiesto indica cuál es el vigente,
+# así varios procesos pueden reconstruir y leer la caché al mismo tiempo
+VERSION_CACHE = 2
+PREFIJO_TEMPORAL = '.tmp-'
+INTENTOS_CACHE = 3
+COLUMNAS_CACHE = COLUMNAS + ['fecha', 'fecha_invalida']
+
+# Esquema compacto para servir los datos: fecha datetime64[ns], sensores
+# float32 y humedad uint8 (% entero, HUMEDAD_FALTANTE si no hay dato), sin
+# las columnas año/mes/día/hora. 'faltantes' es una máscara de bits por
+# fila: bit i = SENSORES[i] sin dato y BIT_FECHA_INVALIDA; 'banderas' la
+# llena quien marque filas (ver compartido.publicar_observaciones)
+TIPOS_COMPACTOS = {sensor: np.float32 for sensor in SENSORES}
+TIPOS_COMPACTOS['humedad'] = np.uint8
+HUMEDAD_FALTANTE = 255
+BIT_FECHA_INVALIDA = 1 << len(SENSORES)
+
+# Lectura por bloques: tamaño de bloque y bytes usados para reconocer el archivo
+BYTES_POR_BLOQUE = 8 << 20
+BYTES_PREFIJO = 4096
+
+
+def construir_fechas(año, mes, dia, hora):
+    """
+    Construye las fechas a partir de las columnas año/mes/día/hora sin
+    recorrer filas. Retorna (fechas, invalidas): fechas es datetime64[ns]
+    con NaT en las filas inválidas e invalidas es la máscara booleana.
+    """
+    partes = [np.asarray(c, dtype=np.float64) for c in (año, mes, dia, hora)]
+    invalidas = np.zeros(len(partes[0]), dtype=bool)
+    for parte in partes:
+        invalidas |= ~np.isfinite(parte) | (parte != np.round(parte))
+    año, mes, dia, hora = [np.where(invalidas, 1, parte).astype(np.int64) for parte in partes]
+
+    invalidas |= (mes < 1) | (mes > 12) | (hora < 0) | (hora > 23)
+    mes = np.where(invalidas, 1, mes)
+
+    # Meses desde 1970 -> inicio del mes y cantidad de días del mes
+    meses = ((año - 1970) * 12 + (mes - 1)).astype('datetime64[M]')
+    inicio_mes = meses.astype('datetime64[D]')
+    dias_mes = ((meses + 1).astype('datetime64[D]') - inicio_mes).astype(np.int64)
+    invalidas |= (dia < 1) | (dia > dias_mes)
+
+    fechas = (inicio_mes + (dia - 1)).astype('datetime64[ns]') + hora * UNA_HORA
+    fechas[invalidas] = np.datetime64('NaT')
+    return fechas, invalidas
+
+
+def _parsear_texto(archivo):
+    """Tokeniza el archivo de texto (ruta o buffer) y retorna (df, fechas_invalidas)"""
+    import pandas as pd
+    df = pd.read_csv(archivo, sep=r'\s+', header=None, names=COLUMNAS,
+                     dtype=np.float64, na_values=VALORES_FALTANTES, engine='c')
+
+    fechas, invalidas = construir_fechas(*(df[c].to_numpy() for c in COLUMNAS_FECHA))
+    for col in COLUMNAS_FECHA:
+        df[col] = df[col].fillna(0).astype(np.int64)
+    df['fecha'] = fechas
+    return df, invalidas
+
+
+def ruta_cache(archivo):
+    """Directorio de la caché columnar, junto al archivo de origen"""
+    return archivo + '.cache'
+
+
+def hash_archivo(archivo, bloque=1 << 20):
+    """Hash del contenido del archivo, leído por bloques"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(archivo, 'rb') as f:
+        for parte in iter(lambda: f.read(bloque), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def leer_manifiesto(directorio):
+    """Manifiesto de la caché del directorio; None si falta o no se puede leer"""
+    try:
+        with open(os.path.join(directorio, 'manifiesto.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def escribir_manifiesto(directorio, manifiesto):
+    # Se escribe al final y de forma atómica, con un temporal propio de cada
+    # proceso: sin manifiesto no hay caché válida
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=PREFIJO_TEMPORAL, suffix='.json')
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, os.path.join(directorio, 'manifiesto.json'))
+
+
+def directorio_temporal(directorio):
+    """Directorio de escritura propio del proceso, junto al destino final"""
+    return tempfile.mkdtemp(dir=directorio, prefix=PREFIJO_TEMPORAL)
+
+
+def publicar_directorio(temporal, destino):
+    """
+    Publica con un solo rename un directorio escrito aparte. El nombre de
+    destino depende del contenido: si otro proceso ya lo publicó, el
+    temporal sobra y se borra.
+    """
+    try:
+        os.replace(temporal, destino)
+    except OSError:
+        if not os.path.isdir(destino):
+            raise
+        shutil.rmtree(temporal, ignore_errors=True)
+
+
+def limpiar_versiones(directorio, vigentes):
+    """
+    Borra los subdirectorios que no están en vigentes, salvo los temporales
+    de otros procesos que aún escriben. Quien tenga mapeada una versión
+    borrada la sigue leyendo; quien aún no la abrió vuelve a leer el manifiesto.
+    """
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        if nombre not in vigentes and not nombre.startswith(PREFIJO_TEMPORAL) and os.path.isdir(ruta):
+            shutil.rmtree(ruta, ignore_errors=True)
+
+
+def cache_vigente(archivo, directorio):
+    """Verifica la caché: primero por tamaño/mtime y, si difieren, por hash"""
+    manifiesto = leer_manifiesto(directorio)
+    if manifiesto is None or manifiesto.get('version') != VERSION_CACHE:
+        return False
+    versiones = [manifiesto['datos']] if 'datos' in manifiesto else [
+        fragmento['directorio'] for fragmento in manifiesto.get('fragmentos', {}).values()]
+    if not all(os.path.isdir(os.path.join(directorio, v)) for v in versiones):
+        return False
+    st = os.stat(archivo)
+    if manifiesto['tamaño'] == st.st_size and manifiesto['mtime_ns'] == st.st_mtime_ns:
+        return True
+    if manifiesto['tamaño'] != st.st_size or manifiesto['hash'] != hash_archivo(archivo):
+        return False
+    # Mismo contenido con otro mtime (p. ej. copiado): se actualiza la firma
+    manifiesto['mtime_ns'] = st.st_mtime_ns
+    escribir_manifiesto(directorio, manifiesto)
+    return True
+
+
+def construir_cache(archivo='valpoall.txt'):
+    """
+    Parsea el archivo de texto y guarda cada columna como .npy en un
+    subdirectorio nombrado por el hash del origen. Retorna el manifiesto.
+    """
+    directorio = ruta_cache(archivo)
+    os.makedirs(directorio, exist_ok=True)
+
+    st = os.stat(archivo)
+    firma = hash_archivo(archivo)
+    df, invalidas = _parsear_texto(archivo)
+    df['fecha_invalida'] = invalidas
+    temporal = directorio_temporal(directorio)
+    for col in COLUMNAS_CACHE:
+        np.save(os.path.join(temporal, col + '.npy'), df[col].to_numpy())
+    datos = firma[:16]
+    publicar_directorio(temporal, os.path.join(directorio, datos))
+
+    manifiesto = {
+        'version': VERSION_CACHE,
+        'origen': os.path.basename(archivo),
+        'tamaño': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'hash': firma,
+        'filas': len(df),
+        'datos': datos,
+        'columnas': {col: str(df[col].dtype) for col in COLUMNAS_CACHE},
+    }
+    escribir_manifiesto(directorio, manifiesto)
+    # Versiones anteriores y .npy sueltos del formato de VERSION_CACHE 1
+    limpiar_versiones(directorio, {datos})
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.npy'):
+            os.remove(os.path.join(directorio, nombre))
+    return manifiesto
+
+
+def cargar_columnas(archivo='valpoall.txt', columnas=None):
+    """
+    Retorna un dict columna -> array de sólo lectura mapeado en memoria.
+    La caché se reconstruye si el archivo de texto cambió; sólo se tocan
+    las páginas de las columnas pedidas.
+    """
+    directorio = ruta_cache(archivo)
+    columnas = COLUMNAS_CACHE if columnas is None else columnas
+    for intento in range(INTENTOS_CACHE):
+        if cache_vigente(archivo, directorio):
+            manifiesto = leer_manifiesto(directorio)
+        else:
+            manifiesto = construir_cache(archivo)
+        datos = os.path.join(directorio, manifiesto['datos'])
+        try:
+            return {col: np.load(os.path.join(datos, col + '.npy'), mmap_mode='r') for col in columnas}
+        except FileNotFoundError:
+            # Otro proceso publicó una versión nueva y borró ésta antes de abrirla
+            if intento == INTENTOS_CACHE - 1:
+                raise
+
+
+def compactar(columnas, banderas=None):
+    """
+    Convierte columnas con el esquema de la caché (dict columna -> array,
+    ver cargar_columnas) al esquema compacto: 31 bytes por fila en lugar
+    de 88
+    """
+    n = len(columnas['fecha'])
+    compacto = {'fecha': np.asarray(columnas['fecha'], dtype='datetime64[ns]')}
+    faltantes = np.zeros(n, dtype=np.uint8)
+    for i, sensor in enumerate(SENSORES):
+        valores = np.asarray(columnas[sensor], dtype=np.float64)
+        sin_dato = np.isnan(valores)
+        faltantes |= sin_dato.astype(np.uint8) << i
+        if TIPOS_COMPACTOS[sensor] == np.uint8:
+            valores = np.where(sin_dato, HUMEDAD_FALTANTE, np.clip(np.round(valores), 0, HUMEDAD_FALTANTE - 1))
+        compacto[sensor] = valores.astype(TIPOS_COMPACTOS[sensor])
+    faltantes[np.asarray(columnas['fecha_invalida'], dtype=bool)] |= BIT_FECHA_INVALIDA
+    compacto['faltantes'] = faltantes
+    compacto['banderas'] = np.zeros(n, dtype=np.uint8) if banderas is None else np.asarray(banderas, dtype=np.uint8)
+    return compacto
+
+
+def valores_sensor(compacto, sensor):
+    """Columna de un sensor del esquema compacto como float64, con NaN donde falta"""
+    i = SENSORES.index(sensor)
+    valores = compacto[sensor].astype(np.float64)
+    valores[(compacto['faltantes'] >> i) & 1 == 1] = np.nan
+    return valores
+
+
+def cargar_valpoall(archivo='valpoall.txt', usar_cache=True):
+    """
+    Lee el archivo de sensores en una sola pasada vectorizada.
+    Retorna (df, fechas_invalidas): df tiene las columnas de fecha como
+    enteros, los sensores como float64 y la columna 'fecha' en datetime64.
+    Con usar_cache se lee desde la caché columnar (ver cargar_columnas).
+    """
+    if usar_cache:
+        try:
+            columnas = cargar_columnas(archivo)
+        except OSError as e:
+            # Directorio de sólo lectura u otro problema: se lee el texto
+            print(f"No se pudo usar la caché de {archivo}: {e}")
+        else:
+            import pandas as pd
+            invalidas = np.array(columnas.pop('fecha_invalida'))
+            df = pd.DataFrame({col: np.array(valores) for col, valores in columnas.items()})
+            return df, invalidas
+    return _parsear_texto(archivo)
+
+
+def _iterar_bloques(archivo, desde_byte=0, bytes_por_bloque=BYTES_POR_BLOQUE):
+    """
+    Genera (bloque, fin_byte) leyendo sólo líneas completas: una última
+    línea sin salto de línea (aún en escritura) queda para la próxima vez.
+    """
+    with open(archivo, 'rb') as f:
+        f.seek(desde_byte)
+        posicion = desde_byte
+        resto = b''
+        while True:
+            datos = f.read(bytes_por_bloque)
+            if not datos:
+                break
+            datos = resto + datos
+            corte = datos.rfind(b'\n') + 1
+            resto = datos[corte:]
+            if corte == 0:
+                continue
+            df, invalidas = _parsear_texto(io.BytesIO(datos[:corte]))
+            posicion += corte
+            bloque = {col: df[col].to_numpy() for col in COLUMNAS + ['fecha']}
+            bloque['fecha_invalida'] = invalidas
+            yield bloque, posicion
+
+
+def leer_por_bloques(archivo='valpoall.txt', desde_byte=0, bytes_por_bloque=BYTES_POR_BLOQUE):
+    """Generador de bloques tipados (dict columna -> array) con memoria acotada"""
+    for bloque, _ in _iterar_bloques(archivo, desde_byte, bytes_por_bloque):
+        yield bloque
+
+
+class LectorIncremental:
+    """
+    Lee sólo las líneas agregadas al archivo desde la última lectura.
+    El estado (posición y prefijo del archivo) es un dict serializable que
+    el consumidor guarda junto a sus propios resultados. Si el archivo fue
+    truncado o reemplazado se vuelve a leer desde el inicio y se marca
+    reiniciado=True para que el consumidor descarte lo acumulado.
+    """
+
+    def __init__(self, archivo, estado=None):
+        self.archivo = archivo
+        self.estado = dict(estado) if estado else {'offset': 0, 'prefijo': None}
+        self.reiniciado = False
+
+    def _prefijo(self):
+        with open(self.archivo, 'rb') as f:
+            return hashlib.blake2b(f.read(BYTES_PREFIJO), digest_size=16).hexdigest()
+
+    def bloques(self, bytes_por_bloque=BYTES_POR_BLOQUE):
+        """
+        Retorna un generador de los bloques nuevos que avanza la posición
+        guardada en el estado. reiniciado queda definido antes de iterar.
+        """
+        offset = self.estado['offset']
+        if offset > 0:
+            cambiado = (offset > os.path.getsize(self.archivo) or
+                        (offset >= BYTES_PREFIJO and self._prefijo() != self.estado['prefijo']))
+            if cambiado:
+                offset = 0
+                self.reiniciado = True
+        return self._generar(offset, bytes_por_bloque)
+
+    def _generar(self, offset, bytes_por_bloque):
+        for bloque, fin in _iterar_bloques(self.archivo, offset, bytes_por_bloque):
+            self.estado['offset'] = fin
+            yield bloque
+        self.estado['prefijo'] = self._prefijo()
+
+
+def cargar_estado(ruta):
+    """Lee un estado incremental guardado en JSON (None si no existe)"""
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def guardar_estado(ruta, estado):
+    """Guarda un estado incremental en JSON de forma atómica"""
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(estado, f)
+    os.replace(ruta + '.tmp', ruta)
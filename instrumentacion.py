@@ -0,0 +1,153 @@
+import bisect
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Límites (segundos) de los buckets del histograma de latencia de la API
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Pila de mediciones abiertas en este proceso; las terminadas sin padre
+# quedan en _mediciones hasta que se retiran con tomar_mediciones()
+_pila = []
+_mediciones = []
+
+
+def rss_pico_mb():
+    """Memoria residente máxima del proceso hasta ahora (None si no se puede medir)"""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KiB y macOS bytes
+    return pico / 2**20 if sys.platform == 'darwin' else pico / 2**10
+
+
+class Medicion:
+    """Tiempo de pared, tiempo de CPU, RSS pico y filas de una etapa o subetapa"""
+
+    def __init__(self, nombre, filas=None):
+        self.nombre = nombre
+        self.filas = filas
+        self.pared = None
+        self.cpu = None
+        self.rss_pico_mb = None
+        self.perfil = None
+        self.subetapas = []
+
+    def agregar_filas(self, filas):
+        self.filas = (self.filas or 0) + int(filas)
+
+    def a_dict(self):
+        datos = {'nombre': self.nombre, 'pared': self.pared, 'cpu': self.cpu,
+                 'rss_pico_mb': self.rss_pico_mb, 'filas': self.filas}
+        if self.perfil:
+            datos['perfil'] = self.perfil
+        if self.subetapas:
+            datos['subetapas'] = [s.a_dict() for s in self.subetapas]
+        return datos
+
+
+@contextmanager
+def etapa(nombre, filas=None, perfil=None):
+    """
+    Mide el bloque: with etapa('cargar_datos') as m: ... m.agregar_filas(n).
+    Las etapas anidadas quedan como subetapas de la que las contiene.
+    Con perfil (ruta .prof) el bloque se ejecuta bajo cProfile.
+    """
+    medicion = Medicion(nombre, filas)
+    perfilador = cProfile.Profile() if perfil else None
+    _pila.append(medicion)
+    inicio_pared, inicio_cpu = time.perf_counter(), time.process_time()
+    if perfilador:
+        perfilador.enable()
+    try:
+        yield medicion
+    finally:
+        if perfilador:
+            perfilador.disable()
+            os.makedirs(os.path.dirname(perfil) or '.', exist_ok=True)
+            perfilador.dump_stats(perfil)
+            medicion.perfil = perfil
+        medicion.pared = time.perf_counter() - inicio_pared
+        medicion.cpu = time.process_time() - inicio_cpu
+        medicion.rss_pico_mb = rss_pico_mb()
+        if medicion.filas is None and medicion.subetapas:
+            # Las subetapas recorren los mismos registros: se informa la mayor cantidad
+            medicion.filas = max((s.filas or 0 for s in medicion.subetapas), default=None)
+        _pila.pop()
+        (_pila[-1].subetapas if _pila else _mediciones).append(medicion)
+
+
+def tomar_mediciones():
+    """Retira y retorna (como dicts) las mediciones de nivel superior terminadas"""
+    terminadas = [m.a_dict() for m in _mediciones]
+    _mediciones.clear()
+    return terminadas
+
+
+def guardar_reporte(ruta, reporte):
+    """Guarda el reporte de ejecución en JSON de forma atómica"""
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(ruta + '.tmp', ruta)
+
+
+class Histograma:
+    """Histograma acumulativo con buckets fijos, seguro entre hilos"""
+
+    def __init__(self, limites=LIMITES_LATENCIA):
+        self.limites = tuple(limites)
+        self.conteos = [0] * (len(self.limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def observar(self, valor):
+        i = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self.conteos[i] += 1
+            self.suma += valor
+            self.total += 1
+
+    def acumulados(self):
+        """Pares (límite, observaciones <= límite), terminando en ('+Inf', total)"""
+        acumulado, pares = 0, []
+        for limite, conteo in zip(self.limites + ('+Inf',), self.conteos):
+            acumulado += conteo
+            pares.append((limite, acumulado))
+        return pares
+
+
+def _etiquetas(etiquetas):
+    return ','.join(f'{k}="{v}"' for k, v in etiquetas.items())
+
+
+def formato_prometheus(histogramas, contadores):
+    """
+    Texto en el formato de exposición de Prometheus.
+    histogramas: {nombre: {etiquetas (tupla de pares): Histograma}}
+    contadores: {nombre: {etiquetas (tupla de pares): valor}}
+    """
+    lineas = []
+    for nombre, series in histogramas.items():
+        lineas.append(f'# TYPE {nombre} histogram')
+        for etiquetas, histograma in sorted(series.items()):
+            etiquetas = dict(etiquetas)
+            for limite, acumulado in histograma.acumulados():
+                lineas.append(f'{nombre}_bucket{{{_etiquetas({**etiquetas, "le": limite})}}} {acumulado}')
+            lineas.append(f'{nombre}_sum{{{_etiquetas(etiquetas)}}} {histograma.suma}')
+            lineas.append(f'{nombre}_count{{{_etiquetas(etiquetas)}}} {histograma.total}')
+    for nombre, series in contadores.items():
+        lineas.append(f'# TYPE {nombre} counter')
+        for etiquetas, valor in sorted(series.items()):
+            lineas.append(f'{nombre}{{{_etiquetas(dict(etiquetas))}}} {valor}')
+    return '\n'.join(lineas) + '\n'
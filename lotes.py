@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def tramos(fechas, inicios, fines):
+    """
+    Índices [i, j) de cada rango inicio <= fecha <= fin sobre el índice
+    ordenado fechas: dos búsquedas binarias vectorizadas para todos los rangos
+    """
+    i = np.searchsorted(fechas, np.asarray(inicios, dtype='datetime64[ns]'), side='left')
+    j = np.searchsorted(fechas, np.asarray(fines, dtype='datetime64[ns]'), side='right')
+    return i, np.maximum(i, j)
+
+
+def resumen_tramos(valores, i, j):
+    """
+    (n, mínimo, máximo) de cada tramo valores[i:j] sin bucles: reduceat
+    sobre los índices intercalados i0, j0, i1, j1... toma en las posiciones
+    pares la reducción de cada tramo (los tramos pueden solaparse). Los NaN
+    se ignoran y los tramos vacíos dan NaN.
+    """
+    n = j - i
+    if len(n) == 0:
+        return n, np.empty(0), np.empty(0)
+    # Un elemento extra para que j == len(valores) sea un índice válido
+    extendidos = np.append(np.asarray(valores, dtype=np.float64), np.nan)
+    indices = np.empty(2 * len(i), dtype=np.intp)
+    indices[0::2], indices[1::2] = i, j
+    minimo = np.fmin.reduceat(extendidos, indices)[0::2]
+    maximo = np.fmax.reduceat(extendidos, indices)[0::2]
+    minimo[n == 0] = maximo[n == 0] = np.nan
+    return n, minimo, maximo
+
+
+def siguientes_eventos(tiempos, alturas, desde):
+    """
+    Primer evento (de tiempos ordenados) en o después de cada fecha de
+    desde. Retorna (tiempos, alturas, encontrados); donde no hay evento
+    posterior el tiempo es NaT y la altura NaN.
+    """
+    k = np.searchsorted(tiempos, np.asarray(desde, dtype='datetime64[ns]'), side='left')
+    encontrados = k < len(tiempos)
+    k = np.minimum(k, max(len(tiempos) - 1, 0))
+    if len(tiempos) == 0:
+        vacio = np.full(len(k), np.datetime64('NaT'), dtype='datetime64[ns]')
+        return vacio, np.full(len(k), np.nan), encontrados
+    return (np.where(encontrados, tiempos[k], np.datetime64('NaT')),
+            np.where(encontrados, alturas[k], np.nan), encontrados)
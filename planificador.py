@@ -0,0 +1,197 @@
+import ast
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import instrumentacion
+
+EJECUTADO = 'EJECUTADO'
+CACHEADO = 'CACHEADO'
+ERROR = 'ERROR'
+
+
+def _importados(arbol, directorio, solo_nivel_modulo=False):
+    """Rutas de los módulos del directorio que importa el árbol (ast) de un archivo"""
+    nodos = arbol.body if solo_nivel_modulo else ast.walk(arbol)
+    nombres = []
+    for nodo in nodos:
+        if isinstance(nodo, ast.Import):
+            nombres.extend(alias.name for alias in nodo.names)
+        elif isinstance(nodo, ast.ImportFrom) and nodo.level == 0 and nodo.module:
+            nombres.append(nodo.module)
+    rutas = (os.path.join(directorio, nombre.split('.')[0] + '.py') for nombre in nombres)
+    return {ruta for ruta in rutas if os.path.exists(ruta)}
+
+
+def modulos_locales(funcion):
+    """
+    Archivos fuente locales de los que depende funcion: los que importa su
+    cuerpo o su módulo, y recursivamente los que importan esos (también
+    dentro de funciones, porque muchas importaciones son diferidas)
+    """
+    archivo = os.path.abspath(inspect.getsourcefile(funcion))
+    directorio = os.path.dirname(archivo)
+    with open(archivo, encoding='utf-8') as f:
+        modulo = ast.parse(f.read())
+    pendientes = (_importados(modulo, directorio, solo_nivel_modulo=True) |
+                  _importados(ast.parse(inspect.getsource(funcion)), directorio))
+    vistos = {archivo}
+    while pendientes:
+        ruta = pendientes.pop()
+        if ruta in vistos:
+            continue
+        vistos.add(ruta)
+        with open(ruta, encoding='utf-8') as f:
+            pendientes |= _importados(ast.parse(f.read()), directorio)
+    return sorted(vistos - {archivo})
+
+
+class Etapa:
+    """
+    Etapa del pipeline con sus entradas y salidas declaradas.
+    funcion debe ser una función de nivel de módulo (o un functools.partial
+    de una, para pasarle argumentos como la estación), porque se envía a
+    otro proceso, y retornar un texto con los detalles de la ejecución.
+    La firma incluye el archivo de funcion y los módulos locales que importa
+    (ver modulos_locales); codigo agrega otros archivos que afecten el
+    resultado sin importarse.
+    """
+
+    def __init__(self, nombre, funcion, entradas=(), salidas=(), depende_de=(), codigo=()):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.entradas = list(entradas)
+        self.salidas = list(salidas)
+        self.depende_de = list(depende_de)
+        base = getattr(funcion, 'func', funcion)
+        self.codigo = [inspect.getsourcefile(base)] + modulos_locales(base) + list(codigo)
+
+    def firma(self):
+        """Hash del contenido de entradas, código y argumentos de la etapa"""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(self.nombre.encode('utf-8'))
+        # Los argumentos fijados con partial (estación, modo) cambian el resultado
+        h.update(repr((getattr(self.funcion, 'args', ()),
+                       sorted(getattr(self.funcion, 'keywords', {}).items()))).encode('utf-8'))
+        for ruta in self.entradas + self.codigo:
+            h.update(ruta.encode('utf-8'))
+            if os.path.exists(ruta):
+                with open(ruta, 'rb') as f:
+                    for parte in iter(lambda: f.read(1 << 20), b''):
+                        h.update(parte)
+            else:
+                h.update(b'<faltante>')
+        return h.hexdigest()
+
+
+def _ejecutar_en_proceso(funcion, nombre, perfil=None):
+    """Ejecuta la etapa midiéndola; retorna (detalles, tiempo, métricas con sus subetapas)"""
+    try:
+        with instrumentacion.etapa(nombre, perfil=perfil) as medicion:
+            detalles = funcion()
+    finally:
+        # El proceso se reutiliza para otras etapas: no deben quedar mediciones
+        mediciones = instrumentacion.tomar_mediciones()
+    return detalles, medicion.pared, mediciones[-1]
+
+
+def _cargar_estado(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _guardar_estado(ruta, estado):
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False, indent=2)
+    os.replace(ruta + '.tmp', ruta)
+
+
+def ejecutar_etapas(etapas, ruta_estado='reportes/estado_etapas.json', max_procesos=None,
+                    forzar=False, al_terminar=None, directorio_perfiles=None):
+    """
+    Ejecuta las etapas respetando sus dependencias, en paralelo cuando son
+    independientes. Una etapa se omite (CACHEADO) si la firma de sus
+    entradas y código coincide con la última ejecución exitosa y sus
+    salidas existen. Retorna {nombre: {'estado', 'tiempo', 'detalles',
+    'metricas'}}, donde metricas es la medición de la etapa (ver
+    instrumentacion.etapa) o None si no se ejecutó; al_terminar(nombre,
+    resultado) se llama apenas termina cada etapa. Con directorio_perfiles
+    cada etapa se ejecuta bajo cProfile y deja ahí su .prof.
+    """
+    por_nombre = {etapa.nombre: etapa for etapa in etapas}
+    for etapa in etapas:
+        faltantes = [d for d in etapa.depende_de if d not in por_nombre]
+        if faltantes:
+            raise ValueError(f"La etapa {etapa.nombre} depende de etapas inexistentes: {faltantes}")
+
+    estado = _cargar_estado(ruta_estado)
+    resultados = {}
+    pendientes = list(etapas)
+    en_curso = {}
+
+    def registrar(nombre, resultado):
+        resultados[nombre] = resultado
+        if al_terminar is not None:
+            al_terminar(nombre, resultado)
+
+    with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+        while pendientes or en_curso:
+            resueltas = 0
+            for etapa in list(pendientes):
+                deps = [resultados.get(d) for d in etapa.depende_de]
+                if any(r is None for r in deps):
+                    continue
+                pendientes.remove(etapa)
+                resueltas += 1
+
+                if any(r['estado'] == ERROR for r in deps):
+                    registrar(etapa.nombre, {'estado': ERROR, 'tiempo': 0.0, 'metricas': None,
+                                             'detalles': "No se ejecutó: falló una dependencia"})
+                    continue
+
+                # Las entradas se firman recién aquí: pueden ser salidas de dependencias
+                firma = etapa.firma()
+                previo = estado.get(etapa.nombre, {})
+                if (not forzar and previo.get('firma') == firma and
+                        all(os.path.exists(s) for s in etapa.salidas)):
+                    registrar(etapa.nombre, {'estado': CACHEADO, 'tiempo': 0.0, 'metricas': None,
+                                             'detalles': previo.get('detalles', '')})
+                    continue
+
+                logging.info(f"Iniciando etapa {etapa.nombre}")
+                perfil = None
+                if directorio_perfiles:
+                    perfil = os.path.join(directorio_perfiles, etapa.nombre.replace(':', '_') + '.prof')
+                futuro = pool.submit(_ejecutar_en_proceso, etapa.funcion, etapa.nombre, perfil)
+                en_curso[futuro] = (etapa, firma, time.perf_counter())
+
+            if not en_curso:
+                if pendientes and not resueltas:
+                    raise ValueError(f"Dependencias circulares entre: {[e.nombre for e in pendientes]}")
+                continue
+
+            listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                etapa, firma, inicio = en_curso.pop(futuro)
+                try:
+                    detalles, tiempo, metricas = futuro.result()
+                except Exception as e:
+                    registrar(etapa.nombre, {'estado': ERROR, 'tiempo': time.perf_counter() - inicio,
+                                             'metricas': None,
+                                             'detalles': f"Error en {etapa.nombre}: {str(e)}"})
+                    estado.pop(etapa.nombre, None)
+                else:
+                    detalles = detalles or ''
+                    registrar(etapa.nombre, {'estado': EJECUTADO, 'tiempo': tiempo, 'detalles': detalles,
+                                             'metricas': metricas})
+                    estado[etapa.nombre] = {'firma': firma, 'detalles': detalles}
+                _guardar_estado(ruta_estado, estado)
+
+    return resultados
@@ -0,0 +1,143 @@
+import numpy as np
+
+PLEAMAR = 1
+BAJAMAR = -1
+NOMBRES_TIPO = {PLEAMAR: 'pleamar', BAJAMAR: 'bajamar'}
+
+
+def _suavizar(valores, ventana):
+    """Media móvil centrada; los NaN se propagan a las ventanas que los tocan"""
+    if ventana <= 1:
+        return valores
+    nucleo = np.ones(ventana) / ventana
+    suavizado = np.convolve(valores, nucleo, mode='same')
+    borde = ventana // 2
+    suavizado[:borde] = np.nan
+    suavizado[len(suavizado) - (ventana - 1 - borde):] = np.nan
+    return suavizado
+
+
+def _alternar(tiempos, alturas, tipos):
+    """De cada racha de eventos del mismo tipo se queda con el más extremo"""
+    if len(tipos) == 0:
+        return tiempos, alturas, tipos
+    grupo = np.concatenate([[0], np.cumsum(tipos[1:] != tipos[:-1])])
+    orden = np.lexsort((-tipos * alturas, grupo))
+    _, primeros = np.unique(grupo[orden], return_index=True)
+    elegidos = np.sort(orden[primeros])
+    return tiempos[elegidos], alturas[elegidos], tipos[elegidos]
+
+
+def extremos(fechas, valores, ventana=1, amplitud_minima=0.0):
+    """
+    Pleamares y bajamares de una serie muestreada a paso regular.
+    Un máximo (mínimo) local se refina ajustando una parábola por la
+    muestra y sus dos vecinas, lo que da la hora y la altura entre
+    muestras. ventana suaviza la serie antes de buscar (series observadas
+    con ruido) y amplitud_minima descarta oscilaciones menores entre
+    eventos consecutivos. Retorna (tiempos datetime64[ns], alturas, tipos)
+    ordenados por tiempo, con tipos alternando PLEAMAR/BAJAMAR.
+    """
+    t = np.asarray(fechas).astype('datetime64[ns]').astype(np.int64)
+    y = _suavizar(np.asarray(valores, dtype=np.float64), ventana)
+    vacio = (np.array([], dtype='datetime64[ns]'), np.array([], dtype=np.float64),
+             np.array([], dtype=np.int8))
+    if len(y) < 3:
+        return vacio
+
+    y0, y1, y2 = y[:-2], y[1:-1], y[2:]
+    paso = t[2:] - t[1:-1]
+    # Las tres muestras deben existir y estar equiespaciadas (sin huecos)
+    validos = ~(np.isnan(y0) | np.isnan(y1) | np.isnan(y2)) & (t[1:-1] - t[:-2] == paso)
+    maximos = validos & (y0 < y1) & (y1 >= y2)
+    minimos = validos & (y0 > y1) & (y1 <= y2)
+    candidatos = np.flatnonzero(maximos | minimos)
+    if len(candidatos) == 0:
+        return vacio
+
+    a, b, c = y0[candidatos], y1[candidatos], y2[candidatos]
+    curvatura = a - 2 * b + c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(curvatura != 0, 0.5 * (a - c) / curvatura, 0.0)
+    delta = np.clip(delta, -0.5, 0.5)
+    tiempos = t[candidatos + 1] + np.round(delta * paso[candidatos]).astype(np.int64)
+    alturas = b - 0.25 * (a - c) * delta
+    tipos = np.where(maximos[candidatos], PLEAMAR, BAJAMAR).astype(np.int8)
+    tiempos, alturas, tipos = _alternar(tiempos, alturas, tipos)
+
+    # Se eliminan los pares pleamar/bajamar de oscilaciones menores que
+    # amplitud_minima, empezando por los mínimos locales de la diferencia
+    while amplitud_minima > 0 and len(alturas) > 2:
+        diferencia = np.abs(np.diff(alturas))
+        izquierda = np.concatenate([[np.inf], diferencia[:-1]])
+        derecha = np.concatenate([diferencia[1:], [np.inf]])
+        pares = np.flatnonzero((diferencia < amplitud_minima) &
+                               (diferencia < izquierda) & (diferencia <= derecha))
+        if len(pares) == 0:
+            break
+        conservar = np.ones(len(alturas), dtype=bool)
+        conservar[pares] = conservar[pares + 1] = False
+        tiempos, alturas, tipos = _alternar(tiempos[conservar], alturas[conservar], tipos[conservar])
+
+    return tiempos.astype('datetime64[ns]'), alturas, tipos
+
+
+class IndiceEventos:
+    """
+    Índice compacto y ordenado de pleamares y bajamares: tiempos int64
+    (datetime64[ns]), alturas float32 y tipos int8. Las consultas se
+    resuelven con búsqueda binaria sobre los tiempos. cobertura es el
+    tramo (inicio, fin) de la serie de la que se extrajeron los eventos.
+    """
+
+    def __init__(self, tiempos, alturas, tipos, cobertura=None):
+        self.cobertura = cobertura
+        orden = np.argsort(tiempos, kind='stable')
+        self.tiempos = np.asarray(tiempos, dtype='datetime64[ns]')[orden]
+        self.alturas = np.asarray(alturas, dtype=np.float32)[orden]
+        self.tipos = np.asarray(tipos, dtype=np.int8)[orden]
+
+    @classmethod
+    def desde_serie(cls, fechas, valores, **opciones):
+        """Construye el índice extrayendo los extremos de una serie (ver extremos)"""
+        fechas = np.asarray(fechas, dtype='datetime64[ns]')
+        cobertura = (fechas[0], fechas[-1]) if len(fechas) else None
+        return cls(*extremos(fechas, valores, **opciones), cobertura=cobertura)
+
+    def __len__(self):
+        return len(self.tiempos)
+
+    def cubre(self, fecha_inicio, fecha_fin):
+        """True si el tramo pedido está dentro de la serie indexada"""
+        return (self.cobertura is not None and
+                self.cobertura[0] <= np.datetime64(fecha_inicio, 'ns') and
+                np.datetime64(fecha_fin, 'ns') <= self.cobertura[1])
+
+    def _tramo(self, i, j, tipo):
+        tiempos, alturas, tipos = self.tiempos[i:j], self.alturas[i:j], self.tipos[i:j]
+        if tipo is not None:
+            filtro = tipos == tipo
+            tiempos, alturas, tipos = tiempos[filtro], alturas[filtro], tipos[filtro]
+        return tiempos, alturas, tipos
+
+    def siguientes(self, desde, n, tipo=None):
+        """Los n eventos siguientes a desde (inclusive), opcionalmente de un tipo"""
+        i = np.searchsorted(self.tiempos, np.datetime64(desde, 'ns'), side='left')
+        # Los tipos alternan: 2n + 1 eventos contienen n de cada tipo
+        j = i + (n if tipo is None else 2 * n + 1)
+        tiempos, alturas, tipos = self._tramo(i, j, tipo)
+        return tiempos[:n], alturas[:n], tipos[:n]
+
+    def rango(self, fecha_inicio, fecha_fin, tipo=None):
+        """Eventos con fecha_inicio <= tiempo <= fecha_fin"""
+        i = np.searchsorted(self.tiempos, np.datetime64(fecha_inicio, 'ns'), side='left')
+        j = np.searchsorted(self.tiempos, np.datetime64(fecha_fin, 'ns'), side='right')
+        return self._tramo(i, j, tipo)
+
+
+def eventos_a_dict(tiempos, alturas, tipos, formato_fecha='%Y-%m-%dT%H:%M:%S'):
+    """Lista de eventos serializable a JSON"""
+    import pandas as pd
+    fechas = pd.DatetimeIndex(tiempos).strftime(formato_fecha)
+    return [{'fecha': fecha, 'tipo': NOMBRES_TIPO[int(tipo)], 'altura': round(float(altura), 3)}
+            for fecha, altura, tipo in zip(fechas, alturas, tipos)]
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+def _bordes(n, n_buckets):
+    return np.linspace(0, n, n_buckets + 1).astype(np.int64)
+
+
+def indices_minmax(y, n_buckets):
+    """
+    Índices que conservan la envolvente visual de la serie: el primer y
+    último punto más el mínimo y el máximo de cada bucket. Resultado
+    ordenado, con a lo más 2 * n_buckets + 2 índices. Los NaN se ignoran.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= 2 * n_buckets + 2:
+        return np.arange(n)
+
+    inicios = _bordes(n, n_buckets)[:-1]
+    bucket = np.repeat(np.arange(n_buckets), np.diff(_bordes(n, n_buckets)))
+    maximos = np.fmax.reduceat(y, inicios)
+    minimos = np.fmin.reduceat(y, inicios)
+
+    indices = [np.array([0, n - 1])]
+    for extremo in (maximos, minimos):
+        coincide = np.flatnonzero(y == extremo[bucket])
+        # Primera coincidencia de cada bucket (los buckets sólo con NaN no aportan)
+        _, primera = np.unique(bucket[coincide], return_index=True)
+        indices.append(coincide[primera])
+    return np.unique(np.concatenate(indices))
+
+
+def indices_lttb(y, n_puntos, x=None):
+    """
+    Largest-Triangle-Three-Buckets: elige en cada bucket el punto que forma
+    el triángulo de mayor área con el punto elegido en el bucket anterior
+    y el promedio del siguiente. El área se calcula vectorizada dentro de
+    cada bucket; sólo el recorrido de buckets es secuencial.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_puntos >= n or n_puntos < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    y_llenado = np.where(np.isnan(y), np.nanmean(y), y)
+
+    bordes = 1 + _bordes(n - 2, n_puntos - 2)
+    seleccion = np.empty(n_puntos, dtype=np.int64)
+    seleccion[0], seleccion[-1] = 0, n - 1
+    anterior = 0
+    for i in range(n_puntos - 2):
+        a, b = bordes[i], bordes[i + 1]
+        c, d = b, (bordes[i + 2] if i + 2 < len(bordes) else n)
+        x_sig, y_sig = x[c:d].mean(), y_llenado[c:d].mean()
+        area = np.abs((x[anterior] - x_sig) * (y_llenado[a:b] - y_llenado[anterior]) -
+                      (x[anterior] - x[a:b]) * (y_sig - y_llenado[anterior]))
+        anterior = a + int(np.argmax(area))
+        seleccion[i + 1] = anterior
+    return seleccion
+
+
+def reducir_serie(x, y, max_puntos, metodo='minmax'):
+    """Reduce (x, y) a lo más ~max_puntos conservando su forma"""
+    if max_puntos is None or len(y) <= max_puntos:
+        return x, y
+    if metodo == 'lttb':
+        indices = indices_lttb(y, max_puntos)
+    elif metodo == 'minmax':
+        indices = indices_minmax(y, max(1, (max_puntos - 2) // 2))
+    else:
+        raise ValueError(f"Método de reducción desconocido: {metodo}")
+    return x[indices], y[indices]
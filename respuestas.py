@@ -0,0 +1,68 @@
+import gzip
+import json
+import struct
+import zlib
+import numpy as np
+
+MIME_JSON = 'application/json'
+MIME_BINARIO = 'application/octet-stream'
+FORMATOS = ('json', 'compacto', 'binario')
+
+# Cuerpos más chicos no ganan nada al comprimirse
+MIN_BYTES_COMPRIMIR = 1024
+
+# Cabecera binaria: firma, inicio (epoch s), paso (s, 0 = irregular), cantidad
+CABECERA_BINARIA = struct.Struct('<4sqiI')
+FIRMA_BINARIA = b'PRN1'
+
+
+def serie_compacta(fechas, valores):
+    """Retorna (epoch en segundos, paso en segundos o 0 si es irregular, valores float32)"""
+    epoch = np.asarray(fechas).astype('datetime64[s]').astype(np.int64)
+    pasos = np.diff(epoch)
+    paso = int(pasos[0]) if len(pasos) and (pasos == pasos[0]).all() else 0
+    return epoch, paso, np.asarray(valores, dtype=np.float32)
+
+
+def codificar_serie(fechas, valores, formato='json', formato_fecha='%Y-%m-%d %H:%M:%S'):
+    """
+    Serializa una serie de pronóstico. Retorna (bytes, mimetype).
+    - json: listas de fechas como texto y valores (formato original)
+    - compacto: JSON con inicio + paso en epoch y los valores redondeados
+    - binario: cabecera CABECERA_BINARIA, las fechas int64 sólo si el paso
+      es irregular, y los valores float32 little-endian
+    """
+    if formato == 'json':
+        import pandas as pd
+        datos = {
+            'fechas': pd.DatetimeIndex(fechas).strftime(formato_fecha).tolist(),
+            'valores': np.asarray(valores).tolist()
+        }
+        return json.dumps(datos).encode('utf-8'), MIME_JSON
+
+    epoch, paso, valores32 = serie_compacta(fechas, valores)
+    inicio = int(epoch[0]) if len(epoch) else 0
+    if formato == 'compacto':
+        datos = {'inicio': inicio, 'paso': paso, 'n': len(epoch),
+                 'valores': np.round(np.asarray(valores, dtype=np.float64), 4).tolist()}
+        if paso == 0:
+            datos['epoch'] = epoch.tolist()
+        return json.dumps(datos).encode('utf-8'), MIME_JSON
+    if formato == 'binario':
+        partes = [CABECERA_BINARIA.pack(FIRMA_BINARIA, inicio, paso, len(epoch))]
+        if paso == 0:
+            partes.append(epoch.astype('<i8').tobytes())
+        partes.append(valores32.astype('<f4').tobytes())
+        return b''.join(partes), MIME_BINARIO
+    raise ValueError(f"Formato desconocido: {formato}")
+
+
+def comprimir(cuerpo, codificacion):
+    """Comprime el cuerpo con gzip o deflate; retorna (bytes, codificación aplicada)"""
+    if codificacion is None or len(cuerpo) < MIN_BYTES_COMPRIMIR:
+        return cuerpo, None
+    if codificacion == 'gzip':
+        return gzip.compress(cuerpo, compresslevel=6), 'gzip'
+    if codificacion == 'deflate':
+        return zlib.compress(cuerpo, 6), 'deflate'
+    return cuerpo, None
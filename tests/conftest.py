@@ -0,0 +1,18 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Los módulos del proyecto están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(12345)
+
+
+def serie_marea(horas, amplitudes=(1.0, 0.3), periodos=(12.42, 23.93), nivel=2.0):
+    """Marea sintética (metros) en horas desde el origen: suma de cosenos"""
+    horas = np.asarray(horas, dtype=np.float64)
+    return nivel + sum(a * np.cos(2 * np.pi * horas / p) for a, p in zip(amplitudes, periodos))
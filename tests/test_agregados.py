@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+from agregados import Agregados, _reducir, ESTADISTICAS
+
+COLUMNAS = ['keller', 'vega']
+UNIDADES = {'horario': 'h', 'diario': 'D', 'mensual': 'M'}
+
+
+def _datos(rng, n=24 * 120):
+    # Diez minutos entre registros, con huecos por sensor
+    fechas = np.datetime64('2023-12-20T00:00', 'ns') + np.arange(n) * np.timedelta64(10, 'm')
+    valores = rng.normal(2.0, 0.5, (n, len(COLUMNAS)))
+    valores[rng.random(valores.shape) < 0.1] = np.nan
+    valores[500:800, 1] = np.nan
+    return fechas, valores
+
+
+def _esperado(fechas, valores, nivel):
+    claves = fechas.astype(f'datetime64[{UNIDADES[nivel]}]').astype('datetime64[ns]')
+    grupos = pd.DataFrame(valores, columns=COLUMNAS).groupby(claves)
+    return {'conteo': grupos.count(), 'media': grupos.mean(), 'desviacion': grupos.std(),
+            'minimo': grupos.min(), 'maximo': grupos.max()}
+
+
+def _comparar(agregados, fechas, valores):
+    for nivel in UNIDADES:
+        esperado = _esperado(fechas, valores, nivel)
+        inicios, columnas = agregados.consultar(nivel)
+        np.testing.assert_array_equal(inicios.astype('datetime64[ns]'), esperado['conteo'].index.to_numpy())
+        for c in COLUMNAS:
+            for e in ('conteo', 'media', 'desviacion', 'minimo', 'maximo'):
+                np.testing.assert_allclose(columnas[c][e], esperado[e][c].to_numpy(), rtol=1e-10,
+                                           err_msg=f'{nivel} {c} {e}')
+
+
+def test_reducir_combina_varianzas(rng):
+    # Filas parciales (conteo, media, M2, mín, máx) de grupos de valores crudos
+    claves, partes = [], []
+    for clave in range(20):
+        for _ in range(rng.integers(1, 5)):
+            claves.append(clave)
+            partes.append(rng.normal(clave, 1 + clave / 10, rng.integers(0, 30)))
+    conteo = np.array([[len(p)] for p in partes])
+    media = np.array([[p.mean() if len(p) else np.nan] for p in partes])
+    m2 = np.array([[((p - p.mean()) ** 2).sum() if len(p) else 0.0] for p in partes])
+    minimo = np.array([[p.min() if len(p) else np.nan] for p in partes])
+    maximo = np.array([[p.max() if len(p) else np.nan] for p in partes])
+
+    buckets, reducidas = _reducir(np.array(claves), conteo, media, m2, minimo, maximo)
+    for k, clave in enumerate(buckets):
+        valores = np.concatenate([p for c, p in zip(claves, partes) if c == clave])
+        assert reducidas['conteo'][k, 0] == len(valores)
+        if len(valores):
+            assert reducidas['media'][k, 0] == pytest.approx(valores.mean(), rel=1e-12)
+            assert reducidas['m2'][k, 0] == pytest.approx(((valores - valores.mean()) ** 2).sum(), rel=1e-10)
+            assert reducidas['minimo'][k, 0] == valores.min()
+            assert reducidas['maximo'][k, 0] == valores.max()
+        else:
+            assert np.isnan(reducidas['minimo'][k, 0])
+
+
+def test_agregados_igual_a_groupby(rng):
+    fechas, valores = _datos(rng)
+    agregados = Agregados(COLUMNAS)
+    agregados.actualizar(fechas, valores)
+    _comparar(agregados, fechas, valores)
+
+
+@pytest.mark.parametrize('cortes', [[1], [37, 1000, 1001], [144 * 12 + 5, 144 * 13]])
+def test_agregados_incremental_igual_a_completo(rng, cortes):
+    # Los cortes caen a mitad de hora, de día y de mes
+    fechas, valores = _datos(rng)
+    agregados = Agregados(COLUMNAS)
+    for f, v in zip(np.split(fechas, cortes), np.split(valores, cortes)):
+        agregados.actualizar(f, v)
+    _comparar(agregados, fechas, valores)
+
+
+def test_agregados_sobreviven_guardar(rng, tmp_path):
+    fechas, valores = _datos(rng)
+    agregados = Agregados(COLUMNAS)
+    agregados.actualizar(fechas[:2000], valores[:2000])
+    agregados.lector = {'offset': 0, 'prefijo': None}
+    agregados.guardar(str(tmp_path / 'agregados.npz'))
+    copia = Agregados.cargar(str(tmp_path / 'agregados.npz'))
+    copia.actualizar(fechas[2000:], valores[2000:])
+    _comparar(copia, fechas, valores)
+    assert all(copia.tablas['horario'][e].dtype == agregados.tablas['horario'][e].dtype for e in ESTADISTICAS)
+
+
+def test_nivel_para_y_consultar_por_rango(rng):
+    fechas, valores = _datos(rng)
+    agregados = Agregados(COLUMNAS)
+    agregados.actualizar(fechas, valores)
+    assert agregados.nivel_para('2024-01-01', '2024-03-01') == 'mensual'
+    assert agregados.nivel_para('2024-01-01', '2024-01-31') == 'diario'
+    assert agregados.nivel_para('2024-01-01T05:00', '2024-01-02') == 'horario'
+    inicios, columnas = agregados.consultar('diario', '2024-01-01T12:00', '2024-01-03')
+    np.testing.assert_array_equal(inicios, np.array(['2024-01-02', '2024-01-03'], dtype='datetime64[D]'))
+    assert len(columnas['keller']['media']) == 2
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from benchmark import generar_datos_sinteticos
+from control_calidad import (actualizar_control_movil, actualizar_estadisticas_incrementales,
+                             analizar_incremental, calcular_resultado_qc, resultado_desde_acumuladores)
+from control_movil import detectar
+from ingesta import cargar_valpoall, SENSORES
+
+FILAS = 6000
+
+
+@pytest.fixture
+def archivo(tmp_path):
+    ruta = tmp_path / 'sensores.txt'
+    generar_datos_sinteticos(str(ruta), FILAS, fraccion_fechas_invalidas=0)
+    return ruta
+
+
+def _por_partes(archivo, cortes, actualizar, ruta_estado):
+    """Escribe el archivo de a poco, como si llegaran registros, y actualiza tras cada parte"""
+    lineas = archivo.read_bytes().splitlines(keepends=True)
+    parcial = archivo.with_name('parcial.txt')
+    parcial.write_bytes(b'')
+    resultados = []
+    for a, b in zip([0] + cortes, cortes + [len(lineas)]):
+        with open(parcial, 'ab') as f:
+            f.write(b''.join(lineas[a:b]))
+        resultados.append(actualizar(str(parcial), str(ruta_estado)))
+    return resultados
+
+
+def test_estadisticas_incrementales_igual_a_completo(archivo, tmp_path):
+    cortes = [1000, 1001, 4500]
+    resultados = _por_partes(archivo, cortes, actualizar_estadisticas_incrementales,
+                             tmp_path / 'estadisticas.json')
+    acumuladores, filas, _ = resultados[-1]
+    assert [r[2] for r in resultados] == np.diff([0] + cortes + [FILAS]).tolist()
+
+    df, _ = cargar_valpoall(str(archivo), usar_cache=False)
+    completo = calcular_resultado_qc(df)
+    incremental = resultado_desde_acumuladores(acumuladores, filas=filas)
+    assert incremental['n'] == completo['n'] == FILAS
+    np.testing.assert_array_equal(incremental['faltantes'], completo['faltantes'])
+    np.testing.assert_allclose(incremental['media'], completo['media'], rtol=1e-10)
+    np.testing.assert_allclose(incremental['desviacion'], completo['desviacion'], rtol=1e-8)
+    for clave in ('n', 'pendiente', 'intercepto', 'r', 'error_estandar'):
+        assert incremental['regresion'][clave] == pytest.approx(completo['regresion'][clave], rel=1e-8)
+    # Los límites IQR salen del boceto de cuantiles: aproximados
+    np.testing.assert_allclose(incremental['limite_inferior'], completo['limite_inferior'], rtol=0.02, atol=0.02)
+    np.testing.assert_allclose(incremental['limite_superior'], completo['limite_superior'], rtol=0.02, atol=0.02)
+
+
+def test_control_movil_incremental_igual_a_completo(archivo, tmp_path):
+    resultados = _por_partes(archivo, [700, 2500, 2501], actualizar_control_movil, tmp_path / 'control.json')
+    assert resultados[0]['desde'] == 0
+    for a, b in zip(resultados, resultados[1:]):
+        assert a['hasta'] == b['desde']
+
+    df, _ = cargar_valpoall(str(archivo), usar_cache=False)
+    completo = detectar(df[SENSORES].to_numpy())
+    # La última fila espera a su vecina siguiente
+    hasta = resultados[-1]['hasta']
+    assert hasta == FILAS - 1
+    for campo in ('pico', 'deriva_ewma', 'deriva_cusum', 'ewma', 'cusum_pos', 'cusum_neg'):
+        unido = np.concatenate([r[campo] for r in resultados])
+        np.testing.assert_allclose(unido, completo[campo][:hasta], rtol=1e-9, atol=1e-12, err_msg=campo)
+
+
+def test_analizar_incremental_sin_datos_nuevos(archivo, tmp_path):
+    ruta_estado = str(tmp_path / 'estadisticas.json')
+    assert f'Registros nuevos: {FILAS} (total {FILAS})' in analizar_incremental(str(archivo), ruta_estado)
+    assert f'Registros nuevos: 0 (total {FILAS})' in analizar_incremental(str(archivo), ruta_estado)
+    assert (tmp_path / 'control_movil.json').exists()
@@ -0,0 +1,82 @@
+import json
+import numpy as np
+import pytest
+from control_movil import ControlMovil, detectar, _cusum, _ewma
+from conftest import serie_marea
+
+CAMPOS = ('residuo', 'escala', 'pico', 'diferencia', 'ewma', 'deriva_ewma',
+          'cusum_pos', 'cusum_neg', 'deriva_cusum')
+
+
+def _sensores(rng, n=2000, n_picos=8):
+    """Keller y Vega con picos aislados, deriva de Vega desde la mitad y huecos"""
+    horas = np.arange(n)
+    keller = serie_marea(horas) + rng.normal(0, 0.01, n)
+    vega = keller + rng.normal(0, 0.01, n)
+    vega[n // 2:] += np.linspace(0, 0.3, n - n // 2)
+    picos = rng.choice(np.arange(10, n - 10), n_picos, replace=False)
+    keller[picos] += 1.0
+    otros = np.column_stack([15 + rng.normal(0, 0.5, n), 1013 + rng.normal(0, 1, n),
+                             np.clip(80 + rng.normal(0, 5, n), 0, 100), 14 + rng.normal(0, 0.3, n)])
+    X = np.column_stack([keller, vega, otros])
+    X[rng.random(X.shape) < 0.02] = np.nan
+    return X, picos
+
+
+def _por_partes(X, cortes, serializar=False):
+    control = ControlMovil()
+    partes = []
+    bloques = np.split(X, cortes)
+    for k, bloque in enumerate(bloques):
+        if serializar:
+            control = ControlMovil(json.loads(json.dumps(control.estado)))
+        partes.append(control.actualizar(bloque, final=k == len(bloques) - 1))
+    return partes
+
+
+@pytest.mark.parametrize('cortes', [[1000], [1, 2, 3, 170, 171, 900], list(range(100, 2000, 100))])
+def test_incremental_igual_a_completo(rng, cortes):
+    X, _ = _sensores(rng)
+    completo = detectar(X)
+    partes = _por_partes(X, cortes, serializar=True)
+    assert partes[0]['desde'] == 0 and partes[-1]['hasta'] == len(X)
+    for a, b in zip(partes, partes[1:]):
+        assert a['hasta'] == b['desde']
+    for campo in CAMPOS:
+        unido = np.concatenate([p[campo] for p in partes])
+        np.testing.assert_allclose(unido, completo[campo], rtol=1e-9, atol=1e-12, err_msg=campo)
+
+
+def test_detecta_picos(rng):
+    X, picos = _sensores(rng)
+    marcados = np.flatnonzero(detectar(X)['pico'][:, 0])
+    presentes = [p for p in picos if not np.isnan(X[p - 1:p + 2, 0]).any()]
+    assert set(presentes) <= set(marcados)
+    assert len(marcados) <= len(picos) + 2
+
+
+def test_detecta_deriva(rng):
+    X, _ = _sensores(rng, n_picos=0)
+    resultado = detectar(X)
+    # Sin deriva en la primera mitad; con deriva al final
+    mitad = len(X) // 2
+    assert not resultado['deriva_cusum'][:mitad].any()
+    assert resultado['deriva_cusum'][-100:].all()
+    assert resultado['deriva_ewma'][-100:].all()
+
+
+def test_cusum_igual_a_recurrencia(rng):
+    incrementos = rng.normal(-0.2, 1, 500)
+    s, esperado = 1.5, []
+    for x in incrementos:
+        s = max(0.0, s + x)
+        esperado.append(s)
+    np.testing.assert_allclose(_cusum(incrementos, 1.5), esperado, rtol=1e-12, atol=1e-12)
+
+
+def test_ewma_con_inicial_igual_a_serie_completa(rng):
+    x = rng.normal(0, 1, 300)
+    x[rng.random(300) < 0.1] = np.nan
+    completa = _ewma(x, 0.05)
+    continuada = _ewma(x[150:], 0.05, inicial=completa[149])
+    np.testing.assert_allclose(continuada, completa[150:], rtol=1e-12)
@@ -0,0 +1,167 @@
+import numpy as np
+import pytest
+from estadisticas import AcumuladorPar, AcumuladorSensor, BocetoCuantiles, kernel_qc
+
+
+def _con_huecos(rng, n, fraccion=0.05):
+    valores = rng.normal(2.0, 0.5, n)
+    valores[rng.random(n) < fraccion] = np.nan
+    return valores
+
+
+def test_acumulador_por_bloques_igual_a_numpy(rng):
+    valores = _con_huecos(rng, 5000)
+    acumulador = AcumuladorSensor()
+    for bloque in np.array_split(valores, 7):
+        acumulador.actualizar_lote(bloque)
+    validos = valores[~np.isnan(valores)]
+    assert acumulador.n == len(validos)
+    assert acumulador.media == pytest.approx(validos.mean(), rel=1e-12)
+    assert acumulador.varianza == pytest.approx(validos.var(ddof=1), rel=1e-10)
+    assert (acumulador.minimo, acumulador.maximo) == (validos.min(), validos.max())
+    assert acumulador.rms == pytest.approx(np.sqrt(np.mean(validos ** 2)), rel=1e-10)
+
+
+def test_acumulador_valor_a_valor_igual_a_lote(rng):
+    valores = _con_huecos(rng, 500)
+    uno, lote = AcumuladorSensor(), AcumuladorSensor()
+    for x in valores:
+        uno.actualizar(x)
+    lote.actualizar_lote(valores)
+    assert uno.n == lote.n
+    assert uno.media == pytest.approx(lote.media, rel=1e-12)
+    assert uno.m2 == pytest.approx(lote.m2, rel=1e-10)
+
+
+def test_combinar_acumuladores_igual_a_concatenar(rng):
+    a, b = _con_huecos(rng, 3000), _con_huecos(rng, 1200) + 5
+    izquierda, derecha, total = AcumuladorSensor(), AcumuladorSensor(), AcumuladorSensor()
+    izquierda.actualizar_lote(a)
+    derecha.actualizar_lote(b)
+    total.actualizar_lote(np.concatenate([a, b]))
+    izquierda.combinar(derecha)
+    assert izquierda.n == total.n
+    assert izquierda.media == pytest.approx(total.media, rel=1e-12)
+    assert izquierda.m2 == pytest.approx(total.m2, rel=1e-10)
+    assert (izquierda.minimo, izquierda.maximo) == (total.minimo, total.maximo)
+    for q in (0.25, 0.5, 0.75):
+        assert izquierda.cuantil(q) == pytest.approx(total.cuantil(q), abs=1e-3)
+
+
+def test_acumulador_sobrevive_serializacion(rng):
+    acumulador = AcumuladorSensor()
+    acumulador.actualizar_lote(_con_huecos(rng, 2000))
+    copia = AcumuladorSensor.desde_dict(acumulador.a_dict())
+    assert (copia.n, copia.media, copia.m2) == (acumulador.n, acumulador.media, acumulador.m2)
+    assert copia.cuantil(0.9) == acumulador.cuantil(0.9)
+
+
+def test_boceto_exacto_con_resolucion_fija(rng):
+    # Pocos valores distintos (resolución 0.1): los cuantiles son los de numpy
+    valores = np.round(rng.normal(15, 3, 20000), 1)
+    boceto = BocetoCuantiles(tamaño_buffer=1000)
+    for bloque in np.array_split(valores, 13):
+        boceto.agregar_lote(bloque)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        assert boceto.cuantil(q, valores.min(), valores.max()) == pytest.approx(np.quantile(valores, q))
+
+
+def test_boceto_combinado_aproxima_cuantiles(rng):
+    valores = rng.normal(0, 1, 50000)
+    partes = []
+    for bloque in np.array_split(valores, 5):
+        boceto = BocetoCuantiles(compresion=200)
+        boceto.agregar_lote(bloque)
+        partes.append(boceto)
+    total = partes[0]
+    for otro in partes[1:]:
+        total.combinar(otro)
+    assert total.total == len(valores)
+    ordenados = np.sort(valores)
+    for q in (0.001, 0.1, 0.25, 0.5, 0.75, 0.9, 0.999):
+        estimado = total.cuantil(q, valores.min(), valores.max())
+        # Error medido en rango: el boceto es más fino en las colas
+        rango = np.searchsorted(ordenados, estimado) / len(valores)
+        assert abs(rango - q) < 0.005
+
+
+def test_acumulador_par_igual_a_linregress(rng):
+    stats = pytest.importorskip('scipy.stats')
+    x = _con_huecos(rng, 4000)
+    y = 0.98 * x + 0.03 + rng.normal(0, 0.02, len(x))
+    y[rng.random(len(y)) < 0.05] = np.nan
+    par = AcumuladorPar()
+    for bx, by in zip(np.array_split(x, 6), np.array_split(y, 6)):
+        par.actualizar_lote(bx, by)
+    pareados = ~(np.isnan(x) | np.isnan(y))
+    esperado = stats.linregress(x[pareados], y[pareados])
+    assert par.n == pareados.sum()
+    assert par.pendiente == pytest.approx(esperado.slope, rel=1e-10)
+    assert par.intercepto == pytest.approx(esperado.intercept, rel=1e-10)
+    assert par.correlacion == pytest.approx(esperado.rvalue, rel=1e-10)
+    assert par.error_estandar == pytest.approx(esperado.stderr, rel=1e-8)
+
+
+def test_acumulador_par_valor_a_valor_igual_a_lote(rng):
+    x, y = _con_huecos(rng, 300), _con_huecos(rng, 300)
+    uno, lote = AcumuladorPar(), AcumuladorPar()
+    for a, b in zip(x, y):
+        uno.actualizar(a, b)
+    lote.actualizar_lote(x, y)
+    assert uno.n == lote.n
+    assert uno.c == pytest.approx(lote.c, rel=1e-9)
+    assert uno.pendiente == pytest.approx(lote.pendiente, rel=1e-9)
+
+
+def _matriz(rng, n=3000):
+    keller = _con_huecos(rng, n)
+    vega = keller + rng.normal(0.01, 0.02, n)
+    vega[rng.random(n) < 0.05] = np.nan
+    otros = rng.normal([12, 1013, 80], [3, 5, 10], (n, 3))
+    otros[rng.random(otros.shape) < 0.1] = np.nan
+    return np.column_stack([keller, vega, otros])
+
+
+def test_kernel_qc_igual_a_numpy_y_linregress(rng):
+    stats = pytest.importorskip('scipy.stats')
+    X = _matriz(rng)
+    resultado = kernel_qc(X)
+    np.testing.assert_allclose(resultado['media'], np.nanmean(X, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(resultado['desviacion'], np.nanstd(X, axis=0, ddof=1), rtol=1e-10)
+    np.testing.assert_allclose(resultado['q1'], np.nanquantile(X, 0.25, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(resultado['q3'], np.nanquantile(X, 0.75, axis=0), rtol=1e-12)
+    np.testing.assert_array_equal(resultado['faltantes'], np.isnan(X).sum(axis=0))
+
+    pareados = ~(np.isnan(X[:, 0]) | np.isnan(X[:, 1]))
+    esperado = stats.linregress(X[pareados, 0], X[pareados, 1])
+    regresion = resultado['regresion']
+    assert regresion['n'] == pareados.sum()
+    assert regresion['pendiente'] == pytest.approx(esperado.slope, rel=1e-10)
+    assert regresion['intercepto'] == pytest.approx(esperado.intercept, rel=1e-10)
+    assert regresion['r'] == pytest.approx(esperado.rvalue, rel=1e-10)
+    assert regresion['error_estandar'] == pytest.approx(esperado.stderr, rel=1e-8)
+
+    diferencia = X[pareados, 0] - X[pareados, 1]
+    assert resultado['diferencia']['media'] == pytest.approx(diferencia.mean(), rel=1e-12)
+    assert resultado['diferencia']['rmse'] == pytest.approx(np.sqrt(np.mean(diferencia ** 2)), rel=1e-12)
+
+
+def test_kernel_qc_apilado_igual_a_cada_estacion(rng):
+    estaciones = np.stack([_matriz(rng, 1000) for _ in range(3)])
+    apilado = kernel_qc(estaciones)
+    for k, X in enumerate(estaciones):
+        sola = kernel_qc(X)
+        for clave in ('media', 'desviacion', 'q1', 'q3', 'correlacion'):
+            np.testing.assert_allclose(apilado[clave][k], sola[clave], rtol=1e-12)
+        assert apilado['regresion']['pendiente'][k] == pytest.approx(sola['regresion']['pendiente'], rel=1e-12)
+
+
+def test_kernel_qc_igual_a_acumuladores(rng):
+    X = _matriz(rng)
+    resultado = kernel_qc(X)
+    for i in range(X.shape[1]):
+        acumulador = AcumuladorSensor()
+        for bloque in np.array_split(X[:, i], 4):
+            acumulador.actualizar_lote(bloque)
+        assert acumulador.media == pytest.approx(resultado['media'][i], rel=1e-12)
+        assert acumulador.desviacion == pytest.approx(resultado['desviacion'][i], rel=1e-10)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from pleamares import extremos, IndiceEventos, PLEAMAR, BAJAMAR
+
+PERIODO = 12.42
+ORIGEN = np.datetime64('2024-01-01T00:00', 'ns')
+
+
+def _marea(n_horas, paso_min=60, fase=0.3):
+    minutos = np.arange(0, n_horas * 60, paso_min)
+    horas = minutos / 60
+    return ORIGEN + minutos.astype('timedelta64[m]'), 2.0 + np.cos(2 * np.pi * horas / PERIODO - fase)
+
+
+def test_extremos_refina_hora_y_altura():
+    fechas, valores = _marea(24 * 10)
+    tiempos, alturas, tipos = extremos(fechas, valores)
+    # Máximos en 2πh/T - fase = 2πk; mínimos en medio periodo después
+    horas = (tiempos - ORIGEN) / np.timedelta64(1, 'h')
+    fase = 2 * np.pi * horas / PERIODO - 0.3
+    esperado = np.where(tipos == PLEAMAR, 0.0, np.pi)
+    desfase = np.angle(np.exp(1j * (fase - esperado)))
+    # Con muestras horarias la parábola ubica el evento a pocos minutos
+    assert np.abs(desfase * PERIODO / (2 * np.pi) * 60).max() < 5
+    np.testing.assert_allclose(alturas, np.where(tipos == PLEAMAR, 3.0, 1.0), atol=0.01)
+    assert abs(len(tiempos) - 2 * 24 * 10 / PERIODO) <= 1
+
+
+def test_extremos_alternan_y_estan_ordenados():
+    fechas, valores = _marea(24 * 30)
+    ruido = np.random.default_rng(0).normal(0, 0.02, len(valores))
+    tiempos, _, tipos = extremos(fechas, valores + ruido, ventana=3, amplitud_minima=0.1)
+    assert (np.diff(tiempos.astype(np.int64)) > 0).all()
+    assert (tipos[1:] != tipos[:-1]).all()
+    assert set(tipos) == {PLEAMAR, BAJAMAR}
+
+
+def test_amplitud_minima_descarta_oscilaciones():
+    fechas, valores = _marea(24 * 5, paso_min=10)
+    # Una oscilación pequeña en la vaciante agrega un máximo y un mínimo espurios
+    horas = (fechas - ORIGEN) / np.timedelta64(1, 'h')
+    valores = valores + 0.03 * np.sin(2 * np.pi * horas / 0.8) * ((horas > 30) & (horas < 32))
+    con_ruido = extremos(fechas, valores)
+    limpios = extremos(fechas, valores, amplitud_minima=0.2)
+    sin_oscilacion = extremos(*_marea(24 * 5, paso_min=10))
+    assert len(con_ruido[0]) > len(limpios[0])
+    assert len(limpios[0]) == len(sin_oscilacion[0])
+    np.testing.assert_array_equal(limpios[2], sin_oscilacion[2])
+
+
+def test_no_busca_extremos_sobre_huecos():
+    fechas, valores = _marea(48)
+    tiempos, _, _ = extremos(fechas, valores)
+    pleamar = tiempos[0]
+    i = np.searchsorted(fechas, pleamar)
+    huecos = valores.copy()
+    huecos[i - 1:i + 1] = np.nan
+    sin_muestras = extremos(fechas, huecos)[0]
+    assert pleamar not in sin_muestras
+    # Un salto en el tiempo (fila faltante) tampoco se toma como extremo
+    salto = np.delete(np.arange(len(fechas)), i)
+    assert not np.any(np.abs(extremos(fechas[salto], valores[salto])[0] - pleamar) < np.timedelta64(1, 'h'))
+
+
+def test_serie_corta_o_vacia():
+    for n in (0, 1, 2):
+        tiempos, alturas, tipos = extremos(ORIGEN + np.arange(n).astype('timedelta64[h]'), np.ones(n))
+        assert len(tiempos) == len(alturas) == len(tipos) == 0
+
+
+def test_indice_siguientes_y_rango():
+    fechas, valores = _marea(24 * 10)
+    tiempos, alturas, tipos = extremos(fechas, valores)
+    indice = IndiceEventos.desde_serie(fechas, valores)
+    desde = fechas[50]
+    t, _, tp = indice.siguientes(desde, 3, tipo=PLEAMAR)
+    esperado = tiempos[(tiempos >= desde) & (tipos == PLEAMAR)][:3]
+    np.testing.assert_array_equal(t, esperado)
+    assert (tp == PLEAMAR).all()
+    t, a, _ = indice.rango(fechas[10], fechas[100])
+    dentro = (tiempos >= fechas[10]) & (tiempos <= fechas[100])
+    np.testing.assert_array_equal(t, tiempos[dentro])
+    np.testing.assert_allclose(a, alturas[dentro], rtol=1e-6)
+    assert indice.cubre(fechas[0], fechas[-1]) and not indice.cubre(fechas[0], fechas[-1] + np.timedelta64(1, 'h'))
+
+
+@pytest.mark.parametrize('paso_min', [10, 60])
+def test_extremos_no_dependen_del_origen(paso_min):
+    # Desplazar la serie en el tiempo desplaza los eventos en la misma cantidad
+    fechas, valores = _marea(24 * 3, paso_min=paso_min)
+    desplazamiento = np.timedelta64(7, 'D')
+    a = extremos(fechas, valores)
+    b = extremos(fechas + desplazamiento, valores)
+    np.testing.assert_array_equal(a[0] + desplazamiento, b[0])
+    np.testing.assert_array_equal(a[1], b[1])
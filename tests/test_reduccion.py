@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from reduccion import indices_lttb, indices_minmax, reducir_serie, _bordes
+
+
+def _serie(rng, n=10000):
+    y = np.cumsum(rng.normal(0, 1, n))
+    y[rng.random(n) < 0.01] = np.nan
+    y[3000:3500] = np.nan
+    return y
+
+
+def _minmax_ingenuo(y, n_buckets):
+    bordes = _bordes(len(y), n_buckets)
+    indices = {0, len(y) - 1}
+    for a, b in zip(bordes[:-1], bordes[1:]):
+        tramo = y[a:b]
+        if np.isnan(tramo).all():
+            continue
+        indices.update([a + int(np.nanargmax(tramo)), a + int(np.nanargmin(tramo))])
+    return np.array(sorted(indices))
+
+
+def _lttb_ingenuo(y, n_puntos):
+    """LTTB punto a punto, con los mismos buckets que indices_lttb"""
+    n = len(y)
+    x = np.arange(n, dtype=np.float64)
+    y = np.where(np.isnan(y), np.nanmean(y), y)
+    bordes = 1 + _bordes(n - 2, n_puntos - 2)
+    seleccion, anterior = [0], 0
+    for i in range(n_puntos - 2):
+        a, b = bordes[i], bordes[i + 1]
+        d = bordes[i + 2] if i + 2 < len(bordes) else n
+        x_sig, y_sig = x[b:d].mean(), y[b:d].mean()
+        mejor, mejor_area = a, -1.0
+        for k in range(a, b):
+            area = abs((x[anterior] - x_sig) * (y[k] - y[anterior]) - (x[anterior] - x[k]) * (y_sig - y[anterior]))
+            if area > mejor_area:
+                mejor, mejor_area = k, area
+        seleccion.append(mejor)
+        anterior = mejor
+    return np.array(seleccion + [n - 1])
+
+
+@pytest.mark.parametrize('n_buckets', [1, 7, 500, 2000])
+def test_minmax_igual_a_recorrido_ingenuo(rng, n_buckets):
+    y = _serie(rng)
+    np.testing.assert_array_equal(indices_minmax(y, n_buckets), _minmax_ingenuo(y, n_buckets))
+
+
+def test_minmax_conserva_envolvente(rng):
+    y = _serie(rng)
+    indices = indices_minmax(y, 100)
+    assert len(indices) <= 2 * 100 + 2
+    assert indices[0] == 0 and indices[-1] == len(y) - 1
+    assert (np.diff(indices) > 0).all()
+    assert np.nanmax(y[indices]) == np.nanmax(y) and np.nanmin(y[indices]) == np.nanmin(y)
+
+
+@pytest.mark.parametrize('n_puntos', [3, 10, 257])
+def test_lttb_igual_a_recorrido_ingenuo(rng, n_puntos):
+    y = _serie(rng, 3000)
+    np.testing.assert_array_equal(indices_lttb(y, n_puntos), _lttb_ingenuo(y, n_puntos))
+
+
+def test_lttb_largo_y_orden(rng):
+    y = _serie(rng)
+    indices = indices_lttb(y, 500)
+    assert len(indices) == 500
+    assert indices[0] == 0 and indices[-1] == len(y) - 1
+    assert (np.diff(indices) > 0).all()
+
+
+def test_reducir_serie(rng):
+    y = _serie(rng)
+    x = np.arange(len(y))
+    assert reducir_serie(x, y, None)[1] is y
+    assert reducir_serie(x, y, len(y))[1] is y
+    xs, ys = reducir_serie(x, y, 1000, 'lttb')
+    assert len(xs) == 1000
+    np.testing.assert_array_equal(ys, y[xs])
+    xs, ys = reducir_serie(x, y, 1000)
+    assert len(xs) <= 1000
+    with pytest.raises(ValueError):
+        reducir_serie(x, y, 1000, 'mediana')
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from verificacion import Verificacion
+from conftest import serie_marea
+
+ORIGEN = np.datetime64('2024-03-01T00:00', 'ns')
+SESGO = np.array([0.05, -0.02])
+
+
+def _pronostico(dias=20):
+    horas = np.arange(24 * dias)
+    fechas = ORIGEN + horas.astype('timedelta64[h]')
+    keller = serie_marea(horas)
+    return fechas, np.column_stack([keller, keller + 0.01])
+
+
+def _observaciones(rng, desde_h=24, hasta_h=24 * 18, paso_min=10, retraso_min=0):
+    """Observaciones cada paso_min minutos: la marea del pronóstico retrasada, menos SESGO, con ruido"""
+    # Desfasadas 5 minutos: ninguna queda a igual distancia de dos horas del pronóstico
+    minutos = np.arange(desde_h * 60 + 5, hasta_h * 60, paso_min)
+    fechas = ORIGEN + minutos.astype('timedelta64[m]')
+    keller = serie_marea((minutos - retraso_min) / 60)
+    valores = np.column_stack([keller, keller + 0.01]) - SESGO + rng.normal(0, 0.005, (len(minutos), 2))
+    valores[rng.random(valores.shape) < 0.05] = np.nan
+    return fechas, valores
+
+
+def _errores_esperados(fechas, valores, pronostico):
+    """Error contra la hora de pronóstico más cercana (todas dentro de los 30 minutos)"""
+    fechas_pronostico, valores_pronostico = pronostico
+    hora = np.round((fechas - fechas_pronostico[0]) / np.timedelta64(1, 'h')).astype(np.intp)
+    return valores_pronostico[hora] - valores
+
+
+def test_sesgo_rmse_y_mae(rng):
+    pronostico = _pronostico()
+    fechas, valores = _observaciones(rng)
+    verificacion = Verificacion()
+    verificacion.fijar_pronostico(*pronostico)
+    verificacion.agregar_observaciones(fechas, valores)
+    errores = _errores_esperados(fechas, valores, pronostico)
+    metricas = verificacion.metricas()
+    for s, sensor in enumerate(('keller', 'vega')):
+        e = errores[:, s][~np.isnan(errores[:, s])]
+        assert metricas[sensor]['n'][0] == len(e)
+        # El pronóstico está en float32
+        assert metricas[sensor]['sesgo'][0] == pytest.approx(e.mean(), abs=1e-6)
+        assert metricas[sensor]['rmse'][0] == pytest.approx(np.sqrt(np.mean(e ** 2)), abs=1e-6)
+        assert metricas[sensor]['mae'][0] == pytest.approx(np.abs(e).mean(), abs=1e-6)
+        assert metricas[sensor]['sesgo'][0] == pytest.approx(SESGO[s], abs=0.01)
+
+
+def test_fuera_de_tolerancia_no_se_compara(rng):
+    pronostico = _pronostico(dias=5)
+    # Observaciones que siguen 3 días después del fin del pronóstico
+    fechas, valores = _observaciones(rng, desde_h=24, hasta_h=24 * 8, paso_min=60)
+    verificacion = Verificacion()
+    verificacion.fijar_pronostico(*pronostico)
+    verificacion.agregar_observaciones(fechas, valores)
+    cubiertas = fechas <= pronostico[0][-1] + np.timedelta64(30, 'm')
+    assert verificacion.metricas()['keller']['n'][0] == (~np.isnan(valores[cubiertas, 0])).sum()
+    assert verificacion.dias.max() == pronostico[0][-1].astype('datetime64[D]').astype(np.int64)
+
+
+def test_errores_de_hora_de_pleamares(rng):
+    verificacion = Verificacion()
+    verificacion.fijar_pronostico(*_pronostico())
+    verificacion.agregar_observaciones(*_observaciones(rng, retraso_min=20))
+    metricas = verificacion.metricas()
+    for tipo in ('pleamar', 'bajamar'):
+        assert metricas[tipo]['n'][0] > 20
+        # Lo observado ocurre 20 minutos después de lo pronosticado
+        assert metricas[tipo]['error_hora_min'][0] == pytest.approx(-20, abs=4)
+    assert metricas['pleamar']['error_altura'][0] == pytest.approx(SESGO[0], abs=0.02)
+
+
+@pytest.mark.parametrize('cortes', [[100], [7, 500, 501, 1500]])
+def test_incremental_igual_a_una_pasada(rng, cortes, tmp_path):
+    pronostico = _pronostico()
+    fechas, valores = _observaciones(rng, retraso_min=15)
+    completa = Verificacion()
+    completa.fijar_pronostico(*pronostico)
+    completa.agregar_observaciones(fechas, valores)
+
+    ruta = str(tmp_path / 'verificacion.npz')
+    Verificacion().guardar(ruta)
+    for f, v in zip(np.split(fechas, cortes), np.split(valores, cortes)):
+        # Cada bloque en una ejecución distinta, como la etapa del pipeline
+        partes = Verificacion.cargar(ruta)
+        partes.fijar_pronostico(*pronostico)
+        partes.agregar_observaciones(f, v)
+        partes.guardar(ruta)
+    partes = Verificacion.cargar(ruta)
+
+    np.testing.assert_array_equal(partes.dias, completa.dias)
+    np.testing.assert_allclose(partes.errores, completa.errores, rtol=1e-9)
+    np.testing.assert_allclose(partes.eventos, completa.eventos, rtol=1e-9, atol=1e-9)
+
+
+def test_metricas_por_ventana(rng):
+    pronostico = _pronostico()
+    fechas, valores = _observaciones(rng)
+    verificacion = Verificacion()
+    verificacion.fijar_pronostico(*pronostico)
+    verificacion.agregar_observaciones(fechas, valores)
+    errores = _errores_esperados(fechas, valores, pronostico)[:, 0]
+    dias = fechas.astype('datetime64[D]').astype(np.int64)
+    movil = verificacion.metricas(ventana=3)['keller']
+    for k, dia in enumerate(verificacion.dias):
+        e = errores[(dias > dia - 3) & (dias <= dia) & ~np.isnan(errores)]
+        assert movil['n'][k] == len(e)
+        assert movil['rmse'][k] == pytest.approx(np.sqrt(np.mean(e ** 2)), abs=1e-6)
@@ -0,0 +1,249 @@
+import json
+import os
+import numpy as np
+from ingesta import LectorIncremental
+from pleamares import extremos, PLEAMAR, NOMBRES_TIPO
+
+# Sensores verificados, cada uno contra el pronóstico de sus propias constantes
+SENSORES_VERIFICADOS = ['keller', 'vega']
+TIPOS = [PLEAMAR, -PLEAMAR]
+
+# Una observación se compara con el paso del pronóstico más cercano dentro
+# de TOLERANCIA; una pleamar/bajamar observada, con la pronosticada del
+# mismo tipo más cercana dentro de TOLERANCIA_EVENTOS
+TOLERANCIA = np.timedelta64(30, 'm')
+TOLERANCIA_EVENTOS = np.timedelta64(3, 'h')
+
+# Los eventos observados se buscan sobre la cola guardada más los datos
+# nuevos; los de las últimas MARGEN_EVENTOS horas esperan a la próxima
+# actualización porque su vecindad aún no está completa
+CONTEXTO_EVENTOS = np.timedelta64(48, 'h')
+MARGEN_EVENTOS = np.timedelta64(12, 'h')
+# Mismas opciones que el índice de pleamares observadas de la API
+OPCIONES_OBSERVADO = {'ventana': 3, 'amplitud_minima': 0.1}
+
+# Sumas diarias: errores[día, sensor] = (n, Σe, Σe², Σ|e|) con e = pronóstico - observación;
+# eventos[día, tipo] = (n, Σdt, Σdt², Σdh, Σdh²) con dt en minutos y dh en metros
+CAMPOS_ERRORES = 4
+CAMPOS_EVENTOS = 5
+
+
+def _sumas_por_dia(dias, valores):
+    """Suma las filas de valores (n x ...) por día con buckets enteros"""
+    claves, grupo = np.unique(dias, return_inverse=True)
+    sumas = np.zeros((len(claves),) + valores.shape[1:])
+    np.add.at(sumas, grupo, valores)
+    return claves, sumas
+
+
+class Verificacion:
+    """
+    Verificación del pronóstico contra las observaciones que llegan después
+    de emitirlo. Guarda el último pronóstico emitido (fijar_pronostico) y
+    compara con él cada observación nueva (agregar_observaciones): sesgo,
+    RMSE y MAE por sensor, y errores de hora y altura de pleamares y
+    bajamares. Todo se acumula en sumas diarias, de las que salen las
+    métricas globales y por ventanas móviles (metricas).
+    """
+
+    def __init__(self):
+        self.dias = np.empty(0, dtype=np.int64)
+        self.errores = np.empty((0, len(SENSORES_VERIFICADOS), CAMPOS_ERRORES))
+        self.eventos = np.empty((0, len(TIPOS), CAMPOS_EVENTOS))
+        self.pronostico = (np.empty(0, dtype='datetime64[ns]'),
+                           np.empty((0, len(SENSORES_VERIFICADOS)), dtype=np.float32))
+        self.estado = {'lector': None, 'cola': [[], []], 'ultimo_evento': None}
+        self._eventos_pronostico = None
+
+    def fijar_pronostico(self, fechas, valores):
+        """Pronóstico emitido (fechas, valores n x sensores) para las próximas observaciones"""
+        orden = np.argsort(fechas, kind='stable')
+        self.pronostico = (np.asarray(fechas, dtype='datetime64[ns]')[orden],
+                           np.asarray(valores, dtype=np.float32)[orden])
+        self._eventos_pronostico = None
+
+    def _sumar(self, dias, errores=None, eventos=None):
+        todos = np.union1d(self.dias, dias)
+        previos, nuevos = np.searchsorted(todos, self.dias), np.searchsorted(todos, dias)
+        for nombre, sumas in (('errores', errores), ('eventos', eventos)):
+            actual = getattr(self, nombre)
+            total = np.zeros((len(todos),) + actual.shape[1:])
+            total[previos] = actual
+            if sumas is not None:
+                total[nuevos] += sumas
+            setattr(self, nombre, total)
+        self.dias = todos
+
+    def agregar_observaciones(self, fechas, valores):
+        """Compara observaciones nuevas (fechas, valores n x sensores) con el pronóstico fijado"""
+        import pandas as pd
+        fechas = np.asarray(fechas, dtype='datetime64[ns]')
+        valores = np.asarray(valores, dtype=np.float64)
+        if len(fechas) == 0:
+            return
+        orden = np.argsort(fechas, kind='stable')
+        fechas, valores = fechas[orden], valores[orden]
+
+        # Cada observación con el paso del pronóstico más cercano
+        fechas_pronostico, valores_pronostico = self.pronostico
+        unidos = pd.merge_asof(
+            pd.DataFrame({'fecha': fechas}),
+            pd.DataFrame({'fecha': fechas_pronostico, 'fila': np.arange(len(fechas_pronostico))}),
+            on='fecha', direction='nearest', tolerance=pd.Timedelta(TOLERANCIA))
+        filas = unidos['fila'].to_numpy()
+        emparejadas = ~np.isnan(filas)
+        pronostico = np.full(valores.shape, np.nan)
+        pronostico[emparejadas] = valores_pronostico[filas[emparejadas].astype(np.intp)]
+
+        e = pronostico - valores
+        validos = ~np.isnan(e)
+        e = np.where(validos, e, 0.0)
+        errores = np.stack([validos, e, e ** 2, np.abs(e)], axis=-1).astype(np.float64)
+        # Sólo cuentan los días con alguna observación comparada
+        con_pronostico = validos.any(axis=1)
+        if con_pronostico.any():
+            dias = fechas[con_pronostico].astype('datetime64[D]').astype(np.int64)
+            self._sumar(*_sumas_por_dia(dias, errores[con_pronostico]))
+        self._verificar_eventos(fechas, valores[:, 0])
+
+    def _verificar_eventos(self, fechas, keller):
+        import pandas as pd
+        cola_fechas, cola_keller = self.estado['cola']
+        serie_fechas = np.concatenate([np.array(cola_fechas, dtype=np.int64).astype('datetime64[ns]'), fechas])
+        serie_keller = np.concatenate([np.array(cola_keller, dtype=np.float64), keller])
+        limite = serie_fechas[-1] - MARGEN_EVENTOS
+        guardar = serie_fechas > serie_fechas[-1] - CONTEXTO_EVENTOS
+        self.estado['cola'] = [serie_fechas[guardar].astype(np.int64).tolist(), serie_keller[guardar].tolist()]
+
+        tiempos, alturas, tipos = extremos(serie_fechas, serie_keller, **OPCIONES_OBSERVADO)
+        nuevos = tiempos <= limite
+        if self.estado['ultimo_evento'] is not None:
+            nuevos &= tiempos > np.datetime64(self.estado['ultimo_evento'], 'ns')
+        if not nuevos.any():
+            return
+        tiempos, alturas, tipos = tiempos[nuevos], alturas[nuevos], tipos[nuevos]
+        self.estado['ultimo_evento'] = int(tiempos[-1].astype(np.int64))
+
+        if self._eventos_pronostico is None:
+            fechas_pronostico, valores_pronostico = self.pronostico
+            self._eventos_pronostico = extremos(fechas_pronostico, valores_pronostico[:, 0].astype(np.float64))
+        t_pronostico, h_pronostico, tipos_pronostico = self._eventos_pronostico
+        unidos = pd.merge_asof(
+            pd.DataFrame({'fecha': tiempos, 'tipo': tipos, 'altura': alturas}),
+            pd.DataFrame({'fecha': t_pronostico, 'tipo': tipos_pronostico,
+                          'fecha_pronostico': t_pronostico, 'altura_pronostico': h_pronostico}),
+            on='fecha', by='tipo', direction='nearest', tolerance=pd.Timedelta(TOLERANCIA_EVENTOS))
+        unidos = unidos.dropna(subset=['fecha_pronostico'])
+        if unidos.empty:
+            return
+
+        dt = (unidos['fecha_pronostico'] - unidos['fecha']).dt.total_seconds().to_numpy() / 60
+        dh = (unidos['altura_pronostico'] - unidos['altura']).to_numpy()
+        tipo = (unidos['tipo'].to_numpy() != PLEAMAR).astype(np.intp)
+        eventos = np.zeros((len(unidos), len(TIPOS), CAMPOS_EVENTOS))
+        eventos[np.arange(len(unidos)), tipo] = np.column_stack([np.ones(len(dt)), dt, dt ** 2, dh, dh ** 2])
+        dias = unidos['fecha'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        claves, sumas = _sumas_por_dia(dias, eventos)
+        self._sumar(claves, eventos=sumas)
+
+    def _sumas_ventana(self, ventana):
+        """Sumas de los ventana días que terminan en cada día con datos (sumas acumuladas)"""
+        if ventana is None:
+            return self.errores.sum(axis=0)[None], self.eventos.sum(axis=0)[None]
+        inicios = np.searchsorted(self.dias, self.dias - ventana + 1, side='left')
+        resultado = []
+        for sumas in (self.errores, self.eventos):
+            acumuladas = np.concatenate([np.zeros((1,) + sumas.shape[1:]), np.cumsum(sumas, axis=0)])
+            resultado.append(acumuladas[1:] - acumuladas[inicios])
+        return resultado
+
+    def metricas(self, ventana=None):
+        """
+        Sin ventana, métricas globales. Con ventana (días), una serie por
+        día con las métricas de los ventana días que terminan en él.
+        Retorna {sensor o tipo de evento: {métrica: array}}
+        """
+        errores, eventos = self._sumas_ventana(ventana)
+        resultado = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for s, sensor in enumerate(SENSORES_VERIFICADOS):
+                n, suma, suma2, suma_abs = np.moveaxis(errores[:, s], -1, 0)
+                sesgo, rmse = suma / n, np.sqrt(suma2 / n)
+                resultado[sensor] = {'n': n, 'sesgo': sesgo, 'rmse': rmse, 'mae': suma_abs / n,
+                                     'desviacion': np.sqrt(np.maximum(rmse ** 2 - sesgo ** 2, 0))}
+            for t, tipo in enumerate(TIPOS):
+                n, dt, dt2, dh, dh2 = np.moveaxis(eventos[:, t], -1, 0)
+                resultado[NOMBRES_TIPO[tipo]] = {'n': n, 'error_hora_min': dt / n, 'rmse_hora_min': np.sqrt(dt2 / n),
+                                                 'error_altura': dh / n, 'rmse_altura': np.sqrt(dh2 / n)}
+        return resultado
+
+    def guardar(self, ruta):
+        """Sumas diarias, pronóstico vigente y estado incremental en un .npz, de forma atómica"""
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        with open(ruta + '.tmp', 'wb') as f:
+            np.savez(f, dias=self.dias.astype(np.int32), errores=self.errores, eventos=self.eventos,
+                     pronostico_fechas=self.pronostico[0], pronostico_valores=self.pronostico[1],
+                     estado=np.array(json.dumps(self.estado)))
+        os.replace(ruta + '.tmp', ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        """Lee un .npz escrito por guardar (None si no existe o no se puede leer)"""
+        try:
+            with np.load(ruta) as datos:
+                verificacion = cls()
+                verificacion.dias = datos['dias'].astype(np.int64)
+                verificacion.errores = datos['errores']
+                verificacion.eventos = datos['eventos']
+                verificacion.pronostico = (datos['pronostico_fechas'], datos['pronostico_valores'])
+                verificacion.estado = json.loads(str(datos['estado']))
+            return verificacion
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def _pronostico_emitido(ruta_constantes, ruta_csv):
+    """(fechas, valores n x sensores) del pronóstico vigente, o None si no hay"""
+    from cache_pronostico import CachePronostico, PronosticoArmonico
+    if os.path.exists(ruta_constantes):
+        series = [PronosticoArmonico(ruta_constantes, serie=s).obtener() for s in SENSORES_VERIFICADOS]
+        return series[0][0], np.column_stack([valores for _, valores in series])
+    if os.path.exists(ruta_csv):
+        # El CSV sólo trae el pronóstico de keller
+        fechas, valores = CachePronostico(ruta_csv).obtener()
+        return fechas, np.column_stack([valores] + [np.full(len(valores), np.nan)] * (len(SENSORES_VERIFICADOS) - 1))
+    return None
+
+
+def actualizar_verificacion(archivo='valpoall.txt', ruta_constantes='resultados/constantes_armonicas.json',
+                            ruta_csv='resultados/pronostico_keller_futuro.csv',
+                            ruta='datos_procesados/verificacion.npz'):
+    """
+    Verifica las líneas agregadas al archivo desde la última ejecución con
+    el pronóstico guardado entonces, y guarda el pronóstico vigente para
+    verificar las siguientes. Así sólo se compara con observaciones
+    posteriores a la emisión: la primera ejecución no verifica nada.
+    Retorna (Verificacion, observaciones nuevas)
+    """
+    verificacion = Verificacion.cargar(ruta) or Verificacion()
+    lector = LectorIncremental(archivo, verificacion.estado['lector'])
+    bloques = lector.bloques()
+    if lector.reiniciado:
+        # El archivo fue reemplazado: se descartan las sumas pero no el pronóstico emitido
+        pronostico = verificacion.pronostico
+        verificacion = Verificacion()
+        verificacion.fijar_pronostico(*pronostico)
+
+    filas_nuevas = 0
+    for bloque in bloques:
+        validas = ~bloque['fecha_invalida']
+        verificacion.agregar_observaciones(bloque['fecha'][validas],
+                                           np.column_stack([bloque[s][validas] for s in SENSORES_VERIFICADOS]))
+        filas_nuevas += int(validas.sum())
+
+    emitido = _pronostico_emitido(ruta_constantes, ruta_csv)
+    if emitido is not None:
+        verificacion.fijar_pronostico(*emitido)
+    verificacion.estado['lector'] = lector.estado
+    verificacion.guardar(ruta)
+    return verificacion, filas_nuevas